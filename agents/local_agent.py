@@ -6,6 +6,7 @@ import logging
 import os
 import uuid
 import time
+import threading
 from typing import Dict
 
 from chirpy.response_generators.launch.launch_response_generator import LaunchResponseGenerator
@@ -45,6 +46,7 @@ import chirpy.core.flags as flags
 from chirpy.core.latency import log_events_to_dynamodb, measure, clear_events
 from chirpy.core.regex.templates import StopTemplate
 from chirpy.core.handler import Handler
+from chirpy.core.state_delta import DeltaStateStore
 from chirpy.core.logging_utils import setup_logger, update_logger, PROD_LOGGER_SETTINGS
 
 # Timeout at the highest level, as close as possible to 10 seconds. Do nothing after, just create an apologetic
@@ -70,9 +72,15 @@ apology_string = 'Sorry, I\'m having a really hard time right now. ' + \
 'I have to go, but I hope you enjoyed our conversation so far. ' + \
 'Have a good day!'
 
-state_store = {}
+# Each session's states are stored as deltas against its previous state (see chirpy.core.state_delta)
+state_store = DeltaStateStore()
 user_store = defaultdict(dict)
 
+# Dictionary from agent class to its Handler. Handlers keep no per-turn state, so all the agents of a class (and all
+# their turns) share one, rather than rebuilding it for every utterance.
+handlers = {}
+handlers_lock = threading.Lock()
+
 class StateTable:
     def __init__(self):
         self.table_name = 'StateTable'
@@ -106,8 +114,7 @@ class StateTable:
         try:
             assert 'session_id' in state
             assert 'creation_date_time' in state
-            global state_store
-            state_store[(state['session_id'], state['creation_date_time'])] = state
+            state_store.put((state['session_id'], state['creation_date_time']), state['session_id'], state)
             return True
         except:
             logger.error("Exception when persisting state to table" + self.table_name, exc_info=True)
@@ -222,10 +229,17 @@ class LocalAgent():
             annotator_timeout = NLP_PIPELINE_TIMEOUT
         )
 
+    def get_handler(self):
+        """Returns the Handler shared by all agents of this class, creating it (with create_handler) on first use"""
+        with handlers_lock:
+            if type(self) not in handlers:
+                handlers[type(self)] = self.create_handler()
+            return handlers[type(self)]
+
     def process_utterance(self, user_utterance):
 
-        # create handler (pass in RGs + annotators)
-        handler = self.create_handler()
+        # get handler (pass in RGs + annotators)
+        handler = self.get_handler()
 
         current_state = self.get_state_attributes(user_utterance)
         user_attributes = self.get_user_attributes()
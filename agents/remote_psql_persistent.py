@@ -8,21 +8,12 @@ import json
 from chirpy.core.logging_utils import setup_logger, PROD_LOGGER_SETTINGS
 
 from agents.remote_non_persistent import RemoteNonPersistentAgent
-import psycopg2
+from chirpy.core.postgres import PostgresPool
 import psycopg2.extras
 
-def db_connect():
-    return psycopg2.connect(dbname="session_store", user=os.environ['POSTGRES_USER'], password=os.environ["POSTGRES_PASSWORD"], host=os.environ["POSTGRES_HOST"])
-
-conn=db_connect()
-def get_db_cursor():
-    global conn
-    try:
-        curs = conn.cursor()
-    except psycopg2.InterfaceError:
-        conn = db_connect()
-        curs = conn.cursor()
-    return curs
+SESSION_STORE_POOL = PostgresPool(dbname="session_store", user=os.environ['POSTGRES_USER'],
+                                  password=os.environ["POSTGRES_PASSWORD"], host=os.environ["POSTGRES_HOST"],
+                                  timeout=1.0)
 
 logger = logging.getLogger('chirpylogger')
 root_logger = logging.getLogger()
@@ -43,10 +34,9 @@ class StateTable:
             start_time = time.time()
             timeout = 2  # second
             while (item is None and time.time() < start_time + timeout):
-                with get_db_cursor() as curs:
-                    curs.execute(f"SELECT state from {self.table_name} where session_id=%(session_id)s AND creation_date_time=%(creation_date_time)s",
-                                 {'session_id':session_id, 'creation_date_time': creation_date_time})
-                    fetched_entry = curs.fetchone()
+                fetched_entry = SESSION_STORE_POOL.fetchone(
+                    f"SELECT state from {self.table_name} where session_id=%(session_id)s AND creation_date_time=%(creation_date_time)s",
+                    {'session_id':session_id, 'creation_date_time': creation_date_time})
                 if fetched_entry is None or len(fetched_entry) == 0:
                     item = None
                     continue
@@ -71,12 +61,11 @@ class StateTable:
             assert 'session_id' in state
             assert 'creation_date_time' in state
             assert 'user_id' in state
-            with get_db_cursor() as curs:
-                curs.execute(
-                    f"INSERT INTO {self.table_name} (creation_date_time, session_id, user_id, state) VALUES  "
-                    f"(%(creation_date_time)s, %(session_id)s, %(user_id)s, %(state)s)",
-                    {'session_id': decoded_state['session_id'], 'creation_date_time': decoded_state['creation_date_time'],
-                     'user_id': decoded_state['user_id'], 'state': psycopg2.extras.Json(decoded_state)})
+            SESSION_STORE_POOL.execute(
+                f"INSERT INTO {self.table_name} (creation_date_time, session_id, user_id, state) VALUES  "
+                f"(%(creation_date_time)s, %(session_id)s, %(user_id)s, %(state)s)",
+                {'session_id': decoded_state['session_id'], 'creation_date_time': decoded_state['creation_date_time'],
+                 'user_id': decoded_state['user_id'], 'state': psycopg2.extras.Json(decoded_state)})
 
             return True
         except:
@@ -98,15 +87,13 @@ class UserTable():
             start_time = time.time()
             timeout = 2  # second
             while (item is None and time.time() < start_time + timeout):
-                with get_db_cursor() as curs:
-                    curs.execute(f"SELECT attributes from {self.table_name} where user_id=%(user_id)s",
-                                 {'user_id':user_id})
-                    row = curs.fetchone()
-                    if row:
-                        item = row[0]
-                        item = {k: json.dumps(v) for k,v in item.items()}
-                    else:
-                        item = {}
+                row = SESSION_STORE_POOL.fetchone(f"SELECT attributes from {self.table_name} where user_id=%(user_id)s",
+                                                  {'user_id':user_id})
+                if row:
+                    item = row[0]
+                    item = {k: json.dumps(v) for k,v in item.items()}
+                else:
+                    item = {}
             if item is None:
                 logger.error(
                     f"Timed out when fetching user attributes\nfor user_id {user_id} from table {self.table_name}.")
@@ -129,11 +116,10 @@ class UserTable():
             	user_attributes['name'] = json.dumps(decoded_name)
             decoded_attributes = {k: json.loads(v) for k, v in user_attributes.items()}
 
-            with get_db_cursor() as curs:
-                return curs.execute(
-                    f"INSERT INTO {self.table_name} (user_id, attributes) VALUES  "
-                    f"(%(user_id)s, %(attributes)s) ON CONFLICT (user_id) DO UPDATE SET attributes=%(attributes)s",
-                    {'user_id': decoded_attributes['user_id'], 'attributes': psycopg2.extras.Json(decoded_attributes)})
+            SESSION_STORE_POOL.execute(
+                f"INSERT INTO {self.table_name} (user_id, attributes) VALUES  "
+                f"(%(user_id)s, %(attributes)s) ON CONFLICT (user_id) DO UPDATE SET attributes=%(attributes)s",
+                {'user_id': decoded_attributes['user_id'], 'attributes': psycopg2.extras.Json(decoded_attributes)})
         except:
             logger.error("Exception when persisting state to table: " + self.table_name, exc_info=True)
             raise
@@ -146,7 +132,7 @@ class RemotePersistentAgent(RemoteNonPersistentAgent):
 
     def process_utterance(self, user_utterance):
 
-        handler = self.create_handler()
+        handler = self.get_handler()
         current_state = self.get_state_attributes(user_utterance)
         user_attributes = self.get_user_attributes()
         last_state = self.get_last_state()
@@ -161,5 +147,4 @@ class RemotePersistentAgent(RemoteNonPersistentAgent):
         except:
             logger.error("Error persisting state")
 
-        conn.commit()
         return response, current_state
@@ -1,18 +1,38 @@
 import logging
+import os
+import zlib
 from concurrent import futures
-from collections import OrderedDict
 from typing import List, Optional
 import random
 import json
 
 from chirpy.core.callables import Annotator
+from chirpy.core.response_cache import ResponseCache, SqliteResponseStore, make_cache_key
 from chirpy.core.state_manager import StateManager
 from chirpy.core.latency import measure
 
-CACHE = OrderedDict()
+logger = logging.getLogger('chirpylogger')
+
 MAX_CACHE_SIZE = 1024
+CACHE_TTL = 24 * 60 * 60  # seconds
 
-logger = logging.getLogger('chirpylogger')
+# If set, BlenderBot's responses are also cached in a SQLite database at this path, which is shared by all the
+# processes on the machine and survives restarts (put it under /dev/shm to keep it in shared memory)
+BLENDERBOT_CACHE_PATH = os.environ.get('BLENDERBOT_CACHE_PATH', '')
+
+
+def get_blenderbot_cache() -> ResponseCache:
+    store = None
+    if BLENDERBOT_CACHE_PATH:
+        try:
+            store = SqliteResponseStore(BLENDERBOT_CACHE_PATH, 'blenderbot', ttl=CACHE_TTL)
+        except Exception:
+            logger.warning(f'Unable to open the BlenderBot cache at {BLENDERBOT_CACHE_PATH}, so only caching '
+                           f'BlenderBot responses in memory', exc_info=True)
+    return ResponseCache('blenderbot', MAX_CACHE_SIZE, ttl=CACHE_TTL, store=store)
+
+
+CACHE = get_blenderbot_cache()
 
 NEURAL_DECODE_CONFIG = {
     'temperature': 0.7,
@@ -20,8 +40,21 @@ NEURAL_DECODE_CONFIG = {
     'top_p': 0.9,
 }
 
+MIN_LENGTHS = [5, 10, 15, 20, 25]  # Will usually result in utterances 0-3 tokens above min_length
+
 MAX_HISTORY_UTTERANCES = 3
 
+def get_decode_config(history: List[str], prefix: Optional[str] = None) -> dict:
+    """
+    Returns the decoding config for history and prefix. The min_length varies between contexts, but is chosen with a
+    seed derived from the context, so the same context (e.g. a greeting) always gets the same config, and can reuse
+    the cached response.
+    """
+    curr_config = NEURAL_DECODE_CONFIG.copy()
+    seed = zlib.crc32(json.dumps([history, prefix]).encode('utf-8'))
+    curr_config['min_length'] = random.Random(seed).choice(MIN_LENGTHS)
+    return curr_config
+
 def add_sentence_end_token(response):
     if response.strip()[-1] not in ['.', '!', '?']:
         response += '.'
@@ -107,9 +140,7 @@ class BlenderBot(Annotator):
             else:
                 logger.debug("Did not append ? because dialogact was unavailable")
             history = self.edit_history_for_remote(self.get_history())
-            curr_config = NEURAL_DECODE_CONFIG.copy()
-            curr_config['min_length'] = random.randint(1, 5) * 5 # min length is 5, 10, 15, 20, or 25. Will usually result in utterances 0-3 tokens above min_length.
-            input_data = {'history': history, 'config': curr_config}
+            input_data = {'history': history, 'config': get_decode_config(history, prefix)}
         else:
             # Do some basic typechecks
             assert 'history' in input_data
@@ -129,17 +160,18 @@ class BlenderBot(Annotator):
             future_result = self.state_manager.current_state.blenderbot.result()
             self.save_to_state(future_result)
 
-        cache_key = str(input_data)
-        if cache_key in CACHE:
+        cache_key = make_cache_key(history=input_data['history'], prefix=input_data.get('prefix'),
+                                   config=input_data['config'])
+        res = CACHE.get(cache_key)
+        if res is not None:
             logger.primary_info("BlenderBot: Retrieving cached response")
-            CACHE.move_to_end(cache_key)
-            res = CACHE[cache_key]
         else:
             logger.primary_info("BlenderBot: Running remote call")
             res = self.remote_call(input_data)
-            CACHE[cache_key] = res
-            if len(CACHE) > MAX_CACHE_SIZE:
-                CACHE.popitem(last=False)
+            # Don't cache failures: when the remote call fails or times out, it returns the default response, which
+            # has no responses
+            if res and res.get('responses'):
+                CACHE.put(cache_key, res)
 
         if res is None or len(res)==0:
             default_response = self.get_default_response()
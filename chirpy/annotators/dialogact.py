@@ -32,6 +32,7 @@ NO = {"no", "nope", "nah", "not really", "incorrect", "under no circumstances","
 
 class DialogActAnnotator(Annotator):
     name='dialogact'
+    batch_list_key = 'instances'
     def __init__(self, state_manager: StateManager, timeout=1.5, url=None, input_annotations = []):
         super().__init__(state_manager=state_manager, timeout=timeout, url=url, input_annotations=input_annotations)
 
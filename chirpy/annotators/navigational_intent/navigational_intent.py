@@ -173,10 +173,10 @@ def get_nav_intent(user_utterance: str, history: List[str]) -> NavigationalInten
     #     logger.primary_info(f"user_utterance '{user_utterance}' is marked as is_question, so assuming navigational_intent is none")
     #     return NavigationalIntentOutput()
 
-    pos_template = PositiveNavigationTemplate()
-    neg_template = NegativeNavigationTemplate()
-    somethingelse_template = SomethingElseTemplate()
-    nav_question_template = NavigationQuestionTemplate()
+    pos_template = PositiveNavigationTemplate.compiled()
+    neg_template = NegativeNavigationTemplate.compiled()
+    somethingelse_template = SomethingElseTemplate.compiled()
+    nav_question_template = NavigationQuestionTemplate.compiled()
 
     # Check whether the last bot utterance was asking a general "what do you want to talk about?" question
     if history:
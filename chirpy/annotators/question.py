@@ -47,7 +47,7 @@ class QuestionAnnotator(Annotator):
         if not input_data['utterance']:
             return self.get_default_response()
 
-        if CurrentEventsTemplate().execute(input_data['utterance']):
+        if CurrentEventsTemplate.compiled().execute(input_data['utterance']):
             question_prob = 0.
             is_question = False
             logger.primary_info("Detected Current Events intent, setting is_question=False and question_prob=0")
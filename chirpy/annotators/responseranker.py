@@ -8,6 +8,7 @@ logger = logging.getLogger('chirpylogger')
 
 class ResponseRanker(Annotator):
     name='responseranker'
+    batch_list_key = 'responses'
     def __init__(self, state_manager: StateManager, timeout=3, url=None, input_annotations = []):
         super().__init__(state_manager=state_manager, timeout=timeout, url=url, input_annotations=input_annotations)
 
@@ -0,0 +1,63 @@
+"""
+Tests for the BlenderBot annotator's response cache, against a local socket, so no BlenderBot container is needed
+
+Run:
+    python -m unittest -v chirpy/annotators/test_blenderbot.py
+"""
+
+import logging
+import socket
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from chirpy.annotators import blenderbot
+from chirpy.core.logging_utils import LoggerSettings, setup_logger
+from chirpy.core.response_cache import ResponseCache
+
+HISTORY = ['', 'hi, how are you doing today?', 'good how are you']
+
+
+def setUpModule():
+    setup_logger(LoggerSettings(logtoscreen_level=logging.CRITICAL, logtoscreen_usecolor=False, logtofile_level=None,
+                                logtofile_path=None, logtoscreen_allow_multiline=False, integ_test=False,
+                                remove_root_handlers=False))
+
+
+class TestBlenderBotCache(unittest.TestCase):
+
+    def setUp(self):
+        # A server that accepts connections but never responds, so every remote call times out
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(8)
+        url = 'http://127.0.0.1:{}'.format(self.server.getsockname()[1])
+        state_manager = SimpleNamespace(current_state=SimpleNamespace(text='good how are you'))
+        self.blenderbot = blenderbot.BlenderBot(state_manager, timeout=0.1, url=url)
+        cache_patcher = mock.patch.object(blenderbot, 'CACHE', ResponseCache('blenderbot_test', 16, ttl=60))
+        self.cache = cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_timeout_is_not_cached(self):
+        """Check that a timed out call returns the default response, and that the next call is sent again"""
+        with mock.patch.object(self.blenderbot, 'remote_call', wraps=self.blenderbot.remote_call) as remote_call:
+            for _ in range(2):
+                self.assertEqual(self.blenderbot.execute({'history': list(HISTORY)}), ([], []))
+        self.assertEqual(remote_call.call_count, 2)
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_response_is_cached(self):
+        """Check that a successful response is cached, so the next call with the same history isn't sent"""
+        response = {'responses': ["i'm doing well, thanks for asking"], 'response_probabilities': [0.9]}
+        with mock.patch.object(self.blenderbot, 'remote_call', return_value=response) as remote_call:
+            for _ in range(2):
+                self.assertEqual(self.blenderbot.execute({'history': list(HISTORY)}),
+                                 (["i'm doing well, thanks for asking."], [0.9]))
+        self.assertEqual(remote_call.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+A turn-scoped cache of analyses of the user's utterance, shared by the RGs.
+
+Every RG classifies the same utterance with the same RegexTemplates (e.g. in identify_base_response_types), and the
+RGs run in parallel threads, so without a cache each template runs once per RG per turn. The StateManager of each turn
+has one AnalysisCache, so the cache is dropped at the end of the turn.
+"""
+
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, Hashable, Optional, Tuple, Type
+
+if TYPE_CHECKING:
+    # Not imported at runtime, so that test discovery doesn't collect RegexTemplate (a TestCase) from this module
+    from chirpy.core.regex.regex_template import RegexTemplate
+    from chirpy.core.regex.template_index import TemplateIndex
+
+logger = logging.getLogger('chirpylogger')
+
+
+class AnalysisCache:
+    """Memoized RegexTemplate matches, keyed by (utterance, template). Safe to share between threads."""
+
+    def __init__(self):
+        self._results: Dict[Tuple[str, Hashable], Optional[Dict[str, str]]] = {}
+        self._lock = threading.Lock()
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def execute(self, template_cls: Type['RegexTemplate'], utterance: str) -> Optional[Dict[str, str]]:
+        """
+        Returns template_cls.compiled().execute(utterance), computing it only the first time it's asked for this turn.
+        The returned slots dict is shared, so callers shouldn't modify it.
+        """
+        key = (utterance, template_cls)
+        with self._lock:
+            if key in self._results:
+                self.num_hits += 1
+                return self._results[key]
+        # Match outside the lock, so threads matching other templates don't wait. If two threads miss on the same key,
+        # both match, and the first result is kept.
+        result = template_cls.compiled().execute(utterance)
+        with self._lock:
+            self.num_misses += 1
+            return self._results.setdefault(key, result)
+
+    def execute_all(self, index: 'TemplateIndex', utterance: str) -> Dict[Type['RegexTemplate'], Optional[Dict[str, str]]]:
+        """
+        Returns a dict from each template class of index to its match on utterance, like execute. The templates that
+        aren't cached yet are matched together with index, which scans utterance once for all of them.
+        """
+        with self._lock:
+            missing = [template_cls for template_cls in index.template_classes if (utterance, template_cls) not in self._results]
+            self.num_hits += len(index.template_classes) - len(missing)
+        if missing:
+            found = index.scan(utterance)
+            results = {template_cls: index.execute(template_cls, utterance, found) for template_cls in missing}
+            with self._lock:
+                self.num_misses += len(missing)
+                for template_cls, result in results.items():
+                    self._results.setdefault((utterance, template_cls), result)
+        with self._lock:
+            return {template_cls: self._results[(utterance, template_cls)] for template_cls in index.template_classes}
+
+    def matches(self, template_cls: Type['RegexTemplate'], utterance: str) -> bool:
+        """Returns True iff utterance matches template_cls"""
+        return self.execute(template_cls, utterance) is not None
+
+    def log_stats(self):
+        logger.primary_info(f'AnalysisCache had {self.num_hits} hits and {self.num_misses} misses this turn')
@@ -1,19 +1,77 @@
 # This file contains the g2p function that converts a span to one phonetic representation (grapheme to phoneme).
 # This function is used for indexing anchortexts and when input spans are looked up in the index.
 
-from functools import lru_cache
+import logging
 import os
-import pickle
-from typing import List
+import sqlite3
+import tempfile
+import threading
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from chirpy.core.asr.pronunciation_table import load_cmudict, load_pronunciation_table
+from chirpy.core.ttl_cache import TTLCache
+
+logger = logging.getLogger('chirpylogger')
 
-# Load the pickled cmudict
+# Load the cmudict
 # This is derived from the CMUDict pronunciation dictionary, which maps spelling of a word to potential phoneme pronuncations
-with open(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'cmudict.pkl'), 'rb') as f:
-    CMUDICT = pickle.load(f)
+# We use the memory-mapped PronunciationTable, which is shared by all the processes on the machine, if we can
+CMUDICT = load_pronunciation_table() or load_cmudict()
+
+# Where we persist the pronunciations the remote g2p module gives for words that aren't in the cmudict, so they're shared
+# by all the processes on the machine and survive restarts. If set to the empty string, they're only cached in memory.
+G2P_CACHE_PATH = os.environ.get('G2P_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'chirpy_g2p_cache.sqlite'))
+
+# In-memory cache of g2p results, keyed by the span (so it's shared by all g2p_module instances). When the remote
+# module fails we cache that for a short time, so we don't call it again for the same span on every turn.
+G2P_CACHE_SIZE = 32768
+G2P_FAILURE_TTL = 60  # seconds
+g2p_cache = TTLCache('span -> phonemes', G2P_CACHE_SIZE, ttl=float('inf'), negative_ttl=G2P_FAILURE_TTL)
+
+
+class PersistentG2pCache:
+    """A span -> phonemes mapping in a SQLite database, which can be shared by several processes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=1.0, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS g2p (span TEXT PRIMARY KEY, phonemes TEXT NOT NULL)')
+
+    def get(self, span: str) -> Optional[List[str]]:
+        with self.lock:
+            row = self.conn.execute('SELECT phonemes FROM g2p WHERE span = ?', (span,)).fetchone()
+        return None if row is None else row[0].split('\t')
+
+    def put(self, span: str, phonemes: List[str]):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO g2p (span, phonemes) VALUES (?, ?)', (span, '\t'.join(phonemes)))
+
+
+def get_persistent_g2p_cache() -> Optional[PersistentG2pCache]:
+    if G2P_CACHE_PATH:
+        try:
+            return PersistentG2pCache(G2P_CACHE_PATH)
+        except Exception:
+            logger.warning(f'Unable to open the g2p cache at {G2P_CACHE_PATH}, so only caching g2p results in memory', exc_info=True)
+    return None
+
+
+persistent_g2p_cache = get_persistent_g2p_cache()
+
+
+@lru_cache(maxsize=32768)
+def cmudict_pronunciations(word: str) -> Optional[Tuple[str, ...]]:
+    """Returns the pronunciations of word in the cmudict, or None if it's not in it"""
+    pronunciations = CMUDICT.get(word)
+    return None if pronunciations is None else tuple(pronunciations)
+
 
 def simple_g2p(span: str) -> List[str]:
     """ A simple dictionary-based grapheme to phoneme algorithm """
-    lattice = [CMUDICT.get(x, ['?']) for x in span.lower().split()]
+    lattice = [cmudict_pronunciations(x) or ['?'] for x in span.lower().split()]
     if len(lattice) == 0:
         return []
 
@@ -24,20 +82,49 @@ def simple_g2p(span: str) -> List[str]:
     return res
 
 
-@lru_cache(maxsize=32768)
+def neural_g2p(span: str, g2p_module) -> Optional[List[str]]:
+    """Returns the phonemes the remote g2p module gives for span, from the persistent cache if they're in it"""
+    if persistent_g2p_cache is not None:
+        try:
+            phonemes = persistent_g2p_cache.get(span)
+            if phonemes is not None:
+                return phonemes
+        except Exception:
+            logger.warning(f'Unable to read "{span}" from the g2p cache at {G2P_CACHE_PATH}', exc_info=True)
+
+    try:
+        phonemes = g2p_module.execute(span)
+    except Exception:
+        return None
+    if phonemes is None:
+        return None
+
+    if persistent_g2p_cache is not None and phonemes:
+        try:
+            persistent_g2p_cache.put(span, phonemes)
+        except Exception:
+            logger.warning(f'Unable to write "{span}" to the g2p cache at {G2P_CACHE_PATH}', exc_info=True)
+    return phonemes
+
+
 def g2p(span: str, g2p_module = None) -> List[str]:
     """ Use the remote g2p module for grapheme to phoneme conversion when simple dict-based method fails """
+    found, _ = g2p_cache.get_many([span])
+    if span in found:
+        if found[span] is not None:
+            return list(found[span])
+        return simple_g2p(span)  # the remote module failed recently
+
     simple_phonemes = simple_g2p(span)
     if '?' not in simple_phonemes:
+        g2p_cache.put(span, tuple(simple_phonemes))
         return simple_phonemes
 
-    try:
-        phonemes = g2p_module.execute(span)
-        if phonemes is None:
-            return simple_phonemes
-        return phonemes
-    except Exception as ex:
+    if g2p_module is None:
         return simple_phonemes
+    phonemes = neural_g2p(span, g2p_module)
+    g2p_cache.put(span, None if phonemes is None else tuple(phonemes))
+    return simple_phonemes if phonemes is None else phonemes
 
 if __name__ == "__main__":
     from chirpy.core.asr.index_phone_to_ent import MockG2p
@@ -45,4 +132,3 @@ if __name__ == "__main__":
     print(g2p('there eyes of skywalker', mock_g2p_module))
     print(g2p('the rise of skywalker', mock_g2p_module))
     print(g2p('love you 3000', mock_g2p_module))
-
@@ -6,6 +6,7 @@
 # representations of spans to entities.
 # This script should be run when there's an significant update to the set of Wikipedia entities in our dump, or when
 # the mechanism to map spans to phonetic representations changes in g2p.py.
+# The same documents can also be written to a local PhoneticIndex, which doesn't need ES (see phonetic_index.py).
 
 from concurrent import futures
 from elasticsearch import Elasticsearch, RequestsHttpConnection
@@ -16,6 +17,7 @@ from metaphone import doublemetaphone
 import json
 import os
 import re
+from typing import Optional
 
 from chirpy.core.asr.g2p import g2p
 from chirpy.core.util import get_es_host, get_elasticsearch
@@ -47,6 +49,41 @@ def span_to_phoneme_string(span: str, g2p_module = None) -> str:
     return ' '.join([x for x in g2p(span, g2p_module) if x != ' '])  # remove word boundaries
 
 
+def make_item(obj, g2p_module) -> Optional[dict]:
+    """
+    Returns the document we index for obj, an (anchortext, entity names) pair from WIKI_ENTITIES, or None if we don't
+    index the anchortext. Also used to build the local PhoneticIndex (see phonetic_index).
+    """
+    if obj[0].startswith(':') or obj[0].startswith('thumb|') or len(obj[0].split()) > 10 or "</" in obj[0]\
+            or obj[0].startswith('category:'):
+        return None
+
+    span = re.sub(" \(.*\)$", "", obj[0])
+
+    phoneme_string = span_to_phoneme_string(span, g2p_module)
+    phoneme_string_stressless = remove_stress(phoneme_string)
+
+    metaphone_strings = set(filter(lambda x: len(x) > 0, doublemetaphone(span)))
+    # further augmentation
+    augment_pairs = {"X": ["K"], "K": ["X"]}
+    augmented_metaphone_strings = set()
+    for x in metaphone_strings:
+        lattice = []
+        for y in x:
+            if y in augment_pairs:
+                lattice.append([y] + augment_pairs[y])
+            else:
+                lattice.append([y])
+        augmented_metaphone_strings.update(lattice_to_phonemes(lattice))
+
+    return {
+        'span': obj[0],
+        'phonemes': [x.replace(' ', '') for x in augmented_metaphone_strings],
+        'phonemes_stressless': phoneme_string_stressless,
+        'entities': json.dumps([x for x in obj[1] if not x.startswith('Category:') and not x.startswith(':')])
+    }
+
+
 def index(bz2file, idx):
     id = 0
     queries = []
@@ -54,36 +91,11 @@ def index(bz2file, idx):
         with bz2.open(bz2file) as f:
             for line in tqdm(f, position=idx % 12 + 1, desc=f"File {idx}", leave=False):
             # for line in f:
-                obj = eval(line.decode('utf-8').rstrip())
-                if obj[0].startswith(':') or obj[0].startswith('thumb|') or len(obj[0].split()) > 10 or "</" in obj[0]\
-                        or obj[0].startswith('category:'):
+                item = make_item(eval(line.decode('utf-8').rstrip()), g2p_module)
+                if item is None:
                     id += 1
                     continue
 
-                span = re.sub(" \(.*\)$", "", obj[0])
-
-                phoneme_string = span_to_phoneme_string(span, g2p_module)
-                phoneme_string_stressless = remove_stress(phoneme_string)
-
-                metaphone_strings = set(filter(lambda x: len(x) > 0, doublemetaphone(span)))
-                # further augmentation
-                augment_pairs = {"X": ["K"], "K": ["X"]}
-                augmented_metaphone_strings = set()
-                for x in metaphone_strings:
-                    lattice = []
-                    for y in x:
-                        if y in augment_pairs:
-                            lattice.append([y] + augment_pairs[y])
-                        else:
-                            lattice.append([y])
-                    augmented_metaphone_strings.update(lattice_to_phonemes(lattice))
-
-                item = {
-                    'span': obj[0],
-                    'phonemes': [x.replace(' ', '') for x in augmented_metaphone_strings],
-                    'phonemes_stressless': phoneme_string_stressless,
-                    'entities': json.dumps([x for x in obj[1] if not x.startswith('Category:') and not x.startswith(':')])
-                }
                 query = "{}\n{}".format(json.dumps({ 'index': { '_id': f'span-{os.path.basename(bz2file)}-{id}' } }), json.dumps(item))
                 queries.append(query)
                 id += 1
@@ -1,8 +1,10 @@
 from collections import Counter
 from editdistance import eval as editdist
+from itertools import product
+import numpy as np
 import re
-from typing import List, Iterable
-from chirpy.core.asr.g2p import g2p, CMUDICT
+from typing import Dict, List, Iterable, Tuple
+from chirpy.core.asr.g2p import g2p, cmudict_pronunciations
 
 def remove_stress(phoneme_str: str) -> str:
     return re.sub(r'[0-9]', '', phoneme_str)
@@ -16,7 +18,7 @@ def span_to_lattice(span: str, g2p_module = None) -> List[List[str]]:
     Optionally uses a neural remote module to catch words that aren't in the phonetic dictionary.
     For instance, "rotten tomato" -> [['R AA1 T AH0 N'], ['T AH0 M EY1 T OW2', 'T AH0 M AA1 T OW2']]
     """
-    return [CMUDICT.get(x, [' '.join(g2p(x, g2p_module))]) for x in span.split()]
+    return [list(cmudict_pronunciations(x) or [' '.join(g2p(x, g2p_module))]) for x in span.split()]
 
 def lattice_to_phonemes(lattice: List[List[str]]) -> Iterable[str]:
     """
@@ -72,6 +74,70 @@ def get_lattice_similarity(lattice1: List[List[str]], lattice2: List[List[str]],
                 max_ratio = ratio
     return max_ratio
 
+def lattice_to_token_renderings(lattice: List[List[str]], ignore_stress: bool = False) -> List[List[str]]:
+    """
+    Like lattice_to_phonemes, but each rendering is a list of phonemes rather than a space-separated string, with
+    stress removed if ignore_stress.
+    """
+    word_options = [[(remove_stress(x) if ignore_stress else x).split() for x in word] for word in lattice]
+    return [[phoneme for word in rendering for phoneme in word] for rendering in product(*word_options)]
+
+
+def encode_renderings(lattices: List[List[List[str]]], ignore_stress: bool, vocab: Dict[str, int]) -> Tuple[List[List[int]], np.ndarray]:
+    """
+    Renders each lattice (see lattice_to_token_renderings), and encodes each rendering as a list of phoneme ids, adding
+    any new phonemes to vocab. A lattice with no renderings gets an empty one, so that every lattice has at least one.
+    Returns the encoded renderings of all the lattices, one after the other, and the index of the first rendering of
+    each lattice.
+    """
+    renderings, offsets = [], []
+    for lattice in lattices:
+        offsets.append(len(renderings))
+        lattice_renderings = lattice_to_token_renderings(lattice, ignore_stress) if lattice else []
+        renderings += [[vocab.setdefault(phoneme, len(vocab)) for phoneme in rendering]
+                       for rendering in lattice_renderings] or [[]]
+    return renderings, np.array(offsets, dtype=np.intp)
+
+
+def phoneme_counts(renderings: List[List[int]], vocab_size: int) -> np.ndarray:
+    """Returns the (len(renderings), vocab_size) matrix of the number of times each phoneme appears in each rendering"""
+    counts = np.zeros((len(renderings), vocab_size), dtype=np.int32)
+    rows = np.repeat(np.arange(len(renderings)), [len(rendering) for rendering in renderings])
+    np.add.at(counts, (rows, np.fromiter((p for rendering in renderings for p in rendering), dtype=np.intp, count=len(rows))), 1)
+    return counts
+
+
+def get_lattice_similarities(lattices1: List[List[List[str]]], lattices2: List[List[List[str]]],
+                             threshold: float = 0.8, ignore_stress: bool = False) -> np.ndarray:
+    """
+    Batched version of get_lattice_similarity. Returns the (len(lattices1), len(lattices2)) matrix of the similarity
+    of each pair of lattices, which is the same as calling get_lattice_similarity on each pair.
+
+    The bag-of-phonemes filter is applied to all pairs of renderings at once, and the edit distance is only computed
+    for the pairs that pass it.
+    """
+    if not lattices1 or not lattices2:
+        return np.zeros((len(lattices1), len(lattices2)))
+    vocab = {}
+    renderings1, offsets1 = encode_renderings(lattices1, ignore_stress, vocab)
+    renderings2, offsets2 = encode_renderings(lattices2, ignore_stress, vocab)
+    counts1, counts2 = phoneme_counts(renderings1, len(vocab)), phoneme_counts(renderings2, len(vocab))
+    lens1, lens2 = counts1.sum(axis=1), counts2.sum(axis=1)
+
+    # The orderless filter: the size of the multiset intersection of each pair of renderings, relative to their lengths
+    overlaps = np.minimum(counts1[:, None, :], counts2[None, :, :]).sum(axis=2)
+    total_lens = lens1[:, None] + lens2[None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        passed = (total_lens > 0) & ~(overlaps * 2 / total_lens < threshold)
+
+    # Exact similarity for the pairs that pass, and the max over each pair of lattices' renderings
+    ratios = np.zeros(overlaps.shape)
+    for i, j in zip(*np.nonzero(passed)):
+        p1, p2 = renderings1[i], renderings2[j]
+        ratios[i, j] = 1 - editdist(p1, p2) / max(len(p1), len(p2))
+    return np.maximum.reduceat(np.maximum.reduceat(ratios, offsets1, axis=0), offsets2, axis=1)
+
+
 if __name__ == "__main__":
     from chirpy.core.asr.index_phone_to_ent import MockG2p
 
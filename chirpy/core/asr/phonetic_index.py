@@ -0,0 +1,242 @@
+"""
+An embedded, read-only phonetic index of Wikipedia anchortexts, as an alternative to querying the PHONE_TO_ENT_INDEX
+in ES (see search_phone_to_ent). It holds the same documents as the ES index, and answers the same query: the
+anchortexts with a metaphone key within edit distance 2 of the metaphone key of any of the query spans.
+
+The index is built offline from the same WIKI_ENTITIES span dumps that index_phone_to_ent uploads to ES:
+
+    python -m chirpy.core.asr.phonetic_index "/path/to/enwiki-...-spans.json.bz2/*.bz2" /path/to/index_dir
+
+It's a single file, which is memory-mapped read-only, so all the worker processes on a machine share one copy in the
+page cache. It holds:
+
+    records: record_index -> the document (span, phonemes_stressless, entities etc) as JSON.
+    keys: the distinct metaphone keys of all the documents, sorted by length, each with the (increasing)
+        record_indices of the documents that have it (its postings).
+    histograms: for each key, the number of times each letter of the metaphone alphabet appears in it.
+
+To search, we only consider the keys whose length is within the max edit distance of the query key. Each edit changes
+the letter histogram by at most 2, so we filter those keys with one NumPy operation over their histograms, and only
+compute the edit distance for the keys that pass.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+from glob import glob
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from editdistance import eval as editdist
+
+INDEX_FILENAME = 'phonetic_index.bin'
+
+VERSION = 1
+
+# File header: magic, version, number of records, number of keys, the metaphone alphabet, and the offsets of the
+# records index, records, key entries, keys blob, postings, key length starts and histograms sections
+HEADER = struct.Struct('<8sIII64s7Q')
+MAGIC = b'CHIRPYPI'
+
+# One RECORD per document: offset and length of its JSON, and its number of keys
+RECORD = struct.Struct('<QII')
+
+# One KEY per metaphone key: offset and length of the key in the keys blob, and offset and number of its postings.
+# Postings are uint32 record_indices.
+KEY = struct.Struct('<QIQI')
+
+# Longest key we index. Longer keys (from long spans) are truncated.
+MAX_KEY_LEN = 32
+
+# Like ES's fuzziness and max_expansions: how far a key can be from the query key, and how many of the closest keys we
+# take the documents of, for each query key
+MAX_DISTANCE = 2
+MAX_EXPANSIONS = 50
+
+
+class PhoneticIndex:
+    """Read-only access to an index built by build_index. Safe to share between threads."""
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        path = os.path.join(index_dir, INDEX_FILENAME)
+        self._file = open(path, 'rb')
+        self.buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.num_records, self.num_keys, alphabet, self.records_index_offset, self.records_offset,
+         self.keys_offset, self.keys_blob_offset, self.postings_offset, length_starts_offset,
+         histograms_offset) = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.buf.close()
+            self._file.close()
+            raise ValueError(f'{path} is not a version {VERSION} PhoneticIndex file')
+        self.alphabet = alphabet.rstrip(b'\0').decode('utf-8')
+        self.char2column = {char: i for i, char in enumerate(self.alphabet)}
+
+        # The first row of each key length, and each key's letter histogram, as arrays backed by the mmap
+        self.length_starts = np.frombuffer(self.buf, dtype=np.uint64, count=MAX_KEY_LEN + 2, offset=length_starts_offset)
+        self.histograms = np.frombuffer(self.buf, dtype=np.uint8, count=self.num_keys * len(self.alphabet),
+                                        offset=histograms_offset).reshape(self.num_keys, len(self.alphabet))
+
+    def close(self):
+        # The arrays hold references to the mmap, so drop them first
+        del self.length_starts, self.histograms
+        self.buf.close()
+        self._file.close()
+
+    def get_record(self, record_index: int) -> dict:
+        offset, length, _ = RECORD.unpack_from(self.buf, self.records_index_offset + record_index * RECORD.size)
+        start = self.records_offset + offset
+        return json.loads(self.buf[start:start + length])
+
+    def get_num_keys(self, record_index: int) -> int:
+        return RECORD.unpack_from(self.buf, self.records_index_offset + record_index * RECORD.size)[2]
+
+    def get_key(self, key_index: int) -> str:
+        key_offset, key_len, _, _ = KEY.unpack_from(self.buf, self.keys_offset + key_index * KEY.size)
+        start = self.keys_blob_offset + key_offset
+        return self.buf[start:start + key_len].decode('utf-8')
+
+    def get_postings(self, key_index: int) -> Tuple[int, ...]:
+        _, _, postings_offset, num_postings = KEY.unpack_from(self.buf, self.keys_offset + key_index * KEY.size)
+        return struct.unpack_from(f'<{num_postings}I', self.buf, self.postings_offset + postings_offset)
+
+    def histogram(self, key: str) -> Tuple[np.ndarray, int]:
+        """Returns the letter histogram of key, and the number of its letters that aren't in the alphabet"""
+        histogram = np.zeros(len(self.alphabet), dtype=np.uint8)
+        num_unknown = 0
+        for char in key:
+            if char in self.char2column:
+                histogram[self.char2column[char]] += 1
+            else:
+                num_unknown += 1
+        return histogram, num_unknown
+
+    def find_keys(self, key: str, max_distance: int = MAX_DISTANCE) -> List[Tuple[int, int]]:
+        """Returns (edit distance, key_index) for all the keys within max_distance of key, closest first"""
+        key = key[:MAX_KEY_LEN]
+        start = int(self.length_starts[max(len(key) - max_distance, 0)])
+        end = int(self.length_starts[min(len(key) + max_distance, MAX_KEY_LEN) + 1])
+        if start == end:
+            return []
+        histogram, num_unknown = self.histogram(key)
+        candidates = self.histograms[start:end]
+        histogram_distances = (np.maximum(candidates, histogram) - np.minimum(candidates, histogram)).sum(axis=1, dtype=np.int32)
+        passed = np.nonzero(histogram_distances + num_unknown <= 2 * max_distance)[0]
+        results = []
+        for key_index in (passed + start).tolist():
+            distance = editdist(key, self.get_key(key_index))
+            if distance <= max_distance:
+                results.append((distance, key_index))
+        return sorted(results)
+
+    def search(self, keys: Iterable[str], size: int, max_distance: int = MAX_DISTANCE,
+               max_expansions: int = MAX_EXPANSIONS) -> List[dict]:
+        """
+        Returns the records of the documents with a key within max_distance of any of keys, like the ES query in
+        get_asr_aware_span2entsim, closest first. At most size records are returned.
+
+        For each of keys, only the documents of the max_expansions closest keys are considered. Like ES, documents
+        with fewer keys (i.e. whose span has fewer metaphone variants) rank higher among equally close ones.
+        """
+        record2distance: Dict[int, int] = {}
+        for key in set(keys):
+            if not key:
+                continue
+            for distance, key_index in self.find_keys(key, max_distance)[:max_expansions]:
+                for record_index in self.get_postings(key_index):
+                    if distance < record2distance.get(record_index, max_distance + 1):
+                        record2distance[record_index] = distance
+        ranked = sorted(record2distance, key=lambda record_index: (record2distance[record_index],
+                                                                   self.get_num_keys(record_index), record_index))
+        return [self.get_record(record_index) for record_index in ranked[:size]]
+
+
+def build_index(items: Iterable[dict], index_dir: str) -> Tuple[int, int]:
+    """
+    Builds a PhoneticIndex in index_dir from items (the documents uploaded to ES, see index_phone_to_ent.make_item).
+    Returns the number of records and keys.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    record_jsons = []
+    key2postings: Dict[str, List[int]] = {}
+    record_num_keys = []
+    for record_index, item in enumerate(items):
+        record_jsons.append(json.dumps(item, separators=(',', ':')).encode('utf-8'))
+        keys = {key.upper()[:MAX_KEY_LEN] for key in item['phonemes'] if key}
+        record_num_keys.append(len(keys))
+        for key in keys:
+            key2postings.setdefault(key, []).append(record_index)
+
+    keys = sorted(key2postings, key=lambda key: (len(key), key))
+    alphabet = ''.join(sorted({char for key in keys for char in key}))
+    assert len(alphabet.encode('utf-8')) <= 64, f'metaphone alphabet {alphabet} is too big'
+    char2column = {char: i for i, char in enumerate(alphabet)}
+
+    with open(os.path.join(index_dir, INDEX_FILENAME), 'wb') as f:
+        f.write(b'\0' * HEADER.size)
+
+        records_index_offset = f.tell()
+        record_offset = 0
+        for record_json, num_keys in zip(record_jsons, record_num_keys):
+            f.write(RECORD.pack(record_offset, len(record_json), num_keys))
+            record_offset += len(record_json)
+        records_offset = f.tell()
+        for record_json in record_jsons:
+            f.write(record_json)
+
+        keys_offset = f.tell()
+        key_offset, postings_offset = 0, 0
+        for key in keys:
+            encoded_key_len = len(key.encode('utf-8'))
+            f.write(KEY.pack(key_offset, encoded_key_len, postings_offset, len(key2postings[key])))
+            key_offset += encoded_key_len
+            postings_offset += len(key2postings[key]) * 4
+        keys_blob_offset = f.tell()
+        for key in keys:
+            f.write(key.encode('utf-8'))
+        postings_section_offset = f.tell()
+        for key in keys:
+            f.write(struct.pack(f'<{len(key2postings[key])}I', *key2postings[key]))
+
+        # Pad so the arrays are aligned
+        f.write(b'\0' * (-f.tell() % 8))
+        length_starts_offset = f.tell()
+        key_lens = np.array([len(key) for key in keys], dtype=np.int64)
+        f.write(np.searchsorted(key_lens, np.arange(MAX_KEY_LEN + 2), side='left').astype(np.uint64).tobytes())
+        histograms_offset = f.tell()
+        histograms = np.zeros((len(keys), len(alphabet)), dtype=np.uint8)
+        for i, key in enumerate(keys):
+            for char in key:
+                histograms[i, char2column[char]] += 1
+        f.write(histograms.tobytes())
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, len(record_jsons), len(keys), alphabet.encode('utf-8'), records_index_offset,
+                            records_offset, keys_offset, keys_blob_offset, postings_section_offset, length_starts_offset,
+                            histograms_offset))
+    return len(record_jsons), len(keys)
+
+
+if __name__ == '__main__':
+    import bz2
+    from chirpy.core.asr.index_phone_to_ent import MockG2p, make_item
+
+    parser = argparse.ArgumentParser(description='Build a PhoneticIndex from the WIKI_ENTITIES span dumps')
+    parser.add_argument('spans_glob', type=str, help='Glob of the span dump .bz2 files (see index_phone_to_ent)')
+    parser.add_argument('index_dir', type=str, help='Directory to write the index to')
+    args = parser.parse_args()
+
+    g2p_module = MockG2p()
+
+    def read_items():
+        for path in sorted(glob(args.spans_glob)):
+            with bz2.open(path) as f:
+                for line in f:
+                    item = make_item(eval(line.decode('utf-8').rstrip()), g2p_module)
+                    if item is not None:
+                        yield item
+
+    num_records, num_keys = build_index(read_items(), args.index_dir)
+    print(f'Wrote {num_records} anchortexts with {num_keys} distinct metaphone keys to {args.index_dir}')
@@ -0,0 +1,156 @@
+"""
+A compact, read-only table of the CMUdict pronunciations (see g2p.py), stored in a memory-mapped file, so that all the
+worker processes on a machine share one copy in the page cache rather than each unpickling the whole dict.
+
+The table is built from cmudict.pkl the first time it's needed (see load_pronunciation_table), and rebuilt if
+cmudict.pkl changes. It can also be built ahead of time:
+
+    python -m chirpy.core.asr.pronunciation_table /path/to/cmudict.bin
+"""
+
+import logging
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from chirpy.core.entity_linker.wiki_entity_store import SortedKeyTable, write_sorted_key_table
+
+logger = logging.getLogger('chirpylogger')
+
+CMUDICT_PKL_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'cmudict.pkl')
+
+# Where the table is kept. /tmp is shared by the worker processes on a machine, and writable on lambda too.
+TABLE_PATH = os.environ.get('CMUDICT_TABLE_PATH', os.path.join(tempfile.gettempdir(), 'chirpy_cmudict.bin'))
+
+VERSION = 1
+
+# File header: magic, version, number of words, size and mtime of the cmudict.pkl it was built from, and the offsets of
+# the word entries, words blob and pronunciations blob
+HEADER = struct.Struct('<8sIIQQQQQ')
+MAGIC = b'CHIRPYCD'
+
+# One WORD per word, sorted by word: offset and length of the word in the words blob, and offset and length of its
+# pronunciations (newline-separated) in the pronunciations blob
+WORD = struct.Struct('<QIQI')
+
+
+class PronunciationTable:
+    """A read-only mapping from word to its list of pronunciations, like the CMUdict dict. Safe to share between threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self.buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.num_words, self.source_size, self.source_mtime, words_offset, words_blob_offset,
+         self.pronunciations_offset) = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} PronunciationTable file')
+        self.words = SortedKeyTable(self.buf, WORD, words_offset, words_blob_offset, self.num_words)
+
+    def close(self):
+        self.buf.close()
+        self._file.close()
+
+    def _pronunciations(self, entry: tuple) -> List[str]:
+        _, _, offset, length = entry
+        start = self.pronunciations_offset + offset
+        return self.buf[start:start + length].decode('utf-8').split('\n')
+
+    def get(self, word: str, default=None):
+        entry = self.words.find(word)
+        return default if entry is None else self._pronunciations(entry)
+
+    def __getitem__(self, word: str) -> List[str]:
+        pronunciations = self.get(word)
+        if pronunciations is None:
+            raise KeyError(word)
+        return pronunciations
+
+    def __contains__(self, word: str) -> bool:
+        return self.words.find(word) is not None
+
+    def __len__(self):
+        return self.num_words
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self.num_words):
+            yield self.words.get_key(self.words.get_entry(i)).decode('utf-8')
+
+    def keys(self) -> Iterator[str]:
+        return iter(self)
+
+    def items(self) -> Iterator[Tuple[str, List[str]]]:
+        for i in range(self.num_words):
+            entry = self.words.get_entry(i)
+            yield self.words.get_key(entry).decode('utf-8'), self._pronunciations(entry)
+
+
+def build_table(cmudict: Dict[str, List[str]], path: str, source_size: int = 0, source_mtime: int = 0):
+    """
+    Writes a PronunciationTable of cmudict to path. The file is written next to path and then renamed, so processes
+    that are reading an old table at path are unaffected.
+    """
+    items, pronunciations_offset = [], 0
+    pronunciations_blobs = []
+    for word in sorted(cmudict, key=lambda word: word.encode('utf-8')):
+        pronunciations = '\n'.join(cmudict[word]).encode('utf-8')
+        items.append((word.encode('utf-8'), pronunciations_offset, len(pronunciations)))
+        pronunciations_blobs.append(pronunciations)
+        pronunciations_offset += len(pronunciations)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.cmudict-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'\0' * HEADER.size)
+            words_offset = f.tell()
+            words_blob_offset = write_sorted_key_table(f, items, WORD)
+            pronunciations_section_offset = f.tell()
+            for pronunciations in pronunciations_blobs:
+                f.write(pronunciations)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, len(items), source_size, source_mtime, words_offset, words_blob_offset,
+                                pronunciations_section_offset))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_cmudict() -> Dict[str, List[str]]:
+    with open(CMUDICT_PKL_PATH, 'rb') as f:
+        return pickle.load(f)
+
+
+def load_pronunciation_table(path: str = TABLE_PATH) -> Optional[PronunciationTable]:
+    """
+    Returns the PronunciationTable at path, first (re)building it from cmudict.pkl if it doesn't exist or was built
+    from a different cmudict.pkl. Returns None if that fails.
+    """
+    try:
+        source_stat = os.stat(CMUDICT_PKL_PATH)
+        try:
+            table = PronunciationTable(path)
+            if (table.source_size, table.source_mtime) == (source_stat.st_size, source_stat.st_mtime_ns):
+                return table
+            table.close()
+        except (OSError, ValueError, struct.error):
+            pass
+        logger.info(f'Building the CMUdict PronunciationTable at {path}')
+        build_table(load_cmudict(), path, source_stat.st_size, source_stat.st_mtime_ns)
+        return PronunciationTable(path)
+    except Exception:
+        logger.warning(f'Unable to load the CMUdict PronunciationTable at {path}', exc_info=True)
+        return None
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Build the CMUdict PronunciationTable')
+    parser.add_argument('path', type=str, nargs='?', default=TABLE_PATH, help='Where to write the table')
+    args = parser.parse_args()
+    table = load_pronunciation_table(args.path)
+    print(f'{args.path} has {len(table)} words' if table is not None else f'Unable to build {args.path}')
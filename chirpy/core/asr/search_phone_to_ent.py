@@ -1,4 +1,5 @@
 from collections import defaultdict
+from functools import lru_cache
 from elasticsearch import Elasticsearch, RequestsHttpConnection
 from requests_aws4auth import AWS4Auth
 import boto3
@@ -9,7 +10,8 @@ import os
 from typing import Dict, List, Optional  # NOQA
 
 from chirpy.core.asr.index_phone_to_ent import PHONE_TO_ENT_INDEX, span_to_phoneme_string
-from chirpy.core.asr.lattice import span_to_lattice, get_lattice_similarity, remove_stress
+from chirpy.core.asr.lattice import span_to_lattice, get_lattice_similarities, remove_stress
+from chirpy.core.asr.phonetic_index import PhoneticIndex
 from chirpy.core.entity_linker.lists import get_unigram_freq, DONT_LINK_WORDS
 from chirpy.core.latency import measure
 from chirpy.core.util import query_es_index, get_es_host, get_elasticsearch
@@ -27,6 +29,38 @@ password = os.environ.get('ES_PASSWORD')
 
 es = get_elasticsearch()
 
+# If set, anchortexts are searched for in the PhoneticIndex in this directory (see phonetic_index) rather than in ES
+PHONETIC_INDEX_DIR = os.environ.get('PHONETIC_INDEX_DIR')
+
+
+def get_phonetic_index() -> Optional[PhoneticIndex]:
+    if PHONETIC_INDEX_DIR:
+        try:
+            return PhoneticIndex(PHONETIC_INDEX_DIR)
+        except Exception:
+            logger.error(f'Unable to open PhoneticIndex at {PHONETIC_INDEX_DIR}, so using ES instead', exc_info=True)
+    return None
+
+
+phonetic_index = get_phonetic_index()
+
+
+def search_anchortexts(spans_for_query: List[str], topn: int) -> List[dict]:
+    """
+    Returns the '_source' of the topn anchortexts in the phonetic index whose metaphone is closest to that of any of
+    spans_for_query, from the local PhoneticIndex if there is one, otherwise from ES
+    """
+    if phonetic_index is not None:
+        logger.info(f"Querying PhoneticIndex at {phonetic_index.index_dir} with spans: {spans_for_query}")
+        return phonetic_index.search([doublemetaphone(span)[0] for span in spans_for_query], size=topn)
+    logger.info(f"Querying phonetic index with spans: {spans_for_query}")
+    query_from_span_metaphone = lambda span: {'match': {'phonemes': {'query': doublemetaphone(span)[0], 'fuzziness': 2}}}
+    query_from_span = lambda span: {'match_phrase': {'phonemes_stressless': {'query': remove_stress(span_to_phoneme_string(span)), 'slop': 10}}}
+    query = {'query': {'dis_max': {'queries': [query_from_span_metaphone(span) for span in spans_for_query]}}}
+    search_results = query_es_index(es, PHONE_TO_ENT_INDEX, query, size=topn, timeout=ES_QUERY_TIMEOUT)  # list of dicts
+    return [hit['_source'] for hit in search_results]
+
+
 @measure
 def get_asr_aware_span2entsim(spans: List[str], g2p_module, topn: int = 200) -> Dict[str, Dict[str, Dict]]:
     """
@@ -45,8 +79,6 @@ def get_asr_aware_span2entsim(spans: List[str], g2p_module, topn: int = 200) ->
 
     logger.debug(f"Got these spans as candidates for ASR-aware entity linking: {spans}")
 
-    span2entsim = defaultdict(lambda: defaultdict(dict))
-
     # filter out spans that are substrings of other spans
     spans_for_query = [span for span in spans if len([x for x in span.split() if x in DONT_LINK_WORDS]) / len(span.split()) < .67]
 
@@ -61,56 +93,66 @@ def get_asr_aware_span2entsim(spans: List[str], g2p_module, topn: int = 200) ->
 
     if len(spans_for_query) == 0:
         # nothing to do here!
-        return span2entsim
+        return defaultdict(lambda: defaultdict(dict))
 
-    logger.info(f"Querying phonetic index with spans: {spans_for_query}")
-    query_from_span_metaphone = lambda span: {'match': {'phonemes': {'query': doublemetaphone(span)[0], 'fuzziness': 2}}}
-    query_from_span = lambda span: {'match_phrase': {'phonemes_stressless': {'query': remove_stress(span_to_phoneme_string(span)), 'slop': 10}}}
-    query = {'query': {'dis_max': {'queries': [query_from_span_metaphone(span) for span in spans_for_query]}}}
-    search_results = query_es_index(es, PHONE_TO_ENT_INDEX, query, size=topn, timeout=ES_QUERY_TIMEOUT)  # list of dicts
+    sources = search_anchortexts(spans_for_query, topn)
 
     # filter out spans that weren't part of the query
     spans = [s for s in spans if any(s in s1 for s1 in spans_for_query)]
-    # precompute latticies for efficiency
-    spans_latticies = [(s, span_to_lattice(s, g2p_module), [[' '.join(x) for x in doublemetaphone(s) if len(x) > 0]]) for s in spans]
+    span2entsim = match_anchortexts_to_spans(spans, sources, g2p_module)
+
+    # Log
+    logger.debug("Got these phonetically-corrected potential entity candidates:\n{}".format('\n'.join(
+        [f"'{span}' -> {entinfo}" for span, entinfo in span2entsim.items()]
+    )))
+
+    return span2entsim
 
-    # For each retrieved anchortext
-    for hit in search_results:
+
+@lru_cache(maxsize=32768)
+def get_metaphone_lattice(span: str) -> List[List[str]]:
+    return [[' '.join(x) for x in doublemetaphone(span) if len(x) > 0]]
+
+
+def match_anchortexts_to_spans(spans: List[str], sources: List[dict], g2p_module) -> Dict[str, Dict[str, Dict]]:
+    """
+    For each anchortext retrieved from the PHONE_TO_ENT_INDEX, finds the most phonetically similar span in spans, and if
+    it's similar enough, adds the anchortext and its entities to that span's ent2sim dict (see get_asr_aware_span2entsim).
+
+    @param sources: the '_source' of each hit, in the order they were retrieved
+    """
+    span2entsim = defaultdict(lambda: defaultdict(dict))
+    if not spans or not sources:
+        return span2entsim
+
+    # Score every (span, anchortext) pair at once. The phonemes of each anchortext are stored in the index.
+    ratios = get_lattice_similarities([span_to_lattice(span, g2p_module) for span in spans],
+                                      [[[source['phonemes_stressless']]] for source in sources],
+                                      threshold=SIMILARITY_RATIO_THRESHOLD, ignore_stress=True)
+    metaphone_ratios = get_lattice_similarities([get_metaphone_lattice(span) for span in spans],
+                                                [get_metaphone_lattice(source['span']) for source in sources],
+                                                threshold=SIMILARITY_RATIO_THRESHOLD)
+    ratios = metaphone_ratios * .25 + ratios * .75
+
+    # For each retrieved anchortext, utt_span is the most phonetically similar span (the first, if there's a tie)
+    for source, utt_span_idx, max_ratio in zip(sources, ratios.argmax(axis=0), ratios.max(axis=0)):
+        if max_ratio < SIMILARITY_RATIO_THRESHOLD:
+            continue
 
         # Get the anchortext and its possible entities along with their refcounts
-        source = hit['_source']
         # anchortext = make_text_like_user_text(source['span'])  # remove punc in the same way as user text so that spans match anchortexts correctly. assuming the anchortexts are the same in the phonetic ES index and the articles ES index, this shouldn't be necessary because it was already applied to the anchortexts in the articles index.
         anchortext = source['span']
         candidate_entities = json.loads(source['entities'])
+        utt_span = spans[utt_span_idx]
 
-        # Find utt_span, the most phonetically similar span in spans, above a threshold
-        anchortext_lattice = [[source['phonemes_stressless']]]
-        anchortext_metaphone = [[' '.join(x) for x in doublemetaphone(anchortext) if len(x) > 0]]
-        utt_span = None
-        max_ratio = -1
-        for span, lattice, metaphone_lattice in spans_latticies:
-            ratio = get_lattice_similarity(lattice, anchortext_lattice, threshold=SIMILARITY_RATIO_THRESHOLD, ignore_stress=True)
-            metaphone_ratio = get_lattice_similarity(metaphone_lattice, anchortext_metaphone, threshold=SIMILARITY_RATIO_THRESHOLD)
-            ratio = metaphone_ratio * .25 + ratio * .75
-            if ratio > max_ratio:
-                max_ratio = ratio
-                utt_span = span
-        if max_ratio < SIMILARITY_RATIO_THRESHOLD:
-            continue
-
-        span2entsim[utt_span][anchortext]['similarity'] = max_ratio
+        span2entsim[utt_span][anchortext]['similarity'] = float(max_ratio)
         if 'entnames' not in span2entsim[utt_span][anchortext]:
             span2entsim[utt_span][anchortext]['entnames'] = set(candidate_entities)
         else:
             span2entsim[utt_span][anchortext]['entnames'].update(candidate_entities)
-
-    # Log
-    logger.debug("Got these phonetically-corrected potential entity candidates:\n{}".format('\n'.join(
-        [f"'{span}' -> {entinfo}" for span, entinfo in span2entsim.items()]
-    )))
-
     return span2entsim
 
+
 if __name__ == "__main__":
 
     # Run this to demo
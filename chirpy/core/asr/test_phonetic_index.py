@@ -0,0 +1,79 @@
+"""
+Tests for the PhoneticIndex file format: build an index from a few documents and search it
+
+Run:
+    python -m unittest -v chirpy/core/asr/test_phonetic_index.py
+"""
+
+import os
+import struct
+import tempfile
+import unittest
+
+from chirpy.core.asr.phonetic_index import INDEX_FILENAME, MAX_KEY_LEN, VERSION, PhoneticIndex, build_index
+
+ITEMS = [
+    {'span': 'cat', 'phonemes': ['KT'], 'entities': ['Cat']},
+    {'span': 'cats', 'phonemes': ['KTS', 'XTS'], 'entities': ['Cat', 'Cats (musical)']},
+    {'span': 'kate', 'phonemes': ['kt'], 'entities': ['Kate Bush']},
+    {'span': 'dog', 'phonemes': ['TK', ''], 'entities': ['Dog']},
+    {'span': 'a very long anchortext', 'phonemes': ['ARLNKNXRTKSTARLNKNXRTKSTARLNKNXRTKST'], 'entities': ['Long']},
+]
+
+
+class TestPhoneticIndex(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.index_dir = tmp_dir.name
+        self.assertEqual(build_index(iter(ITEMS), self.index_dir), (len(ITEMS), 5))
+
+    def open_index(self) -> PhoneticIndex:
+        index = PhoneticIndex(self.index_dir)
+        self.addCleanup(index.close)
+        return index
+
+    def test_round_trip(self):
+        index = self.open_index()
+        self.assertEqual([index.get_record(i) for i in range(len(ITEMS))], ITEMS)
+        self.assertEqual([index.get_num_keys(i) for i in range(len(ITEMS))], [1, 2, 1, 1, 1])
+        keys = [index.get_key(i) for i in range(index.num_keys)]
+        self.assertEqual(keys, ['KT', 'TK', 'KTS', 'XTS', ITEMS[4]['phonemes'][0][:MAX_KEY_LEN]])
+        self.assertEqual(index.get_postings(keys.index('KT')), (0, 2))
+        self.assertEqual(index.get_postings(keys.index('XTS')), (1,))
+
+    def test_search(self):
+        index = self.open_index()
+        self.assertEqual([record['span'] for record in index.search(['KT'], size=10, max_distance=0)], ['cat', 'kate'])
+        # Closest first, and among equally close documents, those with fewer keys first
+        self.assertEqual([record['span'] for record in index.search(['KT'], size=10, max_distance=1)],
+                         ['cat', 'kate', 'cats'])
+        self.assertEqual([record['span'] for record in index.search(['KT'], size=1, max_distance=1)], ['cat'])
+        self.assertEqual([record['span'] for record in index.search(['XT', 'TK'], size=10, max_distance=1)],
+                         ['dog', 'cat', 'kate', 'cats'])
+        self.assertEqual([record['span'] for record in index.search([ITEMS[4]['phonemes'][0]], size=10)],
+                         ['a very long anchortext'])
+
+    def test_missing_key(self):
+        index = self.open_index()
+        self.assertEqual(index.find_keys('PLMNR'), [])
+        self.assertEqual(index.find_keys('ÑÑ', max_distance=1), [])
+        self.assertEqual(index.search(['PLMNR', ''], size=10), [])
+
+    def test_bad_magic(self):
+        with open(os.path.join(self.index_dir, INDEX_FILENAME), 'r+b') as f:
+            f.write(b'NOTCHIRP')
+        with self.assertRaises(ValueError):
+            PhoneticIndex(self.index_dir)
+
+    def test_bad_version(self):
+        with open(os.path.join(self.index_dir, INDEX_FILENAME), 'r+b') as f:
+            f.seek(8)
+            f.write(struct.pack('<I', VERSION + 1))
+        with self.assertRaises(ValueError):
+            PhoneticIndex(self.index_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,22 @@
+import asyncio
+import contextvars
+import copy
+import functools
 import json
 import time
 import logging
 import os
 from concurrent import futures
 from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from dataclasses import dataclass
 from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 
 from chirpy.core import flags
-from typing import Dict, List, Optional, Set
+from typing import Callable, Dict, List, Optional, Set
 from datetime import datetime
 
 from chirpy.core.test_args import TestArgs
@@ -17,6 +24,7 @@ from chirpy.core.response_priority import ResponsePriority, PromptType
 from chirpy.core.response_generator_datatypes import KILLED_RESULT
 from chirpy.core.state_manager import StateManager
 from chirpy.core.util import run_module, killable
+from chirpy.core.latency import span
 
 import sys
 import traceback
@@ -25,12 +33,181 @@ import threading
 logger = logging.getLogger('chirpylogger')
 
 CHIRPY_HOME = os.environ.get('CHIRPY_HOME', Path(__file__).parent.parent.parent)
+
+# Max number of worker threads in each phase's shared executor (see get_executor)
+EXECUTOR_MAX_WORKERS = int(os.environ.get('CHIRPY_EXECUTOR_MAX_WORKERS', 32))
+
+# Connection pool settings for the per-url sessions used by RemoteCallable (see get_session)
+REMOTE_POOL_SIZE = int(os.environ.get('CHIRPY_REMOTE_POOL_SIZE', 32))  # max connections kept open per url
+REMOTE_KEEP_ALIVE = os.environ.get('CHIRPY_REMOTE_KEEP_ALIVE', '1') != '0'  # if False, close the connection after each call
+REMOTE_MAX_RETRIES = int(os.environ.get('CHIRPY_REMOTE_MAX_RETRIES', 1))  # retries on refused connections (see post_with_retries)
+REMOTE_BACKOFF_FACTOR = float(os.environ.get('CHIRPY_REMOTE_BACKOFF_FACTOR', 0.05))  # seconds, doubled for each retry
+
+# Max number of list items (e.g. dialogact instances) sent in one batched request (see MicroBatcher)
+MAX_BATCH_SIZE = int(os.environ.get('CHIRPY_MAX_BATCH_SIZE', 32))
+
 def get_url(name):
     url = os.environ.get(f'{name}_URL', f"{name}_URL")
     logger.debug(f"For callable: {name} got remote url: {url}")
     return url
 
 
+# Dictionary from url to the requests.Session used for all RemoteCallables calling that url
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+def get_session(url: str) -> requests.Session:
+    """
+    Returns the process-wide requests.Session for url, creating it on first use.
+    The session keeps a pool of up to REMOTE_POOL_SIZE keep-alive connections, so that each call doesn't need to open
+    a new TCP connection. The session itself never retries; see post_with_retries.
+    """
+    with _sessions_lock:
+        if url not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=REMOTE_POOL_SIZE, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'content-type': 'application/json',
+                                    'connection': 'keep-alive' if REMOTE_KEEP_ALIVE else 'close'})
+            _sessions[url] = session
+        return _sessions[url]
+
+def post_with_retries(url: str, data: str, timeout: float) -> requests.Response:
+    """
+    POSTs data to url with the pooled session for url. If the connection is refused (so the request was never sent),
+    it is retried up to REMOTE_MAX_RETRIES times with exponential backoff. All the attempts and backoffs share one
+    deadline, timeout seconds from now, so a call takes no longer than a single attempt with the same timeout would.
+    Timeouts, dropped connections and error responses are never retried, since the request may have been processed.
+    """
+    deadline = time.perf_counter() + timeout
+    attempt = 0
+    while True:
+        try:
+            return get_session(url).post(url, data=data, timeout=max(deadline - time.perf_counter(), 0.001))
+        except requests.exceptions.ConnectionError as e:
+            refused = isinstance(getattr(e.args[0] if e.args else None, 'reason', None), NewConnectionError)
+            backoff = REMOTE_BACKOFF_FACTOR * 2 ** attempt
+            if not refused or attempt >= REMOTE_MAX_RETRIES or time.perf_counter() + backoff >= deadline:
+                raise
+        time.sleep(backoff)
+        attempt += 1
+
+def close_sessions():
+    """Closes all the pooled sessions. Any later call to get_session creates a fresh one."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+class _Batch:
+    """The calls that are merged into one request by MicroBatcher"""
+    def __init__(self, input_data: dict, list_key: str):
+        self.input_data = input_data  # the shared (non-list) part of the callers' input_data
+        self.list_key = list_key
+        self.items = []
+        self.closed = threading.Event()  # set when the batch is full, or the leader stops waiting for more calls
+        self.done = threading.Event()  # set when the batched request has returned
+        self.output = None
+        self.exception = None
+
+    def add(self, items: List) -> int:
+        """Adds items to the batch and returns their offset"""
+        offset = len(self.items)
+        self.items += items
+        return offset
+
+    def send(self, url: str, timeout: float):
+        try:
+            data = json.dumps({**self.input_data, self.list_key: self.items})
+            response = post_with_retries(url, data, timeout)
+            if not response.ok:
+                response.raise_for_status()
+            self.output = response.json()
+        except Exception as e:
+            self.exception = e
+        finally:
+            self.done.set()
+
+    def get_output(self, offset: int, length: int):
+        """
+        Returns the part of the batched output for the call whose items start at offset.
+        Lists in the output that are as long as the batch are sliced; all other values are shared.
+        """
+        if self.exception is not None:
+            raise self.exception
+        if not isinstance(self.output, dict):
+            return self.output
+        return {k: v[offset:offset + length] if isinstance(v, list) and len(v) == len(self.items) else v
+                for k, v in self.output.items()}
+
+
+class MicroBatcher:
+    """
+    Merges concurrent calls to the same url (typically from different sessions in a multi-session server) into one
+    request. This works for remote modules whose input_data contains a list (under list_key) that is processed
+    item-by-item, and whose output contains lists in the same order, e.g. dialogact's 'instances'.
+
+    Calls can only be merged if the rest of their input_data is identical. The first call in a batch waits up to
+    flags.request_batching_window seconds for others to join, then sends the batch and hands each caller its slice
+    of the output.
+    """
+    def __init__(self, url: str, list_key: str, max_batch_size: int = MAX_BATCH_SIZE):
+        self.url = url
+        self.list_key = list_key
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._open_batches: Dict[str, _Batch] = {}  # from serialized shared input_data to the batch accepting calls
+        self._num_calls = 0
+        self._num_batches = 0
+
+    def __call__(self, input_data: dict, timeout: float):
+        items = input_data[self.list_key]
+        shared_input_data = {k: v for k, v in input_data.items() if k != self.list_key}
+        key = json.dumps(shared_input_data, sort_keys=True)
+        with self._lock:
+            self._num_calls += 1
+            batch = self._open_batches.get(key)
+            is_leader = batch is None
+            if is_leader:
+                batch = _Batch(shared_input_data, self.list_key)
+                self._open_batches[key] = batch
+                self._num_batches += 1
+            offset = batch.add(items)
+            if len(batch.items) >= self.max_batch_size:
+                del self._open_batches[key]
+                batch.closed.set()
+
+        if is_leader:
+            batch.closed.wait(flags.request_batching_window)
+            with self._lock:
+                if self._open_batches.get(key) is batch:
+                    del self._open_batches[key]
+            logger.info(f'MicroBatcher for {self.url} sending {len(batch.items)} {self.list_key} in one request')
+            batch.send(self.url, timeout)
+        elif not batch.done.wait(timeout + flags.request_batching_window):
+            raise requests.exceptions.Timeout(f'Timed out waiting for batched request to {self.url}')
+        return batch.get_output(offset, len(items))
+
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return {'calls': self._num_calls, 'batches': self._num_batches}
+
+
+# Dictionary from url to the MicroBatcher for that url
+_batchers: Dict[str, MicroBatcher] = {}
+_batchers_lock = threading.Lock()
+
+def get_batcher(url: str, list_key: str) -> MicroBatcher:
+    """Returns the process-wide MicroBatcher for url, creating it on first use"""
+    with _batchers_lock:
+        if url not in _batchers:
+            _batchers[url] = MicroBatcher(url, list_key)
+        return _batchers[url]
+
+
 class RemoteCallableError(Exception):
     def __init__(self, message: str):
         logger.error(message)
@@ -40,25 +217,27 @@ class NamedCallable:
     name = None
 
 class RemoteCallable(NamedCallable):
+    # If the remote module takes a list of items under this key and returns lists in the same order, concurrent calls
+    # can be merged into one request when flags.request_batching_window > 0 (see MicroBatcher)
+    batch_list_key = None
+
     def __init__(self,  url: str, timeout: float = flags.inf_timeout):
         self.url = url
         self.timeout = timeout if flags.use_timeouts else flags.inf_timeout
 
-        # Are we running in a killable thread?
-        self.thread = threading.currentThread()
-        val = getattr(self.thread, "killable", None)
-        self.killable = getattr(self.thread, "killable", False)
-        if self.killable:
-            logger.primary_info(f"RemoteCallable {self.name} running in a killable thread.")
-
-
     def default_fn(self, input_data):
         return None
 
     @killable
     def client_fn(self, data):
         try:
-            return requests.post(self.url, data=data, headers={'content-type': 'application/json'}, timeout=self.timeout)
+            if self.batch_list_key is not None and flags.request_batching_window > 0:
+                input_data = json.loads(data)
+                if input_data.get(self.batch_list_key):
+                    with span(f'{self.name}.batched_request'):
+                        return get_batcher(self.url, self.batch_list_key)(input_data, self.timeout)
+            with span(f'{self.name}.request'):
+                return post_with_retries(self.url, data, self.timeout)
         except RemoteCallableError:
             return self.default_fn(data)
         except requests.exceptions.Timeout as e:
@@ -118,6 +297,122 @@ class RemoteCallable(NamedCallable):
             logger.error(f"RemoteCallable {self.name} threw an error when called with {input_data}", exc_info=True)
             return None
 
+    # The thread and killable state are those of the call, not of whoever constructed the callable: annotators are
+    # constructed once and copied for each turn (see AnnotationPipeline), and run on shared executor threads whose
+    # killable attribute is set per task from its CallContext (see SharedExecutor). Defined after the methods, since
+    # they would shadow the @killable decorator in the class body.
+    @property
+    def thread(self) -> threading.Thread:
+        """The thread this callable is being called from"""
+        return threading.current_thread()
+
+    @property
+    def killable(self) -> bool:
+        """Are we running in a killable thread?"""
+        return getattr(threading.current_thread(), "killable", False)
+
+
+class CallContext:
+    """
+    Cancellation flag and deadline shared by all the tasks submitted by one run_multithreaded / run_multithreaded_DAG
+    call. Worker threads see it through their killable and isKilled attributes, which the @killable decorator checks.
+    """
+    def __init__(self, killable: bool, timeout: Optional[float] = None):
+        self.killable = killable
+        self.deadline = None if timeout is None else time.perf_counter() + timeout
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def is_killed(self) -> bool:
+        return self.cancelled or (self.deadline is not None and time.perf_counter() > self.deadline)
+
+
+class SharedExecutor:
+    """
+    A long-lived, bounded ThreadPoolExecutor that is reused across turns (and sessions), instead of creating a new
+    ThreadPoolExecutor per call. Since worker threads are reused, the killable / isKilled thread attributes are set
+    per task (from the task's CallContext) rather than in a thread initializer.
+    """
+    def __init__(self, name: str, max_workers: int = EXECUTOR_MAX_WORKERS):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'chirpy-{name}')
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._submitted = 0
+        self._completed = 0
+
+    def submit(self, context: CallContext, fn, *args, **kwargs) -> futures.Future:
+        with self._lock:
+            self._queued += 1
+            self._submitted += 1
+        # Run in a copy of the submitter's context, so the task sees its trace (see chirpy.core.latency)
+        future = self._executor.submit(contextvars.copy_context().run, self._run, context, fn, args, kwargs)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _run(self, context: CallContext, fn, args, kwargs):
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        thread = threading.current_thread()
+        thread.killable = context.killable
+        thread.isKilled = context.is_killed
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            thread.killable = False
+            thread.isKilled = False
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+
+    def _on_done(self, future: futures.Future):
+        # Futures cancelled while still queued never reach _run
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return {'queue_depth': self._queued, 'active_workers': self._active, 'max_workers': self.max_workers,
+                    'submitted': self._submitted, 'completed': self._completed}
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+# Dictionary from phase name (the function being run, e.g. 'get_response' or 'execute') to its SharedExecutor.
+# Each phase has its own pool so that e.g. RGs waiting on the blenderbot annotator's future can't starve it of workers.
+_executors: Dict[str, SharedExecutor] = {}
+_executors_lock = threading.Lock()
+
+def get_executor(phase: str) -> SharedExecutor:
+    """Returns the process-wide SharedExecutor for phase, creating it on first use"""
+    with _executors_lock:
+        if phase not in _executors:
+            logger.debug(f'Initializing SharedExecutor for phase={phase} with max_workers={EXECUTOR_MAX_WORKERS}')
+            _executors[phase] = SharedExecutor(phase)
+        return _executors[phase]
+
+def get_executor_metrics() -> Dict[str, Dict[str, int]]:
+    """Returns queue depth, active workers etc for each phase's SharedExecutor"""
+    with _executors_lock:
+        executors = list(_executors.values())
+    return {executor.name: executor.metrics() for executor in executors}
+
+def shutdown_executors(wait: bool = True):
+    """Shuts down all the SharedExecutors. Any later call to get_executor creates a fresh one."""
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait)
+
+
 class ResponseGenerators:
     def __init__(self,  state_manager: StateManager, rg_classes):
         self.name_to_class = {rg_class.name: rg_class for rg_class in rg_classes}
@@ -130,8 +425,26 @@ class ResponseGenerators:
                           kwargs_list: Optional[List[Dict]]=None,
                           priority_modules: List[str]=[]):
         assert set(rg_names).issubset(set(self.name_to_class)), f"{set(rg_names) - set(self.name_to_class)} not found in ResponseGenerators"
-        rg_objs = [self.name_to_class[rg_name](self.state_manager) for rg_name in rg_names]
-        return run_multithreaded(rg_objs, function_name, timeout, args_list, kwargs_list, priority_modules)
+        with span(f'ResponseGenerators.{function_name}'):
+            rg_objs = [self.name_to_class[rg_name](self.state_manager) for rg_name in rg_names]
+            return run_multithreaded(rg_objs, function_name, timeout, args_list, kwargs_list, priority_modules)
+
+    def prefetch(self, rg_names: List[str]):
+        """
+        Runs the prefetch function of each of rg_names on the shared 'prefetch' executor, without waiting for it.
+        Should only be called once the turn's state won't change anymore.
+        """
+        executor = get_executor('prefetch')
+        for rg_name in rg_names:
+            if rg_name in self.name_to_class:
+                executor.submit(CallContext(killable=False), run_prefetch, self.name_to_class[rg_name], self.state_manager)
+
+def run_prefetch(rg_class, state_manager: StateManager):
+    """Runs rg_class's prefetch function for the turn of state_manager, logging (rather than raising) any error"""
+    try:
+        rg_class(state_manager).prefetch()
+    except Exception:
+        logger.error(f"{rg_class.name} failed to prefetch", exc_info=True)
 
 def run_multithreaded(module_instance: List[NamedCallable],
                       function_name:str,
@@ -140,27 +453,15 @@ def run_multithreaded(module_instance: List[NamedCallable],
                       kwargs_list: Optional[List[Dict]]=None,
                       priority_modules: List[str]=None):
     start = datetime.now()
-    # Can't use a context manager (with .. as ..) because
-    # it will ensure termination of running threads even when they
-    # exceed desired timeout
-    max_workers = len(module_instance)
-    if max_workers == 0:
+    if len(module_instance) == 0:
         return {}
 
     should_kill = (function_name in ('get_response')) # We only kill get_response
 
-    done = False
-    is_done = lambda: done
-
-    threads = {}
-
-    # Technically this only gets called once per thread, but |threads| = |workers| so it's ok
-    def initializer(killable : bool):
-        threading.currentThread().killable = killable
-        threading.currentThread().isKilled = is_done
-
-
-    executor = ThreadPoolExecutor(max_workers=max_workers, initializer=initializer, initargs=(should_kill,))
+    # Tasks run on the long-lived executor for this phase. Killable tasks stop waiting on remote calls once the
+    # context is cancelled (see below) or its deadline has passed.
+    context = CallContext(killable=should_kill, timeout=timeout)
+    executor = get_executor(function_name)
     result = {}
     if args_list is None:
         args_list = [[] for _ in module_instance]
@@ -185,7 +486,7 @@ def run_multithreaded(module_instance: List[NamedCallable],
 
     if function_name == 'get_entity':
         logger.primary_info(f"Args are: {args_list}")
-    future_to_module_name = {executor.submit(run_module, module, function_name, args, kwargs): module.name
+    future_to_module_name = {executor.submit(context, run_module, module, function_name, args, kwargs): module.name
                              for (module, args, kwargs) in zip(module_instance, args_list, kwargs_list)}
     logger.primary_info(f"Future to module name is {future_to_module_name}")
     # if should_kill:
@@ -196,47 +497,52 @@ def run_multithreaded(module_instance: List[NamedCallable],
     good_response = None
 
     # Iterate through the futures, waiting for them to resolve.
-    for i, future in enumerate(futures.as_completed(future_to_module_name, timeout=timeout)):
-        module_name = future_to_module_name[future]
-        #logger.warning(f"Received response for {module_name}")
-        try:
-            future_result = future.result()
-            #logger.warning(f"Received a response from {module_name}: {future_result}")
-            if should_kill:
-                done_futures.append(future)
-                undone_futures.pop(undone_futures.index(module_name))
-                STRONG = [ResponsePriority.STRONG_CONTINUE] # (ResponsePriority.FORCE_START, ResponsePriority.STRONG_CONTINUE)
-                found_good_response = (future_result.priority in STRONG)
-                if found_good_response:
-                    #logger.warning(f"Found a good response from {module_name}: {future_result}, {future_result.priority}, {STRONG}")
-                    good_response = future_result
-            result[module_name] = future_result
-            if good_response is not None and not any(unkillable in undone_futures for unkillable in UNKILLABLES) and (not any(unkillable in undone_futures for unkillable in UNKILLABLE_WITHOUT_NONPROMPTING_RESPONSE) or good_response.needs_prompt == False):
-                for dead_future, dead_future_name in future_to_module_name.items():
-                    if dead_future_name in undone_futures and dead_future_name != 'FALLBACK':
-                        #logger.warning(f"Killing {dead_future_name}")
-                        dead_future.cancel()
-                        result[dead_future_name] = KILLED_RESULT
-                break
-        except requests.exceptions.Timeout:
-            logger.warning(f"Timed out when running module {module_name} with function "
-                           f"{function_name}. So {module_name} will be missing from state.")
-        except Exception:
+    # The timeout is raised by the as_completed iterator, so it is caught around the whole loop
+    try:
+        for i, future in enumerate(futures.as_completed(future_to_module_name, timeout=timeout)):
+            module_name = future_to_module_name[future]
+            #logger.warning(f"Received response for {module_name}")
             try:
-                exception_type, exception_value, tb = sys.exc_info()
-                localized_stacktrace = traceback.extract_tb(tb)[-1]
-                filename, line_number, function_name, text = localized_stacktrace
-                logger.exception(f"Encountered {exception_value.__repr__()} within `{function_name}` at {filename}:{line_number} in `{text}` when running function `{function_name}` of module `{module_name}`")
+                future_result = future.result()
+                #logger.warning(f"Received a response from {module_name}: {future_result}")
+                if should_kill:
+                    done_futures.append(future)
+                    undone_futures.pop(undone_futures.index(module_name))
+                    STRONG = [ResponsePriority.STRONG_CONTINUE] # (ResponsePriority.FORCE_START, ResponsePriority.STRONG_CONTINUE)
+                    found_good_response = (future_result.priority in STRONG)
+                    if found_good_response:
+                        #logger.warning(f"Found a good response from {module_name}: {future_result}, {future_result.priority}, {STRONG}")
+                        good_response = future_result
+                result[module_name] = future_result
+                if good_response is not None and not any(unkillable in undone_futures for unkillable in UNKILLABLES) and (not any(unkillable in undone_futures for unkillable in UNKILLABLE_WITHOUT_NONPROMPTING_RESPONSE) or good_response.needs_prompt == False):
+                    for dead_future, dead_future_name in future_to_module_name.items():
+                        if dead_future_name in undone_futures and dead_future_name != 'FALLBACK':
+                            #logger.warning(f"Killing {dead_future_name}")
+                            dead_future.cancel()
+                            result[dead_future_name] = KILLED_RESULT
+                    # Tell the killed modules that are already running to stop waiting on their remote calls
+                    context.cancel()
+                    break
+            except requests.exceptions.Timeout:
+                logger.warning(f"Timed out when running module {module_name} with function "
+                               f"{function_name}. So {module_name} will be missing from state.")
             except Exception:
-                logger.exception(f"Encountered error when running function `{function_name}` of module `{module_name}`")
-
-        except TimeoutError as e:
-            for future in future_to_module_name:
-                module_name = future_to_module_name[future]
-                if future.running():
-                    logger.error(
-                        f"Timed out when running function {function_name} of module {module_name} with timeout = {timeout} seconds")
-                future.cancel()
+                try:
+                    exception_type, exception_value, tb = sys.exc_info()
+                    localized_stacktrace = traceback.extract_tb(tb)[-1]
+                    filename, line_number, function_name, text = localized_stacktrace
+                    logger.exception(f"Encountered {exception_value.__repr__()} within `{function_name}` at {filename}:{line_number} in `{text}` when running function `{function_name}` of module `{module_name}`")
+                except Exception:
+                    logger.exception(f"Encountered error when running function `{function_name}` of module `{module_name}`")
+    except futures.TimeoutError:
+        # Tell the modules that are still running to stop waiting on their remote calls
+        context.cancel()
+        for future in future_to_module_name:
+            module_name = future_to_module_name[future]
+            if future.running():
+                logger.error(
+                    f"Timed out when running function {function_name} of module {module_name} with timeout = {timeout} seconds")
+            future.cancel()
 
     return result
 
@@ -270,16 +576,62 @@ MODULE_NAMES = {
     "emotionclassifier": "emotion"
 }
 
-def run_multithreaded_DAG(module_instances: List[Annotator],
-                          function_name:str,
-                          timeout: Optional[float]=None,
-                          args_list: Optional[List[List]]=None,
-                          kwargs_list: Optional[List[Dict]]=None):
-    max_workers = len(module_instances)
-    if max_workers == 0:
+# Annotators that the NLP pipeline doesn't wait for. If only these are still running, their futures are saved to the
+# state, and the RGs that need them wait on the future themselves.
+NONBLOCKING_MODULES = {'gpt2ed', 'blenderbot'}
+
+def _wrap_future(future: futures.Future) -> asyncio.Future:
+    """
+    Like asyncio.wrap_future, but cancelling the returned asyncio future does not cancel the underlying
+    concurrent future. That matters for modules whose future is saved to the state after we stop waiting for them.
+    """
+    loop = asyncio.get_running_loop()
+    async_future = loop.create_future()
+
+    def set_result(future):
+        if async_future.done():
+            return
+        if future.cancelled():
+            async_future.cancel()
+        elif future.exception() is not None:
+            async_future.set_exception(future.exception())
+        else:
+            async_future.set_result(future.result())
+
+    def on_done(future):
+        try:
+            loop.call_soon_threadsafe(set_result, future)
+        except RuntimeError:  # the event loop has already been closed
+            pass
+
+    future.add_done_callback(on_done)
+    return async_future
+
+
+async def run_multithreaded_DAG_async(module_instances: List[Annotator],
+                                      function_name:str,
+                                      timeout: Optional[float]=None,
+                                      args_list: Optional[List[List]]=None,
+                                      kwargs_list: Optional[List[Dict]]=None,
+                                      latencies: Optional[Dict[str, float]]=None,
+                                      record_late_latencies: Optional[Callable[[Dict[str, float]], None]]=None):
+    """
+    Run function_name for each module, respecting the dependencies given by each module's input_annotations.
+    Each module gets an asyncio task that awaits the tasks of the modules it depends on, then runs the (blocking)
+    module function on the shared executor for this phase. If any dependency failed, the module fails too.
+    Modules whose dependencies are ready at the same time are submitted in the order of module_instances.
+
+    Returns a dict mapping module name to output. Each output is also saved to the state (see Annotator.save_to_state)
+    as soon as it is available, so that it can be used by subsequent annotators.
+    If latencies is given, it's filled with the time in seconds each module ran for (up to the timeout).
+    NONBLOCKING_MODULES that are still running when we stop waiting aren't in latencies; if record_late_latencies is
+    given, it's called with {module name: latency} when each of them finishes (from the thread that ran it).
+    """
+    latencies = {} if latencies is None else latencies
+    if len(module_instances) == 0:
         return {}
-    logger.debug(f'Initializing ThreadPoolExecutor with max_workers={max_workers}')
-    executor = ThreadPoolExecutor(max_workers=max_workers)
+    context = CallContext(killable=False, timeout=timeout)
+    executor = get_executor(function_name)
     result = {}
     args_list = args_list or [[] for _ in module_instances]
     kwargs_list = kwargs_list or [{} for _ in module_instances]
@@ -290,44 +642,73 @@ def run_multithreaded_DAG(module_instances: List[Annotator],
     # Set of module names which have completely failed
     failed_modules = set()
 
-    # Dictionary from module instances to argument list
-    module_2_args = {module_instance: (args_list, kwargs_list) for module_instance, args_list, kwargs_list in
-                     zip(module_instances, args_list, kwargs_list)}
+    # Dictionary from module name to the future running it on the executor (once it has been submitted)
+    submitted_futures = {}
 
-    # Initialize list of unexecuted module instances with all the modules
-    unexecuted_modules = list(module_2_args.keys())
+    # Dictionary from module name to the asyncio task that waits for its dependencies and then runs it
+    tasks = {}
 
-    # Dictionary from future to module name, initialized to be empty
-    future_to_module = {}
-    begin_time = time.perf_counter_ns()
-    while unexecuted_modules or future_to_module:
-        # Get modules that can be executed
-        executable_modules, unexecuted_modules, failed_modules = \
-            get_ready_callables(succeeded_modules, failed_modules, unexecuted_modules)
+    # Dictionary from module name to the time (time.perf_counter) it was submitted to the executor
+    start_times = {}
 
-        # Schedule executable modules to run
-        future_to_module.update({executor.submit(run_module, module, function_name,
-                                                 module_2_args[module][0],
-                                                 module_2_args[module][1]): module
-                                 for module in executable_modules})
+    async def run(module, args, kwargs):
+        requirements = module.input_annotations
+        dependencies = [tasks[name] for name in requirements if name in tasks]
+        if dependencies:
+            await asyncio.wait(dependencies)
+        if len(set(requirements) - succeeded_modules) > 0:
+            failed_modules.add(module.name)
+            logger.info(f"Failed to execute {module.name} as its module requirements "
+                        f"{set(requirements) - succeeded_modules} failed to execute")
+            return
+        logger.info(f"Ready to execute {module.name} as its module requirements = {requirements} are satisfied")
+        future = executor.submit(context, run_module, module, function_name, args, kwargs)
+        submitted_futures[module.name] = future
+        start_times[module.name] = time.perf_counter()
+        try:
+            future_result = await _wrap_future(future)
+            latencies[module.name] = time.perf_counter() - start_times[module.name]
+            result[module.name] = future_result
+            # Add the result to state_manager so that it can be used by subsequent annotators
+            module.save_to_state(future_result)
+            logger.info(f"Succesfully executed {module.name}")
+            succeeded_modules.add(module.name)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning(f"Failed to execute {module.name}", exc_info=True)
+            failed_modules.add(module.name)
 
-        time_elapsed = ((time.perf_counter_ns() - begin_time) / 1000000000)
-        next_timeout = timeout and timeout - time_elapsed
+    for module, args, kwargs in zip(module_instances, args_list, kwargs_list):
+        tasks[module.name] = asyncio.create_task(run(module, args, kwargs))
+    name_2_module = {module.name: module for module in module_instances}
 
-        remaining_modules = set([m.name for m in future_to_module.values()])
-        logging.info(f"Remaining modules: {remaining_modules}")
-        if remaining_modules.issubset(set(['gpt2ed', 'blenderbot'])):
+    begin_time = time.perf_counter_ns()
+    pending = set(tasks.values())
+    while pending:
+        remaining_modules = {name for name, task in tasks.items() if task in pending}
+        logger.info(f"Remaining modules: {remaining_modules}")
+        if remaining_modules.issubset(NONBLOCKING_MODULES) and remaining_modules.issubset(submitted_futures):
             logger.primary_info(f"run_multithreaded_DAG breaking early with {remaining_modules}")
-            for future, module in future_to_module.items():
-                module.save_to_state(future)
+            for module_name in remaining_modules:
+                name_2_module[module_name].save_to_state(submitted_futures[module_name])
+                tasks[module_name].cancel()
+                if record_late_latencies is not None:
+                    submitted_futures[module_name].add_done_callback(
+                        functools.partial(_record_late_latency, record_late_latencies, module_name, start_times[module_name]))
             break
 
+        time_elapsed = ((time.perf_counter_ns() - begin_time) / 1000000000)
+        next_timeout = None if timeout is None else timeout - time_elapsed
+
         # If there is no time remaining, get default response for all remaining modules and break out of the loop
-        if next_timeout <= 0:
+        if next_timeout is not None and next_timeout <= 0:
             logger.error(f"NLP pipeline hit overall timeout in {time_elapsed} "
                          f"seconds. ")
 
-            for module in unexecuted_modules + list(future_to_module.values()):
+            for module_name in remaining_modules:
+                tasks[module_name].cancel()
+                module = name_2_module[module_name]
                 module_name = MODULE_NAMES.get(module.name, module.name)
                 try:
                     default_response = module.get_default_response()
@@ -342,32 +723,14 @@ def run_multithreaded_DAG(module_instances: List[Annotator],
                     failed_modules.add(module_name)
 
             # Cancel futures in case they happen to have not been scheduled
-            for future in future_to_module:
-                future.cancel()
-
+            for module_name in remaining_modules & set(submitted_futures):
+                submitted_futures[module_name].cancel()
+                latencies[module_name] = time.perf_counter() - start_times[module_name]
             break
 
-        # Wait till the first future is complete, it'll come as done. If timeout is hit, done is empty
-        done, not_done = futures.wait(future_to_module, timeout=next_timeout, return_when=futures.FIRST_COMPLETED)
-
-        for future in done:
-            # Get the module name and remove it from the list of futures we will wait on in the future
-            module = future_to_module.pop(future)
-            module_name = module.name
-
-            try:
-                future_result = future.result()
-                result[module_name] = future_result
-                # Add the result to state_manager so that it can be used by subsequent annotators
-                module.save_to_state(future_result)
-                logger.info(f"Succesfully executed {module_name}")
-                succeeded_modules.add(module_name)
-            except Exception:
-                logger.warning(f"Failed to execute {module_name}", exc_info=True)
-                failed_modules.add(module_name)
+        # Wait till the first task is complete. If timeout is hit, done is empty
+        done, pending = await asyncio.wait(pending, timeout=next_timeout, return_when=asyncio.FIRST_COMPLETED)
 
-        # set of succeeded and failed modules have been updated.
-        # Repeat the loop and re-evaulate which un-executed modules can be scheduled next
     logger.primary_info("CallModules summary: \n" +
                         (f"MODULES WITH SOME RESPONSE: {', '.join(succeeded_modules)}\n"
                          if succeeded_modules else '') +
@@ -377,6 +740,22 @@ def run_multithreaded_DAG(module_instances: List[Annotator],
     return result
 
 
+def _record_late_latency(record_late_latencies: Callable[[Dict[str, float]], None], module_name: str,
+                         start_time: float, future: futures.Future):
+    """Done callback for the future of a module run_multithreaded_DAG_async stopped waiting for"""
+    if not future.cancelled() and future.exception() is None:
+        record_late_latencies({module_name: time.perf_counter() - start_time})
+
+
+def run_multithreaded_DAG(module_instances: List[Annotator],
+                          function_name:str,
+                          timeout: Optional[float]=None,
+                          args_list: Optional[List[List]]=None,
+                          kwargs_list: Optional[List[Dict]]=None):
+    """Blocking wrapper around run_multithreaded_DAG_async, for callers that aren't running in an event loop"""
+    return asyncio.run(run_multithreaded_DAG_async(module_instances, function_name, timeout, args_list, kwargs_list))
+
+
 def get_ready_callables(succeeded_modules: Set[str], failed_modules: Set[str], unexecuted_modules: List[Annotator]):
     """ Get unexecuted modules which can be executed, based on whether their requirements are satisfied.
         If their requirements have failed, then add them to failed modules as well.
@@ -409,27 +788,165 @@ def get_ready_callables(succeeded_modules: Set[str], failed_modules: Set[str], u
     return executable_modules, unexecutable_modules, failed_modules
 
 
+def get_topological_order(annotators: List[Annotator]) -> List[Annotator]:
+    """
+    Check that every annotator's input_annotations exist and don't form a cycle, and return the annotators ordered so
+    that each one comes after all of its input_annotations (ties keep their original order).
+    """
+    name_2_annotators = {a.name: a for a in annotators}
+    for annotator in annotators:
+        dependencies = annotator.input_annotations
+        unmet_dependencies = set(dependencies) - set(name_2_annotators)
+        if len(unmet_dependencies) > 0:
+            raise Exception(f"Input annotators ({unmet_dependencies}) for annotator {annotator.name} do not exist in "
+                            f"Annotators")
+
+    ordered = []
+    ordered_names = set()
+    unordered = list(annotators)
+    while unordered:
+        ready = [a for a in unordered if set(a.input_annotations) <= ordered_names]
+        if not ready:
+            raise Exception(f"Input annotators of {[a.name for a in unordered]} form a cyclic dependency")
+        ordered += ready
+        ordered_names |= {a.name for a in ready}
+        unordered = [a for a in unordered if a.name not in ordered_names]
+    return ordered
+
+
+class LatencyHistory:
+    """Exponentially weighted moving average of each module's latency (in seconds) across turns. Thread-safe."""
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, float] = {}
+
+    def update(self, latencies: Dict[str, float]):
+        with self._lock:
+            for name, latency in latencies.items():
+                previous = self._latencies.get(name)
+                self._latencies[name] = latency if previous is None else (1 - self.alpha) * previous + self.alpha * latency
+
+    def get(self, name: str, default: float) -> float:
+        with self._lock:
+            return self._latencies.get(name, default)
+
+# Latencies of the annotators, shared by all the AnnotationPipelines in this process
+annotator_latency_history = LatencyHistory()
+
+
+@dataclass
+class AnnotatorSchedule:
+    """Where an annotator sits in the NLP pipeline, given the current latency estimates (all times in seconds)"""
+    level: int  # 0 if the annotator has no input_annotations, else 1 + the max level of its input_annotations
+    latency: float  # estimated latency of the annotator
+    earliest_start: float  # longest path from the start of the pipeline to the start of this annotator
+    longest_chain: float  # longest path from the start of this annotator to the end of the pipeline
+    slack: float  # how much slower this annotator could be without making the whole pipeline slower
+
+    @property
+    def on_critical_path(self) -> bool:
+        return self.slack <= 1e-9
+
+
+class AnnotationPipeline:
+    """
+    The annotator wiring that doesn't change from turn to turn. The dependency graph is validated, put in
+    topological order and split into levels once, when the pipeline is created; each turn then just binds the
+    state_manager with bind(). The pipeline itself holds no per-turn state, so one instance can be shared by
+    concurrent turns.
+
+    Each turn's annotator latencies are recorded in annotator_latency_history. These estimates give each annotator's
+    critical path and slack (see get_schedule), and annotators heading the longest chains are dispatched first.
+    """
+    def __init__(self, annotator_classes: List[type], timeout: float, latency_history: LatencyHistory = annotator_latency_history):
+        # Instances without a state_manager, used to read each annotator's name and input_annotations, and copied
+        # for each turn
+        self.prototypes = get_topological_order([annotator_class(None) for annotator_class in annotator_classes])
+        self.timeout = timeout
+        self.latency_history = latency_history
+
+        self.levels = {}
+        for annotator in self.prototypes:
+            self.levels[annotator.name] = 1 + max((self.levels[name] for name in annotator.input_annotations), default=-1)
+        self.dependents = {annotator.name: [a.name for a in self.prototypes if annotator.name in a.input_annotations]
+                           for annotator in self.prototypes}
+
+    def get_schedule(self) -> Dict[str, AnnotatorSchedule]:
+        """
+        Returns the AnnotatorSchedule for each annotator, based on the latencies in self.latency_history.
+        Annotators that haven't run yet are assumed to take their whole timeout.
+        """
+        latencies = {a.name: self.latency_history.get(a.name, default=a.timeout) for a in self.prototypes}
+        earliest_start = {}
+        for annotator in self.prototypes:
+            earliest_start[annotator.name] = max((earliest_start[name] + latencies[name]
+                                                  for name in annotator.input_annotations), default=0)
+        longest_chain = {}
+        for annotator in reversed(self.prototypes):
+            longest_chain[annotator.name] = latencies[annotator.name] + max(
+                (longest_chain[name] for name in self.dependents[annotator.name]), default=0)
+        total = max(longest_chain.values(), default=0)
+        return {a.name: AnnotatorSchedule(level=self.levels[a.name], latency=latencies[a.name],
+                                          earliest_start=earliest_start[a.name],
+                                          longest_chain=longest_chain[a.name],
+                                          slack=total - earliest_start[a.name] - longest_chain[a.name])
+                for a in self.prototypes}
+
+    def get_critical_path(self, schedule: Optional[Dict[str, AnnotatorSchedule]] = None) -> List[str]:
+        """Returns the names of the annotators on the longest dependency chain, in order"""
+        schedule = schedule or self.get_schedule()
+        path = []
+        candidates = [a.name for a in self.prototypes if not a.input_annotations]
+        while candidates:
+            name = max(candidates, key=lambda name: schedule[name].longest_chain)
+            path.append(name)
+            candidates = self.dependents[name]
+        return path
+
+    def record_latencies(self, latencies: Dict[str, float]):
+        self.latency_history.update(latencies)
+        schedule = self.get_schedule()
+        critical_path = self.get_critical_path(schedule)
+        logger.info(f"NLP pipeline critical path is {' -> '.join(critical_path)}, estimated to take "
+                    f"{sum(schedule[name].latency for name in critical_path):.3f} of the {self.timeout} second timeout. "
+                    f"Annotator slack (seconds): " +
+                    ', '.join(f'{name}={s.slack:.3f}' for name, s in sorted(schedule.items(), key=lambda x: x[1].slack)))
+
+    def bind(self, state_manager: StateManager) -> 'AnnotationDAG':
+        # Annotators heading the longest chains go first, so they get workers first when several are ready at once
+        schedule = self.get_schedule()
+        annotators = []
+        for prototype in sorted(self.prototypes, key=lambda a: -schedule[a.name].longest_chain):
+            annotator = copy.copy(prototype)
+            annotator.state_manager = state_manager
+            annotators.append(annotator)
+        return AnnotationDAG(state_manager, annotators, self.timeout, validate=False, pipeline=self)
+
+
 class AnnotationDAG:
-    def __init__(self, state_manager: StateManager, annotators: List[Annotator], timeout: float):
+    def __init__(self, state_manager: StateManager, annotators: List[Annotator], timeout: float, validate: bool = True,
+                 pipeline: Optional[AnnotationPipeline] = None):
+        """
+        If validate is False, annotators should already have been checked with get_topological_order (as
+        AnnotationPipeline does). If pipeline is given, the annotators' latencies are recorded in it after each run.
+        """
         self.name_2_annotators = {a.name: a for a in annotators}
-
-        for annotator in annotators:
-            dependencies = annotator.input_annotations
-            unmet_dependencies = set(dependencies) - set(self.name_2_annotators)
-            if len(unmet_dependencies) > 0:
-                raise Exception(f"Input annotators ({unmet_dependencies}) for annotator {annotator.name} do not exist in "
-                                f"Annotators")
-        self.annotators = annotators
+        self.annotators = get_topological_order(annotators) if validate else annotators
         self.state_manager = state_manager
         self.timeout = timeout
+        self.pipeline = pipeline
+
+    async def run_async(self, last_state=None):
+        latencies = {}
+        with span('NLPPipeline'):
+            # The nonblocking annotators we stop waiting for record their latencies when they finish
+            result = await run_multithreaded_DAG_async(
+                self.annotators, 'execute', self.timeout, latencies=latencies,
+                record_late_latencies=self.pipeline.latency_history.update if self.pipeline is not None else None)
+        if self.pipeline is not None:
+            self.pipeline.record_latencies(latencies)
+        return result
 
     def run_multithreaded_DAG(self, last_state=None):
-        return run_multithreaded_DAG(self.annotators, 'execute', self.timeout) # high-initiative handlers may require neural responses -- always pre-fetch
-        # We only run the neural annotators if previous RG is NEURAL_CHAT
-        if last_state and (last_state.selected_response_rg == 'NEURAL_CHAT' or (last_state.selected_response_rg == 'LAUNCH' and last_state.turn_num > 0)):
-            return run_multithreaded_DAG(self.annotators, 'execute', self.timeout)
-        else:
-            annotators = list(filter(lambda x: not x.name in ['blenderbot', 'gpt2ed'], self.annotators))
-            return run_multithreaded_DAG(annotators, 'execute', self.timeout)
-
-        # In the future, if required, also check for cyclic dependencies here
+        return asyncio.run(self.run_async(last_state)) # high-initiative handlers may require neural responses -- always pre-fetch
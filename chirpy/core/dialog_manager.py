@@ -1,8 +1,9 @@
+import asyncio
 import copy
 import logging
 from typing import Dict, List, Optional
 
-from chirpy.core.callables import run_multithreaded, ResponseGenerators
+from chirpy.core.callables import run_multithreaded, ResponseGenerators, CallContext, get_executor
 # from chirpy.core.offensive_speech_classifier import OffensiveSpeechClassifier
 from chirpy.core.state_manager import StateManager
 from chirpy.core.priority_ranking_strategy import PriorityRankingStrategy
@@ -105,6 +106,14 @@ class DialogManager:
 
         return utterance, should_end_session
 
+    async def execute_turn_async(self):
+        """
+        Awaitable version of execute_turn. The turn runs on the shared 'execute_turn' executor (the RGs themselves
+        still run in parallel on their phases' executors), so the event loop is free to serve other sessions.
+        """
+        future = get_executor('execute_turn').submit(CallContext(killable=False), self.execute_turn)
+        return await asyncio.wrap_future(future)
+
     def update_entity_tracker_state(self):
         """
         If the last active RG's get_entity function has an updated entity, update the entity tracker's state with it
@@ -1,26 +1,29 @@
+import contextvars
 import logging
+import time
 from concurrent import futures
 from collections import defaultdict
-from typing import List, Dict, Optional, Set
+from typing import Any, Callable, List, Dict, Optional, Set, Tuple
 
 from chirpy.annotators.g2p import NeuralGraphemeToPhoneme
 from chirpy.annotators.neural_entity_linker import NeuralEntityLinker
 from chirpy.core.asr.search_phone_to_ent import get_asr_aware_span2entsim
-from chirpy.core.callables import Annotator
+from chirpy.core.callables import Annotator, CallContext, get_executor
 from chirpy.core.entity_linker.entity_linker_classes import LinkedSpan, EntityLinkerResult, WikiEntity
 from chirpy.core.entity_linker.util import add_all_alternative_spans
 from chirpy.core.entity_linker.resolve_conflicts import comparison_fn_nested_spans, comparison_fn_alternative_spans, \
     resolve_pairwise_conflicts
 from chirpy.core.entity_linker.thresholds import SCORE_THRESHOLD_HIGHPREC, UNIGRAM_FREQ_THRESHOLD
 from chirpy.core.entity_linker.entity_groups import EntityGroup, ENTITY_GROUPS_FOR_EXPECTED_TYPE
-from chirpy.core.entity_linker.wiki_data_fetching import get_entities_by_anchortext, get_entities_by_wiki_name
+from chirpy.core.entity_linker.wiki_data_fetching import get_entities_by_anchortext, get_cached_entities_by_anchortext, \
+    get_entities_by_wiki_name
 from chirpy.core.entity_linker.lists import LOW_PREC_SPANS, MANUAL_SPAN2ENTINFO, DONT_LINK_WORDS, get_unigram_freq
-from chirpy.core.offensive_classifier.offensive_classifier import contains_offensive
+from chirpy.core.offensive_classifier.offensive_classifier import contains_offensive, find_offensive_windows
 from chirpy.core.regex.templates import MyNameIsTemplate
 from chirpy.annotators.navigational_intent.navigational_intent import NavigationalIntentOutput
 from chirpy.core.state_manager import StateManager
-from chirpy.core.util import remove_punc, get_ngrams, filter_and_log, make_text_like_user_text, contains_phrase
-from chirpy.core.latency import measure
+from chirpy.core.util import remove_punc, filter_and_log, make_text_like_user_text, contains_phrase
+from chirpy.core.latency import measure, span as trace_span
 from chirpy.core.flags import USE_ASR_ROBUSTNESS_OVERALL_FLAG
 
 # from functools import lru_cache  # uncomment for eval
@@ -36,6 +39,10 @@ HIGH_PRIORITY_NER_TYPES = ['PERSON', 'LOCATION', 'ORGANIZATION', 'MISC', 'CITY',
 # We attempt to link all ngrams inside the user utterance, up to this maximum
 MAX_NGRAM_TO_LINK = 5
 
+# Deadline (in seconds) for all the fetches in neural_link_spans. EntityLinkerModule times out after 3 seconds, and we'd
+# rather return the LinkedSpans we have by then than nothing.
+NEURAL_LINK_SPANS_TIMEOUT = 2.5
+
 def is_dont_link_word(word: str) -> bool:
     """
     Returns True iff:
@@ -91,6 +98,75 @@ def should_link(span: str, include_common_phrases: bool, relation_annotations: d
     else:
         return True
 
+def get_last_window_starts(windows: List[Tuple[int, int]], num_words: int) -> List[int]:
+    """Returns a list whose jth item is the last start of the (start, end) windows with end <= j, or -1 if there are none"""
+    last_starts = [-1] * (num_words + 1)
+    for start, end in windows:
+        last_starts[end] = max(last_starts[end], start)
+    for j in range(1, num_words + 1):
+        last_starts[j] = max(last_starts[j], last_starts[j - 1])
+    return last_starts
+
+
+class NgramSpanFilter:
+    """
+    Makes the should_link decision for all the ngrams (up to max_ngram words) of an utterance at once.
+
+    The utterance is tokenized once, and each word is flagged once (is_dont_link_word), as are the offensive phrases in
+    the utterance (find_offensive_windows). The decision for each ngram is then derived from prefix counts of those
+    flags, so it takes constant time per ngram rather than re-splitting and re-checking the ngram's words. The decisions
+    are the same as should_link's. The (rare) ngrams that contain a whitelisted phrase, and spans that aren't ngrams of
+    the utterance (e.g. alternative spans), are passed to should_link.
+    """
+
+    def __init__(self, utterance: str, include_common_phrases: bool, max_ngram: int = MAX_NGRAM_TO_LINK):
+        self.include_common_phrases = include_common_phrases
+        words = utterance.split()
+
+        # num_dont_link_words[i] is the number of DONT_LINK_WORDS in words[:i]
+        num_dont_link_words = [0]
+        for word in words:
+            num_dont_link_words.append(num_dont_link_words[-1] + is_dont_link_word(word))
+
+        # last_offensive_start[j] is the last start of an offensive phrase that ends at or before word j, or -1, so the
+        # ngram words[i:j] contains an offensive phrase iff last_offensive_start[j] >= i. Likewise for whitelisted
+        # phrases, whose ngrams we pass to should_link.
+        offensive_windows, whitelisted_windows = find_offensive_windows(utterance)
+        last_offensive_start = get_last_window_starts(offensive_windows, len(words))
+        last_whitelisted_start = get_last_window_starts(whitelisted_windows, len(words))
+
+        # Map each ngram to its decision
+        self.ngram2should_link: Dict[str, bool] = {}
+        for n in range(1, min(len(words), max_ngram) + 1):
+            for i in range(len(words) - n + 1):
+                ngram = ' '.join(words[i:i + n])
+                if ngram in self.ngram2should_link:
+                    continue
+                if ngram in MANUAL_SPAN2ENTINFO:
+                    self.ngram2should_link[ngram] = True
+                elif last_whitelisted_start[i + n] >= i:
+                    self.ngram2should_link[ngram] = should_link(ngram, include_common_phrases, {})
+                elif last_offensive_start[i + n] >= i:
+                    logger.info(f'Span "{ngram}" contains an offensive phrase so will not try to entity link')
+                    self.ngram2should_link[ngram] = False
+                elif num_dont_link_words[i + n] - num_dont_link_words[i] == n:
+                    if n == 1 or not include_common_phrases:
+                        logger.debug(f'Not linking span "{ngram}" because it consists of DONT_LINK_WORDS')
+                    self.ngram2should_link[ngram] = n > 1 and include_common_phrases
+                else:
+                    self.ngram2should_link[ngram] = True
+
+    @property
+    def ngrams(self) -> Set[str]:
+        """All the ngrams of the utterance, up to max_ngram words"""
+        return set(self.ngram2should_link)
+
+    def should_link(self, span: str, relation_annotations: dict) -> bool:
+        if span in self.ngram2should_link:
+            return self.ngram2should_link[span]
+        return should_link(span, self.include_common_phrases, relation_annotations)
+
+
 def is_high_prec(linked_span: LinkedSpan, score_threshold: int, unigram_freq_threshold: int, expected_type: Optional[EntityGroup], last_bot_utterance="") -> bool:
     """
     Returns whether this LinkedSpan should be put in the high precision set or not.
@@ -127,28 +203,74 @@ def sort_linked_spans(linked_spans: Set[LinkedSpan]) -> List[LinkedSpan]:
         ls.top_ent_score,  # then sort by score
     ), reverse=True)
 
-@measure
-def neural_link_spans(user_utterance: str, context: str, use_asr_robustness: bool, spans: Set[str],
-                         altspan2origspan, proper_nouns, ner_span2type, g2p_module, neural_entity_linker):
-    if USE_ASR_ROBUSTNESS_OVERALL_FLAG and use_asr_robustness:
-        try:
-            # Fetch ASR-robust entity info
-            asr_entity_info = get_asr_aware_span2entsim(set([altspan2origspan.get(s, s) for s in spans]), g2p_module)
-            logger.info(f"Fetched ASR entity info: {asr_entity_info}")
-        except Exception as e:
-            logger.error(e)
-            asr_entity_info = dict()
-    else:
-        asr_entity_info = dict()
+def run_stage_graph(stages: Dict[str, Tuple[Callable, Tuple[str, ...]]], timeout: float) -> Dict[str, Any]:
+    """
+    Runs stages, a dict from stage name to (fn, names of the stages it depends on), on the entity linker's
+    SharedExecutor. Stages must be listed after the stages they depend on. Each stage starts as soon as all of its
+    dependencies have finished, and its fn is called with their results (in the order of its dependencies), so
+    independent stages run concurrently. All the stages share one deadline, timeout seconds from now. The time taken
+    by each stage is saved to the current trace as entity_linker.<stage name>.
+
+    Returns a dict from stage name to result for the stages that finished before the deadline. Stages that raised an
+    exception or missed the deadline, and the stages that depend on them, are missing from it.
+    """
+    context = CallContext(killable=False, timeout=timeout)
+    executor = get_executor('entity_linker')
+    results, failed = {}, set()
+    pending = dict(stages)
+    running = {}  # future -> stage name
+    while True:
+        for name, (fn, dependencies) in list(pending.items()):
+            if any(dependency in failed for dependency in dependencies):
+                failed.add(name)
+                del pending[name]
+            elif all(dependency in results for dependency in dependencies):
+                del pending[name]
+                future = executor.submit(context, measure(fn, name=f'entity_linker.{name}'),
+                                         *[results[dependency] for dependency in dependencies])
+                running[future] = name
+        if not running:
+            return results
+        done, _ = futures.wait(running, timeout=max(context.deadline - time.perf_counter(), 0),
+                               return_when=futures.FIRST_COMPLETED)
+        if not done:
+            logger.warning(f'Entity linker stages {sorted(running.values())} did not finish within {timeout} seconds, '
+                           f'so continuing without them and {sorted(pending)}')
+            return results
+        for future in done:
+            name = running.pop(future)
+            try:
+                results[name] = future.result()
+            except Exception:
+                logger.error(f'Entity linker stage {name} failed, so continuing without it', exc_info=True)
+                failed.add(name)
 
-    user_utterance_to_span_set = defaultdict(set)
 
+@measure
+def neural_link_spans(user_utterance: str, context: str, use_asr_robustness: bool, spans: Set[str],
+                         altspan2origspan, proper_nouns, ner_span2type, g2p_module, neural_entity_linker,
+                         timeout: float = NEURAL_LINK_SPANS_TIMEOUT):
+    """
+    Links spans using the neural entity linker. The fetches are run as a small dependency graph (see run_stage_graph):
+
+        neural_el: the neural entity linker's entities for spans
+        anchortext_candidates: the cached WikiEntities with spans among their anchortexts (no query is made)
+        entities: the WikiEntities of neural_el's entities, looking up the ones that aren't anchortext_candidates
+            (after neural_el and anchortext_candidates)
+        asr: phonetically similar anchortexts for spans (get_asr_aware_span2entsim)
+        asr_candidates: the WikiEntities of those anchortexts (after asr)
+        asr_neural_el: the neural entity linker's entities for the phonetically similar anchortexts (after asr)
+        asr_entities: the WikiEntities of asr_neural_el's entities, looking up the ones that aren't asr_candidates
+            (after asr_neural_el and asr_candidates)
+
+    so the WikiEntity lookups overlap the neural entity linker calls, and the ASR branch runs alongside the other. If a
+    stage fails or misses the deadline (timeout seconds), we return the LinkedSpans we got from the others.
+    """
     if not context.endswith('.') and not context.endswith('?'):
         context += '.'
 
-    # Create the list of LinkedSpans
-    linked_spans = set()
-    asr_span2origspan = dict()
+    # Map each context + user utterance (with the span substituted in, for alternative spans) to the spans in it
+    user_utterance_to_span_set = defaultdict(set)
     for span in spans:
         if span in altspan2origspan:
             orig_span = altspan2origspan[span]
@@ -157,33 +279,79 @@ def neural_link_spans(user_utterance: str, context: str, use_asr_robustness: boo
             specific_user_utterance = user_utterance
         user_utterance_to_span_set[(context + ' ' + specific_user_utterance).strip()].add(span)
 
-        if span in asr_entity_info:
-            for asr_span in asr_entity_info[span]:
-                specific_user_utterance = user_utterance.replace(span, asr_span)
-                user_utterance_to_span_set[(context + ' ' + specific_user_utterance).strip()].add(asr_span)
-                asr_span2origspan[asr_span] = span
-
-    output = neural_entity_linker.execute(context=user_utterance_to_span_set.keys(),
-                                          spans=user_utterance_to_span_set.values())
-
-    linked_spans = []
-    result = output.get('result', []) if output is not None else []
-
-    for utterance, span_set in user_utterance_to_span_set.items():
-        for span in span_set:
-            if span in MANUAL_SPAN2ENTINFO:
-                result.append([MANUAL_SPAN2ENTINFO[span].ent_name, 1.0, span])
-
-    if result is None:
-        return []
+    def get_asr_user_utterance_to_span_set(asr_entity_info):
+        """Like user_utterance_to_span_set, for the phonetically similar anchortexts (asr spans) of spans"""
+        asr_user_utterance_to_span_set = defaultdict(set)
+        asr_span2origspan = dict()
+        for span in spans:
+            if span in asr_entity_info:
+                for asr_span in asr_entity_info[span]:
+                    specific_user_utterance = user_utterance.replace(span, asr_span)
+                    utterance = (context + ' ' + specific_user_utterance).strip()
+                    if asr_span not in user_utterance_to_span_set.get(utterance, ()):
+                        asr_user_utterance_to_span_set[utterance].add(asr_span)
+                    asr_span2origspan[asr_span] = span
+        return asr_user_utterance_to_span_set, asr_span2origspan
+
+    def run_neural_entity_linker(utterance_to_span_set):
+        """Returns the neural entity linker's [entity_name, confidence, span]s, plus those of MANUAL_SPAN2ENTINFO"""
+        if not utterance_to_span_set:
+            return []
+        output = neural_entity_linker.execute(context=utterance_to_span_set.keys(), spans=utterance_to_span_set.values())
+        result = list(output.get('result', [])) if output is not None else []
+        for utterance, span_set in utterance_to_span_set.items():
+            for span in span_set:
+                if span in MANUAL_SPAN2ENTINFO:
+                    result.append([MANUAL_SPAN2ENTINFO[span].ent_name, 1.0, span])
+        return result
+
+    def fetch_asr_entity_info():
+        asr_entity_info = get_asr_aware_span2entsim(set([altspan2origspan.get(s, s) for s in spans]), g2p_module)
+        logger.info(f"Fetched ASR entity info: {asr_entity_info}")
+        return asr_entity_info
+
+    def fetch_asr_candidates(asr_entity_info):
+        return get_entities_by_wiki_name([entity_name for anchortext2info in asr_entity_info.values()
+                                          for info in anchortext2info.values() for entity_name in info.get('entnames', [])])
+
+    def fetch_anchortext_candidates():
+        """Returns the cached WikiEntities with any of spans in their anchortexts, without querying for the others"""
+        return {ent.name: ent for ent in get_cached_entities_by_anchortext(list(spans))}
+
+    def fetch_entities(result, candidates):
+        """Returns the WikiEntities of the entity names in result, looking up the ones that aren't in candidates"""
+        entity_names = {entity_name for entity_name, _, _ in result}
+        entity_name_to_entity = {entity_name: candidates[entity_name] for entity_name in entity_names if entity_name in candidates}
+        missing_names = [entity_name for entity_name in entity_names if entity_name not in entity_name_to_entity]
+        logger.info(f'{len(entity_name_to_entity)} of the {len(entity_names)} linked entities were candidates, '
+                    f'looking up the others: {missing_names}')
+        if missing_names:
+            with trace_span('entity_linker.fetch_missing_entities'):  # so the traces show how often the candidates miss
+                entity_name_to_entity.update(get_entities_by_wiki_name(missing_names))
+        return entity_name_to_entity
+
+    stages = {
+        'neural_el': (lambda: run_neural_entity_linker(user_utterance_to_span_set), ()),
+        'anchortext_candidates': (fetch_anchortext_candidates, ()),
+        'entities': (fetch_entities, ('neural_el', 'anchortext_candidates')),
+    }
+    if USE_ASR_ROBUSTNESS_OVERALL_FLAG and use_asr_robustness:
+        stages.update({
+            'asr': (fetch_asr_entity_info, ()),
+            'asr_candidates': (fetch_asr_candidates, ('asr',)),
+            'asr_neural_el': (lambda asr_entity_info: run_neural_entity_linker(
+                get_asr_user_utterance_to_span_set(asr_entity_info)[0]), ('asr',)),
+            'asr_entities': (fetch_entities, ('asr_neural_el', 'asr_candidates')),
+        })
+    results = run_stage_graph(stages, timeout)
+
+    asr_entity_info = results.get('asr', dict())
+    _, asr_span2origspan = get_asr_user_utterance_to_span_set(asr_entity_info)
+    result = results.get('neural_el', []) + results.get('asr_neural_el', [])
+    entity_name_to_entity = {**results.get('entities', {}), **results.get('asr_entities', {})}
 
+    # Create the list of LinkedSpans
     span_to_entityname = defaultdict(list)
-    entity_names = []
-
-    for entity_name, _, _ in result:
-        entity_names.append(entity_name)
-
-    entity_name_to_entity = get_entities_by_wiki_name(entity_names)
     for entity_name, confidence, span in result:
         if entity_name in entity_name_to_entity:
             if span in asr_span2origspan:
@@ -191,6 +359,7 @@ def neural_link_spans(user_utterance: str, context: str, use_asr_robustness: boo
             else:
                 span_to_entityname[span].append((entity_name, confidence))
 
+    linked_spans = []
     for span, data_list in span_to_entityname.items():
         candidate_entities = [entity_name_to_entity[entity_name] for entity_name, _ in data_list]
         if len(candidate_entities) == 0: continue
@@ -274,12 +443,12 @@ def link_spans(spans: Set[str], use_asr_robustness: bool, altspan2origspan: Dict
     with futures.ThreadPoolExecutor(max_workers=8) as executor:
         if USE_ASR_ROBUSTNESS_OVERALL_FLAG and use_asr_robustness:
             # Fetch ASR-robust entity info
-            asr_robust_result = executor.submit(get_asr_robust_entities, set([altspan2origspan.get(s, s) for s in spans]), g2p_module)
+            asr_robust_result = executor.submit(contextvars.copy_context().run, get_asr_robust_entities, set([altspan2origspan.get(s, s) for s in spans]), g2p_module)
         else:
             asr_robust_result = None
 
         # Fetch WikiEntities
-        entities = executor.submit(get_entities_by_anchortext, spans)
+        entities = executor.submit(contextvars.copy_context().run, get_entities_by_anchortext, spans)
 
     asr_entname2ent, asr_entity_info = asr_robust_result.result() if asr_robust_result is not None else (dict(), dict())
     entities = entities.result()
@@ -390,9 +559,8 @@ def entity_link(user_utterance: str, context: str, corenlp: Optional[dict] = Non
     ner_span2type = {span: type for span, type in ner_mentions}
 
     # Get all ngrams (up to max_ngram) in user_utterance
-    ngrams = set()
-    for n in range(1, min(len(user_utterance.strip().split()), max_ngram) + 1):
-        ngrams.update(get_ngrams(user_utterance, n))
+    span_filter = NgramSpanFilter(user_utterance, include_common_phrases, max_ngram)
+    ngrams = span_filter.ngrams
 
     spans_to_lookup = ngrams  # set
 
@@ -402,14 +570,14 @@ def entity_link(user_utterance: str, context: str, corenlp: Optional[dict] = Non
     spans_to_lookup.update(set(ner_span2type.keys()))
 
     # Remove any spans that should be eliminated
-    spans_to_lookup = {span for span in spans_to_lookup if should_link(span, include_common_phrases, corenlp['pos_relations'])}
+    spans_to_lookup = {span for span in spans_to_lookup if span_filter.should_link(span, corenlp['pos_relations'])}
 
     logger.primary_info(f"Spans to lookup are: {spans_to_lookup}")
 
     # Add alternative forms of spans to spans_to_lookup
     spans_to_lookup, altspan2origspan = add_all_alternative_spans(spans_to_lookup, ngrams, corenlp_tokens)
     # Remove any spans that should be eliminated, again
-    spans_to_lookup = {span for span in spans_to_lookup if should_link(span, include_common_phrases, corenlp['pos_relations'])}
+    spans_to_lookup = {span for span in spans_to_lookup if span_filter.should_link(span, corenlp['pos_relations'])}
 
     # Run linker on all spans_to_lookup
     if len(spans_to_lookup) > 0:
@@ -496,7 +664,7 @@ class EntityLinkerModule(Annotator):
                 return False
 
         # If the user is giving their name, don't run entity linker
-        mynameis_slots = MyNameIsTemplate().execute(user_utterance)
+        mynameis_slots = MyNameIsTemplate.compiled().execute(user_utterance)
         if mynameis_slots is not None and 'my_name_is_high_prec' in mynameis_slots:
             # logger.primary_info(f'Not running entity linker on "{user_utterance}" because user utterance matches MyNameIs template')
             return False
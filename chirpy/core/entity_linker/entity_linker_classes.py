@@ -1,11 +1,17 @@
 import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 import jsonpickle
+import jsonpickle.handlers
+from jsonpickle import tags
 from collections import OrderedDict
 from typing import List, Dict, Optional
 from tabulate import tabulate
 import re
 import requests
 
+import chirpy.core.flags as flags
 from chirpy.core.entity_linker.util import wiki_name_to_url
 from chirpy.core.latency import measure
 from chirpy.response_generators.categories.categories import CATEGORYNAME2CLASS
@@ -39,6 +45,20 @@ dont_singularize_entgroup = EntityGroup(
     {'video game', 'video game series', 'board game', 'film', 'film series', 'television film', 'television program',
      'human', 'musical work', 'written work'})
 
+# Fields of a WikiEntity that are stored when it's serialized with flags.compact_entity_serialization (see
+# WikiEntityHandler). The others are fetched again the first time they're used. added_anchortext_counts (only set by
+# wiki_data_fetching.add_anchortext) holds the anchortexts that the fetched entity won't have.
+COMPACT_FIELDS = ['name', 'doc_id', 'confidence', 'talkable_name', 'added_anchortext_counts']
+LAZY_FIELDS = {'pageview', 'wikidata_categories', 'redirects', 'anchortext_counts', 'sum_anchortext_counts'}
+
+# Attributes of a restored WikiEntity that are never serialized
+NOT_SERIALIZED_FIELDS = {'_hydration_group'}
+
+# If the LAZY_FIELDS of restored entities can't be fetched, how long (in seconds) to wait before trying again, so that
+# an unavailable ES isn't queried on every attribute access of the turn
+HYDRATION_RETRY_INTERVAL = 10
+
+
 class WikiEntity(object):
     """Class to represent an entity (Wikipedia article)"""
 
@@ -76,6 +96,39 @@ class WikiEntity(object):
     def __hash__(self):
         return hash(self.doc_id)
 
+    def __getattr__(self, attr):
+        # Only called for attributes that aren't set, i.e. the LAZY_FIELDS of an entity restored from a compact encoding
+        if attr not in LAZY_FIELDS:
+            raise AttributeError(f"'WikiEntity' object has no attribute '{attr}'")
+        group = self.__dict__.get('_hydration_group')
+        if group is None:
+            group = self.__dict__['_hydration_group'] = HydrationGroup()
+        if not any(ent is self for ent in group.entities):  # e.g. a copy of an entity, which has a copy of its group
+            group.add(self)
+        group.hydrate()
+        if attr not in self.__dict__:
+            # Not fetched (e.g. ES is unavailable), so use what the compact encoding has. Nothing is written to the
+            # entity, so the fields are fetched again on a later use
+            logger.warning(f'Unable to fetch {self.name}, so using its compact encoding for its {attr}')
+            return self._get_compact_fallback(attr)
+        return self.__dict__[attr]
+
+    def _get_compact_fallback(self, attr):
+        """Returns the value of LAZY_FIELD attr, from only the compact encoding of this entity"""
+        added_anchortext_counts = self.__dict__.get('added_anchortext_counts', {})
+        if attr == 'anchortext_counts':
+            return OrderedDict(sorted(added_anchortext_counts.items(), key=lambda x: x[1], reverse=True))
+        if attr == 'sum_anchortext_counts':
+            return sum(added_anchortext_counts.values())
+        if attr == 'pageview':
+            return 0
+        return []  # wikidata_categories, redirects
+
+    @property
+    def is_hydrated(self) -> bool:
+        """False iff this entity was restored from a compact encoding and its LAZY_FIELDS haven't been fetched yet"""
+        return 'anchortext_counts' in self.__dict__
+
     def score(self, span) -> float:
         """
         Returns the score of span, for this entity.
@@ -106,11 +159,12 @@ class WikiEntity(object):
         return re.sub("\(.*?\)", "", self.name).strip()
 
     def __repr__(self):
-        if hasattr(self, "confidence"):
-            return f"<WikiEntity: {self.name}> (confidence={self.confidence:.3f}, sum_anchortext_counts={self.sum_anchortext_counts})>"
-        else:
+        if not hasattr(self, "confidence"):
             logger.warning("DEPRECATION: WikiEntity object has no attribute 'confidence', so you are likely using an outdated version of the global State (older than April 2021). Make sure this is intentional.")
             return f"<WikiEntity: {self.name}>"
+        if not self.is_hydrated:  # don't fetch its fields just to log it
+            return f"<WikiEntity: {self.name}> (confidence={self.confidence:.3f})>"
+        return f"<WikiEntity: {self.name}> (confidence={self.confidence:.3f}, sum_anchortext_counts={self.sum_anchortext_counts})>"
 
     def __eq__(self, other) -> bool:
         """
@@ -126,6 +180,98 @@ class WikiEntity(object):
         return bool(engine.singular_noun(self.talkable_name))
 
 
+class HydrationGroup:
+    """
+    The entities restored from compact encodings together (e.g. from one state, see restoring_entities). The first
+    time one of them is used, the LAZY_FIELDS of all of them are fetched in one lookup. Entities that can't be fetched
+    are left as they are, so they're fetched again when they're used after HYDRATION_RETRY_INTERVAL.
+    """
+
+    def __init__(self):
+        self.entities: List[WikiEntity] = []
+        self.retry_time = 0.0
+
+    def add(self, entity: WikiEntity):
+        self.entities.append(entity)
+
+    def hydrate(self):
+        from chirpy.core.entity_linker.wiki_data_fetching import get_entities_by_wiki_name  # avoid circular import
+        entities = [ent for ent in self.entities if not ent.is_hydrated]
+        if not entities or time.perf_counter() < self.retry_time:
+            return
+        # If several threads use the group's entities at once, they might all fetch them, which is harmless
+        entname2ent = get_entities_by_wiki_name([ent.name for ent in entities])
+        for ent in entities:
+            full_ent = entname2ent.get(ent.name)
+            if full_ent is None:
+                logger.error(f'Unable to fetch {ent.name} to restore its fields, so leaving it unhydrated')
+                continue
+            fields = {field: full_ent.__dict__[field] for field in LAZY_FIELDS}
+            added_anchortext_counts = ent.__dict__.get('added_anchortext_counts', {})
+            if added_anchortext_counts:
+                fields['anchortext_counts'] = OrderedDict(sorted({**fields['anchortext_counts'], **added_anchortext_counts}.items(),
+                                                                 key=lambda x: x[1], reverse=True))
+                fields['sum_anchortext_counts'] = sum(fields['anchortext_counts'].values())
+            ent.__dict__.update(fields)  # anchortext_counts last, since it's what is_hydrated checks
+            ent.__dict__.pop('_hydration_group', None)
+        self.entities = [ent for ent in self.entities if not ent.is_hydrated]
+        if self.entities:
+            self.retry_time = time.perf_counter() + HYDRATION_RETRY_INTERVAL
+
+
+_restoring_group: ContextVar[Optional[HydrationGroup]] = ContextVar('chirpy_hydration_group', default=None)
+
+
+@contextmanager
+def restoring_entities():
+    """The WikiEntities restored from compact encodings in this block are hydrated together (see HydrationGroup)"""
+    token = _restoring_group.set(HydrationGroup())
+    try:
+        yield
+    finally:
+        _restoring_group.reset(token)
+
+
+@jsonpickle.handlers.register(WikiEntity)
+class WikiEntityHandler(jsonpickle.handlers.BaseHandler):
+    """
+    Encodes WikiEntities. With flags.compact_entity_serialization, only their COMPACT_FIELDS are encoded, rather than
+    their anchortext_counts, categories etc, which are the bulk of the entity tracker and entity linker states. When
+    restored, the other fields are fetched (from the WikiEntity caches, see wiki_data_fetching) the first time they're
+    used. Full encodings (from before, or without the flag) are restored as they are.
+    """
+
+    def flatten(self, obj: WikiEntity, data: dict) -> dict:
+        if not flags.compact_entity_serialization and not obj.is_hydrated:
+            obj.anchortext_counts  # fetches the LAZY_FIELDS. If that fails, the compact encoding is kept
+        if flags.compact_entity_serialization or not obj.is_hydrated:
+            fields = [field for field in COMPACT_FIELDS if field in obj.__dict__]
+        else:
+            fields = [field for field in obj.__dict__ if field not in NOT_SERIALIZED_FIELDS]
+        # Flatten in a fixed order, so that any pointers inside the fields are too (see the comment in state.py)
+        for field in sorted(fields):
+            data[field] = self.context.flatten(obj.__dict__[field], reset=False)
+        return data
+
+    def restore(self, data: dict) -> WikiEntity:
+        entity = WikiEntity.__new__(WikiEntity)
+        for field, value in data.items():
+            if field != tags.OBJECT:
+                entity.__dict__[field] = self.context.restore(value, reset=False)
+        if not entity.is_hydrated:
+            entity.url = wiki_name_to_url(entity.name)
+            entity.is_category = entity.name in CATEGORY_ENTITY_NAMES
+            # Entities restored outside of restoring_entities are grouped by the decode call that restores them
+            group = _restoring_group.get()
+            if group is None:
+                if not hasattr(self.context, '_chirpy_hydration_group'):
+                    self.context._chirpy_hydration_group = HydrationGroup()
+                group = self.context._chirpy_hydration_group
+            entity.__dict__['_hydration_group'] = group
+            group.add(entity)
+        return entity
+
+
 def is_offensive_entity(entity: WikiEntity):
     """Returns True if the entity is offensive (i.e. has offensive phrases in its title or wikidata categories)"""
     if entity.name in ENTITY_WHITELIST:
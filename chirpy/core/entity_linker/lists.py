@@ -40,6 +40,7 @@ You can check that your fix is working by running the code at the bottom of enti
 """
 
 import os
+from functools import lru_cache
 from chirpy.core.util import get_unigram_freq_fn, load_text_file
 from chirpy.core.entity_linker.util import wiki_url_to_name
 from chirpy.core.entity_linker.util import NUMBER_ALTERNATIVES
@@ -81,6 +82,7 @@ ADDITIONAL_HIGH_FREQ_WORDS = {w for w in DONT_LINK_WORDS}  # all DONT_LINK_WORDS
 ADDITIONAL_HIGH_FREQ_WORDS.update(set(['mom']))  # you can add more here
 assert all([len(span.split()) == 1 for span in ADDITIONAL_HIGH_FREQ_WORDS]), 'Only put unigrams in ADDITIONAL_HIGH_FREQ_WORDS. Put multi-word phrases in LOW_PREC_SPANS'
 
+@lru_cache(maxsize=65536)
 def get_unigram_freq(unigram: str) -> int:
     """
     Returns the frequency of a unigram.
@@ -0,0 +1,108 @@
+"""
+Tests for the compact encoding of WikiEntities (see WikiEntityHandler), with the WikiEntity lookups stubbed out, so no
+ES is needed
+
+Run:
+    python -m unittest -v chirpy/core/entity_linker/test_entity_serialization.py
+"""
+
+import copy
+import logging
+import unittest
+from unittest import mock
+
+import jsonpickle
+
+from chirpy.core import flags
+from chirpy.core.entity_linker import entity_linker_classes, wiki_data_fetching
+from chirpy.core.entity_linker.entity_linker_classes import WikiEntity, restoring_entities
+from chirpy.core.logging_utils import LoggerSettings, setup_logger
+
+
+def setUpModule():
+    setup_logger(LoggerSettings(logtoscreen_level=logging.CRITICAL, logtoscreen_usecolor=False, logtofile_level=None,
+                                logtofile_path=None, logtoscreen_allow_multiline=False, integ_test=False,
+                                remove_root_handlers=False))
+
+
+def make_entity(name: str, doc_id: int) -> WikiEntity:
+    return WikiEntity(name, doc_id, 1000, 0.5, ['film'], {name.lower(): 10, 'the film': 2}, [f'{name} (film)'], name)
+
+
+class TestCompactEntitySerialization(unittest.TestCase):
+
+    def setUp(self):
+        self.entities = [make_entity('Frozen', 1), make_entity('Shrek', 2)]
+        self.lookups = []
+        self.available = True
+        lookup_patcher = mock.patch.object(wiki_data_fetching, 'get_entities_by_wiki_name', self.get_entities_by_wiki_name)
+        lookup_patcher.start()
+        self.addCleanup(lookup_patcher.stop)
+        flag_patcher = mock.patch.object(flags, 'compact_entity_serialization', True)
+        flag_patcher.start()
+        self.addCleanup(flag_patcher.stop)
+
+    def get_entities_by_wiki_name(self, wiki_names):
+        self.lookups.append(sorted(wiki_names))
+        if not self.available:
+            return {}
+        return {ent.name: copy.copy(ent) for ent in self.entities if ent.name in wiki_names}
+
+    def restore(self, entities):
+        with restoring_entities():
+            return jsonpickle.decode(jsonpickle.encode(entities))
+
+    def test_round_trip(self):
+        """Check that the restored entities are fetched together on first use, and equal the originals"""
+        encoded = jsonpickle.encode(self.entities)
+        self.assertNotIn('anchortext_counts', encoded)
+        restored = self.restore(self.entities)
+        self.assertFalse(any(ent.is_hydrated for ent in restored))
+        self.assertEqual(restored[0].pageview, 1000)
+        self.assertEqual(self.lookups, [['Frozen', 'Shrek']])
+        for original, ent in zip(self.entities, restored):
+            self.assertTrue(ent.is_hydrated)
+            self.assertEqual(ent, original)
+            self.assertEqual(ent.anchortext_counts, original.anchortext_counts)
+            self.assertEqual(ent.wikidata_categories, original.wikidata_categories)
+            self.assertEqual(ent.confidence, original.confidence)
+
+    def test_added_anchortexts_survive(self):
+        """Check that anchortexts added by add_anchortext are kept by the compact encoding"""
+        entity = wiki_data_fetching.add_anchortext(self.entities[0], 'elsa movie', 1)
+        restored = self.restore([entity])[0]
+        self.assertEqual(restored.anchortext_counts, entity.anchortext_counts)
+        self.assertEqual(restored.sum_anchortext_counts, entity.sum_anchortext_counts)
+
+    def test_failed_fetch_falls_back(self):
+        """Check that a failed fetch uses the compact fields without writing them, and is retried later"""
+        self.available = False
+        restored = self.restore(self.entities)
+        self.assertEqual(restored[0].pageview, 0)
+        self.assertEqual(restored[0].wikidata_categories, [])
+        self.assertFalse(restored[0].is_hydrated)
+        self.assertIn('confidence=0.500', repr(restored[0]))
+        restored[1].redirects  # not retried until HYDRATION_RETRY_INTERVAL has passed
+        self.assertEqual(len(self.lookups), 1)
+
+        self.available = True
+        with mock.patch.object(entity_linker_classes, 'HYDRATION_RETRY_INTERVAL', 0):
+            restored = self.restore(self.entities)
+            self.available = False
+            restored[0].pageview
+            self.available = True
+            self.assertEqual(restored[1].pageview, 1000)
+        self.assertTrue(all(ent.is_hydrated for ent in restored))
+
+    def test_full_encoding(self):
+        """Check that without the flag, restored entities are encoded in full again"""
+        restored = self.restore(self.entities)
+        with mock.patch.object(flags, 'compact_entity_serialization', False):
+            encoded = jsonpickle.encode(restored)
+        self.assertIn('anchortext_counts', encoded)
+        self.assertNotIn('_hydration_group', encoded)
+        self.assertEqual(jsonpickle.decode(encoded)[0].anchortext_counts, self.entities[0].anchortext_counts)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Tests for the WikiEntityStore file format: build a store from a few articles and read it back
+
+Run:
+    python -m unittest -v chirpy/core/entity_linker/test_wiki_entity_store.py
+"""
+
+import io
+import os
+import struct
+import tempfile
+import unittest
+
+from chirpy.core.entity_linker.wiki_entity_store import (ANCHORTEXTS_FILENAME, ENTITIES_FILENAME, TITLE_KEY, VERSION,
+                                                         SortedKeyTable, WikiEntityStore, build_store,
+                                                         write_sorted_key_table)
+
+ARTICLES = [
+    {'doc_title': 'Cat', 'doc_id': 1, 'pageview': 500, 'categories': ['Felines'], 'redirects': ['Cats'],
+     'linkable_span_info': [('cat', 90), ('cats', 10)], 'wikidata_categories_all': ['animal'], 'plural': 'cats',
+     'text': 'not stored'},
+    {'doc_title': 'Dog', 'doc_id': 2, 'pageview': 900, 'categories': ['Canines'], 'redirects': [],
+     'linkable_span_info': [('dog', 95)], 'wikidata_categories_all': ['animal'], 'plural': 'dogs'},
+    {'doc_title': 'Cat (musical)', 'doc_id': 3, 'pageview': 200, 'categories': ['Musicals'], 'redirects': [],
+     'linkable_span': ['cats', 'cat'], 'wikidata_categories_all': ['musical']},
+    {'doc_title': 'Café', 'doc_id': 4, 'categories': [], 'redirects': [], 'linkable_span_info': [('café', 1)]},
+]
+
+
+class TestSortedKeyTable(unittest.TestCase):
+
+    def setUp(self):
+        items = sorted((key.encode('utf-8'), value) for value, key in enumerate(['b', 'a', 'dd', 'é', 'c']))
+        f = io.BytesIO()
+        keys_offset = write_sorted_key_table(f, items, TITLE_KEY)
+        self.table = SortedKeyTable(f.getvalue(), TITLE_KEY, 0, keys_offset, len(items))
+        self.items = items
+
+    def test_find(self):
+        for key, value in self.items:
+            entry = self.table.find(key.decode('utf-8'))
+            self.assertIsNotNone(entry)
+            self.assertEqual(self.table.get_key(entry), key)
+            self.assertEqual(entry[2], value)
+
+    def test_missing_key(self):
+        for key in ['', '0', 'aa', 'd', 'ddd', 'z', 'ê']:
+            self.assertIsNone(self.table.find(key))
+
+
+class TestWikiEntityStore(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.store_dir = tmp_dir.name
+        self.assertEqual(build_store(iter(ARTICLES), self.store_dir), len(ARTICLES))
+
+    def open_store(self) -> WikiEntityStore:
+        store = WikiEntityStore(self.store_dir)
+        self.addCleanup(store.close)
+        return store
+
+    def test_round_trip(self):
+        store = self.open_store()
+        self.assertEqual(store.num_docs, len(ARTICLES))
+        for article in ARTICLES:
+            doc_index = store.get_doc_index_by_title(article['doc_title'])
+            self.assertIsNotNone(doc_index)
+            record = store.get_record(doc_index)
+            self.assertEqual(record['doc_id'], article['doc_id'])
+            self.assertNotIn('text', record)
+        self.assertEqual(store.get_record(store.get_doc_index_by_title('Cat'))['linkable_span_info'],
+                         [['cat', 90], ['cats', 10]])
+
+    def test_records_in_decreasing_pageview(self):
+        store = self.open_store()
+        self.assertEqual([store.get_record(i)['doc_title'] for i in range(store.num_docs)],
+                         ['Dog', 'Cat', 'Cat (musical)', 'Café'])
+        self.assertEqual([record['doc_title'] for record in store.get_records_by_anchortext(['cats', 'café'])],
+                         ['Cat', 'Cat (musical)', 'Café'])
+        self.assertEqual([record['doc_title'] for record in store.get_records_by_anchortext(['cat'], ['Dog'], size=2)],
+                         ['Dog', 'Cat'])
+        self.assertEqual([record['doc_title'] for record in store.get_records_by_title(['Café', 'Dog', 'Bird'])],
+                         ['Dog', 'Café'])
+
+    def test_missing_key(self):
+        store = self.open_store()
+        self.assertIsNone(store.get_doc_index_by_title('Bird'))
+        self.assertIsNone(store.get_doc_index_by_title('cat'))
+        self.assertEqual(store.get_postings('bird'), [])
+        self.assertEqual(store.get_records_by_anchortext(['bird'], ['Bird']), [])
+        self.assertEqual(store.get_records_by_title(['Bird']), [])
+
+    def test_bad_magic(self):
+        for filename in [ENTITIES_FILENAME, ANCHORTEXTS_FILENAME]:
+            with self.subTest(filename=filename):
+                with open(os.path.join(self.store_dir, filename), 'r+b') as f:
+                    magic = f.read(8)
+                    f.seek(0)
+                    f.write(b'NOTCHIRP')
+                with self.assertRaises(ValueError):
+                    WikiEntityStore(self.store_dir)
+                with open(os.path.join(self.store_dir, filename), 'r+b') as f:
+                    f.write(magic)
+                self.open_store()
+
+    def test_bad_version(self):
+        for filename in [ENTITIES_FILENAME, ANCHORTEXTS_FILENAME]:
+            with self.subTest(filename=filename):
+                with open(os.path.join(self.store_dir, filename), 'r+b') as f:
+                    f.seek(8)
+                    f.write(struct.pack('<I', VERSION + 1))
+                with self.assertRaises(ValueError):
+                    WikiEntityStore(self.store_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
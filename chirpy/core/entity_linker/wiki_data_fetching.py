@@ -1,16 +1,20 @@
-"""Functions for fetching wikipedia data from dynamodb / elasticsearch for entity linking"""
+"""Functions for fetching wikipedia data from elasticsearch (or a WikiEntityStore) for entity linking"""
 
+import copy
 import logging
 import boto3
 from requests_aws4auth import AWS4Auth
 from elasticsearch import Elasticsearch, RequestsHttpConnection, ElasticsearchException
+from collections import OrderedDict
 from typing import List, Dict, Set, Optional
 import os
 
 from chirpy.core.latency import measure
 from chirpy.core.entity_linker.entity_linker_classes import WikiEntity
+from chirpy.core.entity_linker.wiki_entity_store import WikiEntityStore
 from chirpy.core.entity_linker.lists import MANUAL_SPAN2ENTINFO, MANUAL_TALKABLE_NAMES
 from chirpy.core.flags import inf_timeout, use_timeouts
+from chirpy.core.ttl_cache import TTLCache
 from chirpy.core.util import query_es_index, get_es_host, get_elasticsearch
 
 logger = logging.getLogger('chirpylogger')
@@ -22,6 +26,15 @@ ENTITYNAME_QUERY_TIMEOUT = 1.0  # seconds
 
 ARTICLES_INDEX_NAME = 'enwiki-20201201-articles'
 
+# Process-wide caches of the articles we've fetched, shared by all sessions. The articles index doesn't change while
+# we're running, so the TTLs just bound how stale an entry can get if it does.
+ENTITY_CACHE_SIZE = 50000  # number of wiki names
+ANCHORTEXT_CACHE_SIZE = 20000  # number of spans
+CACHE_TTL = 6 * 60 * 60  # seconds
+NEGATIVE_CACHE_TTL = 30 * 60  # seconds, for wiki names that weren't found
+entity_cache = TTLCache('wiki_name -> WikiEntity', ENTITY_CACHE_SIZE, CACHE_TTL, NEGATIVE_CACHE_TTL)
+anchortext_cache = TTLCache('span -> WikiEntities', ANCHORTEXT_CACHE_SIZE, CACHE_TTL)
+
 # These are the fields we DO want to fetch from ES
 FIELDS_FILTER = ['doc_title', 'doc_id', 'categories', 'pageview', 'linkable_span_info', 'wikidata_categories_all', 'redirects', 'plural']
 
@@ -52,6 +65,83 @@ BLACKLIST_ENTITIES = ['Andijan']
 # Elastic Search
 es = get_elasticsearch()
 
+# If set, articles are looked up in the WikiEntityStore in this directory (see wiki_entity_store) rather than in ES
+ENTITY_STORE_DIR = os.environ.get('WIKI_ENTITY_STORE_DIR')
+
+
+class ArticlesBackend:
+    """
+    Where get_entities_by_anchortext and get_entities_by_wiki_name get articles from. Results are in the form of ES
+    hits, i.e. dicts with the FIELDS_FILTER fields of the article under '_source'. Errors (e.g. timeouts) are raised,
+    so that they aren't mistaken for (and cached as) empty results.
+    """
+    name = None
+
+    def search_by_anchortext(self, spans: List[str], doc_titles: List[str]) -> List[dict]:
+        """Returns the articles with any of spans in their anchortexts, or any of doc_titles, by decreasing pageview"""
+        raise NotImplementedError
+
+    def search_by_title(self, wiki_names: List[str]) -> List[dict]:
+        """Returns the articles with the given titles"""
+        raise NotImplementedError
+
+
+class ElasticsearchArticlesBackend(ArticlesBackend):
+    name = f'ES "{ARTICLES_INDEX_NAME}" index'
+
+    def __init__(self, es: Elasticsearch):
+        self.es = es
+
+    def search(self, query: dict, timeout: float) -> List[dict]:
+        return query_es_index(self.es, ARTICLES_INDEX_NAME, query, size=MAX_ES_SEARCH_SIZE, timeout=timeout,
+                              filter_path=['hits.hits._source.{}'.format(field) for field in FIELDS_FILTER],
+                              raise_errors=True)
+
+    def search_by_anchortext(self, spans: List[str], doc_titles: List[str]) -> List[dict]:
+        query_should_clause = [{'terms': {'linkable_span': spans}}]
+        if doc_titles:
+            query_should_clause.append({'terms': {'doc_title': doc_titles}})
+        query = {'query': {'bool': {'should': query_should_clause}}, 'sort': {'pageview': 'desc'}}
+        return self.search(query, ANCHORTEXT_QUERY_TIMEOUT)
+
+    def search_by_title(self, wiki_names: List[str]) -> List[dict]:
+        query = {'query': {'bool': {'must': [{'terms': {'doc_title': wiki_names}}]}}}
+        return self.search(query, ENTITYNAME_QUERY_TIMEOUT)
+
+
+class EntityStoreArticlesBackend(ArticlesBackend):
+    def __init__(self, store: WikiEntityStore):
+        self.store = store
+        self.name = f'WikiEntityStore at {store.store_dir}'
+
+    def search_by_anchortext(self, spans: List[str], doc_titles: List[str]) -> List[dict]:
+        records = self.store.get_records_by_anchortext(spans, doc_titles, size=MAX_ES_SEARCH_SIZE)
+        return [{'_source': record} for record in records]
+
+    def search_by_title(self, wiki_names: List[str]) -> List[dict]:
+        return [{'_source': record} for record in self.store.get_records_by_title(wiki_names)]
+
+
+def get_default_articles_backend() -> ArticlesBackend:
+    if ENTITY_STORE_DIR:
+        try:
+            return EntityStoreArticlesBackend(WikiEntityStore(ENTITY_STORE_DIR))
+        except Exception:
+            logger.error(f'Unable to open WikiEntityStore at {ENTITY_STORE_DIR}, so using ES instead', exc_info=True)
+    return ElasticsearchArticlesBackend(es)
+
+
+articles_backend = get_default_articles_backend()
+
+
+def set_articles_backend(backend: ArticlesBackend):
+    """Use backend for all subsequent article lookups"""
+    global articles_backend
+    articles_backend = backend
+    entity_cache.clear()
+    anchortext_cache.clear()
+
+
 def clean_category(category: str) -> str:
     """Clean the wikipedia category"""
     # It seems that sometimes the article title is included after | in the category. Get rid of this.
@@ -120,8 +210,8 @@ def make_wikientities(results: List[Dict]) -> List[WikiEntity]:
 def get_entities_by_anchortext(spans: List[str], *, asr_entity_info: Dict[str, Dict[str, Dict[str, float]]] = {})  \
         -> Set[WikiEntity]:
     """
-    Given a set of spans, query the ES "articles" index to get all WikiEntities with at least one of the spans in its
-    anchortexts.
+    Given a set of spans, query the articles backend (the ES "articles" index by default) to get all WikiEntities
+    with at least one of the spans in its anchortexts.
 
     Optionally, also consider entities from ASR correction, in the form of a dict from span to dictionaries containing
     entity names and ASR-corrected entity counts (count * ASR similarity).
@@ -132,75 +222,125 @@ def get_entities_by_anchortext(spans: List[str], *, asr_entity_info: Dict[str, D
     if not spans:
         return set()
 
-    # Compose an ES query
+    # Get the entities for each span from the cache, and only query for the others
     spans = list(set(spans))  # remove duplicates
-    logger.info(f'Querying "{ARTICLES_INDEX_NAME}" ES index with these {len(spans)} spans: {spans}')
-    match_oneof_spans_query = {'terms': {'linkable_span': spans}}
-    query_should_clause = [match_oneof_spans_query]
-
-    # Get any manual span -> entity links, and add them to the query
-    manual_span2entname = {span: MANUAL_SPAN2ENTINFO[span].ent_name for span in spans if span in MANUAL_SPAN2ENTINFO}
-    if manual_span2entname:
-        logger.info('Getting the entities specified by these manual links:\n{}'.format(
-            '\n'.join('"{}" -> "{}"'.format(span, ent_name) for span, ent_name in manual_span2entname.items())))
-        match_oneof_entnames_query = {'terms': {'doc_title': list(manual_span2entname.values())}}
-        query_should_clause.append(match_oneof_entnames_query)
-
-    # Query ES
-    query = {'query': {'bool': {'should': query_should_clause}}, 'sort': {'pageview': 'desc'}}
-    results = query_es_index(es, ARTICLES_INDEX_NAME, query, size=MAX_ES_SEARCH_SIZE, timeout=ANCHORTEXT_QUERY_TIMEOUT, filter_path=['hits.hits._source.{}'.format(field) for field in FIELDS_FILTER])
-
-    # Process into WikiEntities
-    entities = make_wikientities(results)
-    entname2ent = {ent.name: ent for ent in entities}
-
-    # For manual links, add a spancount of 1 to the entity if necessary
-    for span, ent_name in manual_span2entname.items():
-        if ent_name not in entname2ent:
-            logger.error(f'span "{span}" has a manual link to "{ent_name}" but was unable to find this entity in ES "{ARTICLES_INDEX_NAME}" index')
-        else:
-            ent = entname2ent[ent_name]
-            if span not in ent.anchortext_counts:
-                logger.info(f'span "{span}" has a manual link to "{ent_name}", which doesn\'t have "{span}" in its anchortexts, so adding a count of 1')
-                span_counts = ent.anchortext_counts
-                span_counts[span] = 1
-                entname2ent[ent_name] = WikiEntity(ent.name, ent.doc_id, ent.pageview, ent.wikidata_categories, span_counts, ent.redirects)
-
-    # Log and return
+    span2ents, missing_spans = anchortext_cache.get_many(spans)
+    entname2ent = {ent.name: ent for ents in span2ents.values() for ent in ents}
+    if span2ents:
+        logger.info(f'Got the entities for {len(span2ents)} spans from the cache: {list(span2ents)}')
+
+    if missing_spans:
+        logger.info(f'Querying {articles_backend.name} with these {len(missing_spans)} spans: {missing_spans}')
+
+        # Get any manual span -> entity links, and add them to the query
+        manual_span2entname = {span: MANUAL_SPAN2ENTINFO[span].ent_name for span in missing_spans if span in MANUAL_SPAN2ENTINFO}
+        if manual_span2entname:
+            logger.info('Getting the entities specified by these manual links:\n{}'.format(
+                '\n'.join('"{}" -> "{}"'.format(span, ent_name) for span, ent_name in manual_span2entname.items())))
+
+        try:
+            results = articles_backend.search_by_anchortext(missing_spans, list(manual_span2entname.values()))
+            # If there were more results than we fetched, some spans' entities might be missing, so don't cache them
+            cacheable = len(results) < MAX_ES_SEARCH_SIZE
+        except Exception:
+            logger.error(f'Error when querying {articles_backend.name}, so not getting entities for spans {missing_spans}', exc_info=True)
+            results, cacheable = [], False
+
+        # Process into WikiEntities
+        fetched_entname2ent = {ent.name: ent for ent in make_wikientities(results)}
+        if cacheable:
+            entity_cache.put_many(fetched_entname2ent)
+
+        # For manual links, add a spancount of 1 to the entity if necessary
+        for span, ent_name in manual_span2entname.items():
+            if ent_name not in fetched_entname2ent:
+                logger.error(f'span "{span}" has a manual link to "{ent_name}" but was unable to find this entity in {articles_backend.name}')
+            else:
+                ent = fetched_entname2ent[ent_name]
+                if span not in ent.anchortext_counts:
+                    logger.info(f'span "{span}" has a manual link to "{ent_name}", which doesn\'t have "{span}" in its anchortexts, so adding a count of 1')
+                    fetched_entname2ent[ent_name] = add_anchortext(ent, span, 1)
+
+        if cacheable:
+            anchortext_cache.put_many({span: tuple(ent for ent in fetched_entname2ent.values() if span in ent.anchortext_counts)
+                                       for span in missing_spans})
+        entname2ent.update(fetched_entname2ent)
+
+    # Log and return. The cached entities are shared, so return copies that callers can modify (e.g. their confidence)
     logger.info("Got {} WikiEntities:\n{}".format(len(entname2ent), '\n'.join(repr(entname2ent[ent_name]) for ent_name in sorted(entname2ent.keys()))))
-    return set(entname2ent.values())
+    return {copy.copy(ent) for ent in entname2ent.values()}
+
+
+def get_cached_entities_by_anchortext(spans: List[str]) -> Set[WikiEntity]:
+    """Like get_entities_by_anchortext, but only returns the cached entities, without querying for the other spans"""
+    span2ents, _ = anchortext_cache.get_many(list(set(spans)))
+    entname2ent = {ent.name: ent for ents in span2ents.values() for ent in ents}
+    return {copy.copy(ent) for ent in entname2ent.values()}
 
 
 @measure
 def get_entities_by_wiki_name(wiki_names: List[str]) -> Dict[str, WikiEntity]:
     """
-    Given a list of wiki doc titles, query the ES articles index to get the corresponding WikiEntities.
+    Given a list of wiki doc titles, query the articles backend to get the corresponding WikiEntities. Titles that are
+    in the cache aren't queried.
     Logs an error if any of the titles are NOT found.
 
     Returns:
         entname2ent: a dictionary mapping from entity name to WikiEntity
     """
 
-    # Query ES
     wiki_names = list(set(wiki_names))
-    logger.info(f'Querying "{ARTICLES_INDEX_NAME}" ES index with these {len(wiki_names)} wiki names: {wiki_names}')
-    query = {'query': {'bool': {'must': [{'terms': {'doc_title': wiki_names}}]}}}
-    results = query_es_index(es, ARTICLES_INDEX_NAME, query, size=MAX_ES_SEARCH_SIZE, timeout=ENTITYNAME_QUERY_TIMEOUT, filter_path=['hits.hits._source.{}'.format(field) for field in FIELDS_FILTER])
-
-    # Process into WikiEntities
-    entities = make_wikientities(results)
-    entname2ent = {ent.name: ent for ent in entities}
+    entname2ent, missing_names = entity_cache.get_many(wiki_names)
+    if entname2ent:
+        logger.info(f'Got {len(entname2ent)} wiki names from the cache: {list(entname2ent)}')
+
+    if missing_names:
+        logger.info(f'Querying {articles_backend.name} with these {len(missing_names)} wiki names: {missing_names}')
+        try:
+            results = articles_backend.search_by_title(missing_names)
+            cacheable = True
+        except Exception:
+            logger.error(f'Error when querying {articles_backend.name}, so not getting wiki names {missing_names}', exc_info=True)
+            results, cacheable = [], False
+
+        # Process into WikiEntities
+        fetched_entname2ent = {ent.name: ent for ent in make_wikientities(results)}
+        if cacheable:
+            # Cache the titles that weren't found as None, so we don't keep querying for them
+            entity_cache.put_many({wiki_name: fetched_entname2ent.get(wiki_name) for wiki_name in missing_names})
+            entity_cache.put_many(fetched_entname2ent)
+        entname2ent.update(fetched_entname2ent)
+
+    entname2ent = {name: copy.copy(ent) for name, ent in entname2ent.items() if ent is not None}
     logger.info("Got {} WikiEntities:\n{}".format(len(entname2ent), '\n'.join(
         repr(entname2ent[ent_name]) for ent_name in sorted(entname2ent.keys()))))
 
     # Check if any are missing
     for wiki_name in wiki_names:
         if wiki_name not in entname2ent:
-            logger.warning(f"Unable to fetch wiki_name from ES '{ARTICLES_INDEX_NAME}' index \n wiki_name ='{wiki_name}'")
+            logger.warning(f"Unable to fetch wiki_name from {articles_backend.name} \n wiki_name ='{wiki_name}'")
 
     return entname2ent
 
 
+def add_anchortext(ent: WikiEntity, anchortext: str, count: int) -> WikiEntity:
+    """
+    Returns a copy of ent with anchortext added to its anchortexts. The added anchortexts are also kept in
+    added_anchortext_counts, so that they survive a compact encoding (see WikiEntityHandler).
+    """
+    ent = copy.copy(ent)
+    ent.added_anchortext_counts = {**ent.__dict__.get('added_anchortext_counts', {}), anchortext: count}
+    ent.anchortext_counts = OrderedDict(sorted(list(ent.anchortext_counts.items()) + [(anchortext, count)],
+                                               key=lambda x: x[1], reverse=True))
+    ent.sum_anchortext_counts += count
+    return ent
+
+
+def get_cache_stats() -> Dict[str, Dict[str, float]]:
+    """Returns the hit / miss counts etc of the WikiEntity caches"""
+    return {cache.name: cache.stats() for cache in [entity_cache, anchortext_cache]}
+
+
 # if __name__ == "__main__":
 #
 #     # Demo:
@@ -0,0 +1,250 @@
+"""
+An embedded, read-only store of the Wikipedia articles the entity linker needs, as an alternative to querying the ES
+articles index (see wiki_data_fetching).
+
+The store is built offline from the same *-integrated.json.bz2 articles dump that wiki-es-dump/upload.py uploads to ES:
+
+    python -m chirpy.core.entity_linker.wiki_entity_store /path/to/enwiki-...-integrated.json.bz2 /path/to/store_dir
+
+It consists of two files, which are memory-mapped read-only, so all the worker processes on a machine share one copy
+in the page cache:
+
+    entities.bin: doc_index -> entity record (the FIELDS_FILTER fields of the article, as JSON), and a sorted
+        doc_title -> doc_index table. Articles are stored in decreasing order of pageview, so doc_index order is the
+        order ES returns results in when sorting by pageview.
+    anchortexts.bin: a sorted anchortext -> postings table, where the postings are the (increasing) doc_indices of the
+        articles with that anchortext in their linkable_span.
+
+Lookups are binary searches over the sorted tables, so they take microseconds and need no network round trip.
+"""
+
+import argparse
+import bz2
+import json
+import mmap
+import os
+import struct
+import tempfile
+from ast import literal_eval
+from heapq import merge
+from typing import Dict, Iterable, Iterator, List, Optional
+
+ENTITIES_FILENAME = 'entities.bin'
+ANCHORTEXTS_FILENAME = 'anchortexts.bin'
+
+# Fields of each article that we store. Same as wiki_data_fetching.FIELDS_FILTER.
+STORED_FIELDS = ['doc_title', 'doc_id', 'categories', 'pageview', 'linkable_span_info', 'wikidata_categories_all',
+                 'redirects', 'plural']
+
+VERSION = 1
+
+# File header: magic, version, number of entries, and the offsets of the file's three sections
+HEADER = struct.Struct('<8sIIQQQ')
+ENTITIES_MAGIC = b'CHIRPYWE'
+ANCHORTEXTS_MAGIC = b'CHIRPYAT'
+
+# entities.bin: one RECORD per article (offset and length of its JSON), and one KEY per article (offset and length of
+# its title in the titles blob, and its doc_index), sorted by title
+RECORD = struct.Struct('<QI')
+TITLE_KEY = struct.Struct('<QII')
+
+# anchortexts.bin: one KEY per anchortext (offset and length of the anchortext in the keys blob, and offset and length
+# of its postings), sorted by anchortext. Postings are uint32 doc_indices.
+ANCHORTEXT_KEY = struct.Struct('<QIQI')
+POSTING = struct.Struct('<I')
+
+
+class SortedKeyTable:
+    """A table of fixed-width entries in a memory-mapped file, sorted by a bytes key stored in a separate blob"""
+
+    def __init__(self, buf: mmap.mmap, entry: struct.Struct, entries_offset: int, keys_offset: int, num_entries: int):
+        self.buf = buf
+        self.entry = entry
+        self.entries_offset = entries_offset
+        self.keys_offset = keys_offset
+        self.num_entries = num_entries
+
+    def get_entry(self, i: int) -> tuple:
+        return self.entry.unpack_from(self.buf, self.entries_offset + i * self.entry.size)
+
+    def get_key(self, entry: tuple) -> bytes:
+        key_offset, key_len = entry[0], entry[1]
+        start = self.keys_offset + key_offset
+        return self.buf[start:start + key_len]
+
+    def find(self, key: str) -> Optional[tuple]:
+        """Returns the entry for key, or None if there is none"""
+        key = key.encode('utf-8')
+        lo, hi = 0, self.num_entries
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self.get_entry(mid)
+            mid_key = self.get_key(entry)
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return entry
+        return None
+
+
+class WikiEntityStore:
+    """Read-only access to a store built by build_store. Safe to share between threads."""
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self._files = []
+
+        self.entities_buf = self._open(os.path.join(store_dir, ENTITIES_FILENAME))
+        magic, version, self.num_docs, records_offset, titles_offset, title_keys_offset = HEADER.unpack_from(self.entities_buf, 0)
+        self._check_header(ENTITIES_FILENAME, magic, ENTITIES_MAGIC, version)
+        self.records_index_offset = HEADER.size
+        self.records_offset = records_offset
+        self.titles = SortedKeyTable(self.entities_buf, TITLE_KEY, titles_offset, title_keys_offset, self.num_docs)
+
+        self.anchortexts_buf = self._open(os.path.join(store_dir, ANCHORTEXTS_FILENAME))
+        magic, version, num_anchortexts, keys_offset, postings_offset, _ = HEADER.unpack_from(self.anchortexts_buf, 0)
+        self._check_header(ANCHORTEXTS_FILENAME, magic, ANCHORTEXTS_MAGIC, version)
+        self.postings_offset = postings_offset
+        self.anchortexts = SortedKeyTable(self.anchortexts_buf, ANCHORTEXT_KEY, HEADER.size, keys_offset, num_anchortexts)
+
+    def _open(self, path: str) -> mmap.mmap:
+        f = open(path, 'rb')
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._files.append((buf, f))
+        return buf
+
+    def _check_header(self, filename: str, magic: bytes, expected_magic: bytes, version: int):
+        if magic != expected_magic or version != VERSION:
+            self.close()
+            raise ValueError(f'{os.path.join(self.store_dir, filename)} is not a version {VERSION} WikiEntityStore file')
+
+    def close(self):
+        for buf, f in self._files:
+            buf.close()
+            f.close()
+
+    def get_record(self, doc_index: int) -> dict:
+        """Returns the stored fields of the article with the given doc_index"""
+        offset, length = RECORD.unpack_from(self.entities_buf, self.records_index_offset + doc_index * RECORD.size)
+        start = self.records_offset + offset
+        return json.loads(self.entities_buf[start:start + length])
+
+    def get_doc_index_by_title(self, doc_title: str) -> Optional[int]:
+        entry = self.titles.find(doc_title)
+        return None if entry is None else entry[2]
+
+    def get_postings(self, anchortext: str) -> List[int]:
+        """Returns the doc_indices of the articles with anchortext in their linkable_span, in decreasing pageview"""
+        entry = self.anchortexts.find(anchortext)
+        if entry is None:
+            return []
+        _, _, postings_offset, num_postings = entry
+        start = self.postings_offset + postings_offset
+        return list(struct.unpack_from(f'<{num_postings}I', self.anchortexts_buf, start))
+
+    def get_records_by_anchortext(self, anchortexts: Iterable[str], doc_titles: Iterable[str] = (),
+                                  size: Optional[int] = None) -> List[dict]:
+        """
+        Returns the records of the articles with any of anchortexts in their linkable_span, or whose title is in
+        doc_titles, in decreasing order of pageview, like the ES query in get_entities_by_anchortext. At most size
+        records are returned.
+        """
+        postings = [self.get_postings(anchortext) for anchortext in set(anchortexts)]
+        title_doc_indices = sorted(doc_index for doc_index in map(self.get_doc_index_by_title, set(doc_titles))
+                                   if doc_index is not None)
+        doc_indices = []
+        for doc_index in merge(title_doc_indices, *postings):
+            if not doc_indices or doc_index != doc_indices[-1]:
+                doc_indices.append(doc_index)
+                if size is not None and len(doc_indices) >= size:
+                    break
+        return [self.get_record(doc_index) for doc_index in doc_indices]
+
+    def get_records_by_title(self, doc_titles: Iterable[str]) -> List[dict]:
+        """Returns the records of the articles with the given titles (those that exist)"""
+        doc_indices = {self.get_doc_index_by_title(doc_title) for doc_title in doc_titles} - {None}
+        return [self.get_record(doc_index) for doc_index in sorted(doc_indices)]
+
+
+def read_articles(articles_path: str) -> Iterator[dict]:
+    """Yields the articles in an *-integrated.json(.bz2) file, each line of which is a (key, article) tuple literal"""
+    with (bz2.open(articles_path, 'rt') if articles_path.endswith('.bz2') else open(articles_path)) as f:
+        for line in f:
+            if line.strip():
+                yield literal_eval(line)[1]
+
+
+def write_sorted_key_table(f, items: List[tuple], entry: struct.Struct) -> int:
+    """
+    Writes the entries for items, a list of (key bytes, *values) sorted by key, to f followed by the keys blob.
+    Returns the offset of the keys blob.
+    """
+    key_offset = 0
+    for key, *values in items:
+        f.write(entry.pack(key_offset, len(key), *values))
+        key_offset += len(key)
+    keys_offset = f.tell()
+    for key, *_ in items:
+        f.write(key)
+    return keys_offset
+
+
+def build_store(articles: Iterable[dict], store_dir: str) -> int:
+    """Builds a WikiEntityStore in store_dir from articles (dicts, as uploaded to ES). Returns the number of articles."""
+    os.makedirs(store_dir, exist_ok=True)
+
+    # First write each article's record to a scratch file, remembering what we need to order and index it
+    docs = []  # (pageview, scratch offset, record length, title, linkable spans)
+    with tempfile.TemporaryFile(dir=store_dir) as scratch:
+        for article in articles:
+            record = json.dumps({field: article[field] for field in STORED_FIELDS if field in article},
+                                separators=(',', ':')).encode('utf-8')
+            spans = article.get('linkable_span') or [span for span, _ in article.get('linkable_span_info', [])]
+            docs.append((-(article.get('pageview') or 0), scratch.tell(), len(record), article['doc_title'], set(spans)))
+            scratch.write(record)
+        docs.sort(key=lambda doc: doc[0])  # decreasing pageview. the sort is stable, so ties stay in dump order
+
+        with open(os.path.join(store_dir, ENTITIES_FILENAME), 'wb') as f:
+            f.write(b'\0' * HEADER.size)
+            record_offset = 0
+            for _, _, length, _, _ in docs:
+                f.write(RECORD.pack(record_offset, length))
+                record_offset += length
+            records_offset = f.tell()
+            for _, scratch_offset, length, _, _ in docs:
+                scratch.seek(scratch_offset)
+                f.write(scratch.read(length))
+            titles_offset = f.tell()
+            titles = sorted((title.encode('utf-8'), doc_index) for doc_index, (_, _, _, title, _) in enumerate(docs))
+            title_keys_offset = write_sorted_key_table(f, titles, TITLE_KEY)
+            f.seek(0)
+            f.write(HEADER.pack(ENTITIES_MAGIC, VERSION, len(docs), records_offset, titles_offset, title_keys_offset))
+
+    postings: Dict[bytes, List[int]] = {}
+    for doc_index, (_, _, _, _, spans) in enumerate(docs):
+        for span in spans:
+            postings.setdefault(span.encode('utf-8'), []).append(doc_index)
+    with open(os.path.join(store_dir, ANCHORTEXTS_FILENAME), 'wb') as f:
+        f.write(b'\0' * HEADER.size)
+        items, postings_offset = [], 0
+        for anchortext in sorted(postings):
+            items.append((anchortext, postings_offset, len(postings[anchortext])))
+            postings_offset += len(postings[anchortext]) * POSTING.size
+        keys_offset = write_sorted_key_table(f, items, ANCHORTEXT_KEY)
+        postings_section_offset = f.tell()
+        for anchortext, _, _ in items:
+            f.write(struct.pack(f'<{len(postings[anchortext])}I', *postings[anchortext]))
+        f.seek(0)
+        f.write(HEADER.pack(ANCHORTEXTS_MAGIC, VERSION, len(items), keys_offset, postings_section_offset, 0))
+    return len(docs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a WikiEntityStore from the Wikipedia articles dump')
+    parser.add_argument('articles_path', type=str, help='Path of the *-integrated.json.bz2 file (see wiki-es-dump)')
+    parser.add_argument('store_dir', type=str, help='Directory to write the store to')
+    args = parser.parse_args()
+    num_docs = build_store(read_articles(args.articles_path), args.store_dir)
+    print(f'Wrote {num_docs} articles to {args.store_dir}')
@@ -3,6 +3,16 @@ progressive_response = False
 use_timeouts = True
 inf_timeout = 10**6  # this might be interpreted as 1 million seconds or 1 million milliseconds (1000 seconds) depending on the context; we make it large enough that it doesn't matter either way
 USE_ASR_ROBUSTNESS_OVERALL_FLAG = True  # enable ASR robustness in the entity linker
+request_batching_window = 0  # seconds. if > 0, concurrent calls to batchable RemoteCallables are merged into one request (see callables.MicroBatcher)
+# If True, WikiEntities in the state are serialized as (doc_id, name, confidence) and refetched when used (see
+# WikiEntityHandler). Over a 60 turn conversation this shrinks the entity tracker and linker states from 324KB to 14KB,
+# and their encode + decode from 46ms to 2.7ms, for one batched lookup when a restored entity is first used (0.3ms from
+# the caches, one ES round trip otherwise; see test/benchmarks/entity_state_size.py).
+compact_entity_serialization = True
+# If True, the active RG's prefetch function runs in the background after each turn (see ResponseGenerator.prefetch).
+# Off by default: WIKI's prefetch calls the infiller for turns that mostly don't need it, which roughly doubles the
+# infiller's load (155 -> 311 calls in test/benchmarks/wiki_infiller_prefetch.py).
+prefetch_after_turn = False
 
 # This is the max size the entire item that we write to dynamodb
 SIZE_THRESHOLD = 400*1024 - 100 # 400 kb - 100 bytes for
@@ -2,7 +2,17 @@ from dataclasses import dataclass
 import time
 import jsonpickle
 from functools import wraps
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
 import asyncio
+import itertools
+import json
+import math
+import os
+import threading
+import uuid
 import logging
 logger = logging.getLogger('chirpylogger')
 
@@ -10,24 +20,224 @@ FIGSIZE = (10, 10)  # figure size for the latency plot
 
 MIN_DURATION = 1  # milliseconds. anything with duration shorter than this is not shown
 
+# If set, each finished trace is appended to this file, in Chrome trace event format (open it in chrome://tracing
+# or https://ui.perfetto.dev, or summarize it with `python -m chirpy.core.latency <path>`)
+TRACE_FILE = os.environ.get('CHIRPY_TRACE_FILE')
+
 @dataclass
 class Event:
     """
-    A simple dataclass to store events
+    A simple dataclass to store events. Events are spans: span_id is unique within the trace, and parent_id is the
+    span_id of the enclosing event (None for top-level events).
     """
     begin: float
     end: float
     function_name: str
+    span_id: int = 0
+    parent_id: Optional[int] = None
+    thread_id: int = 0
+
+
+class Trace:
+    """
+    The events of one turn. Each turn (or other unit of work) gets its own Trace, which is stored in a context
+    variable, so concurrent sessions don't share events. Worker threads see the Trace of the code that submitted
+    their work, as long as the work is run in a copy of the submitter's context (see contextvars.copy_context).
+    """
+    def __init__(self, trace_id: Optional[str] = None, session_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.session_id = session_id
+        self.events: List[Event] = []  # appended to from several threads; list.append is atomic
+        self._span_ids = itertools.count(1)
+
+    def new_span_id(self) -> int:
+        return next(self._span_ids)
+
+    def to_trace_events(self) -> List[dict]:
+        """Returns the events as complete ("X") events in Chrome trace event format, with times in microseconds"""
+        pid = os.getpid()
+        return [{'name': event.function_name, 'cat': 'chirpy', 'ph': 'X', 'pid': pid, 'tid': event.thread_id,
+                 'ts': event.begin / 1000, 'dur': (event.end - event.begin) / 1000,
+                 'args': {'trace_id': self.trace_id, 'session_id': self.session_id, 'span_id': event.span_id,
+                          'parent_id': event.parent_id}}
+                for event in self.events]
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar('chirpy_trace', default=None)
+_current_span: ContextVar[Optional[int]] = ContextVar('chirpy_span', default=None)
+
+
+def start_trace(session_id: Optional[str] = None, trace_id: Optional[str] = None) -> Trace:
+    """
+    Start a new trace in the current context, and return it. Events measured in this context (and in tasks and
+    threads started from it) are saved to this trace. Should be called at the beginning of each turn.
+    """
+    trace = Trace(trace_id=trace_id, session_id=session_id)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def get_current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def get_events() -> List[Event]:
+    """Returns the events of the current trace"""
+    trace = _current_trace.get()
+    return trace.events if trace is not None else []
+
+
+def clear_events():
+    """
+    Start a new, empty trace in the current context. Should be called at the beginning of each turn
+    """
+    start_trace()
+
+
+@contextmanager
+def trace_turn(session_id: Optional[str] = None, trace_id: Optional[str] = None):
+    """
+    Context manager that runs its body in a new trace, then restores the previous trace and calls finish_trace.
+    Yields the new Trace.
+    """
+    trace = Trace(trace_id=trace_id, session_id=session_id)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        finish_trace(trace)
+
+
+def finish_trace(trace: Trace, path: Optional[str] = None):
+    """
+    Record the trace's latencies in latency_stats, and export it to path (default TRACE_FILE), if set. Should be
+    called at the end of each turn.
+    """
+    latency_stats.add_trace(trace)
+    path = path or TRACE_FILE
+    if path:
+        try:
+            export_trace(trace, path)
+        except Exception:
+            logger.error(f'Failed to export trace {trace.trace_id} to {path}', exc_info=True)
+
+
+_export_lock = threading.Lock()
+
+def export_trace(trace: Trace, path: str):
+    """
+    Append the trace's events to the file at path, in the JSON Array format of the Chrome trace event format. The
+    closing ] is left off (which the format allows), so that more traces can be appended later.
+    """
+    lines = ''.join(json.dumps(event) + ',\n' for event in trace.to_trace_events())
+    with _export_lock:
+        with open(path, 'a') as f:
+            if f.tell() == 0:
+                f.write('[\n')
+            f.write(lines)
+
+
+def load_trace_file(path: str) -> List[dict]:
+    """Load the trace events saved to path by export_trace"""
+    with open(path) as f:
+        text = f.read().strip()
+    if not text.endswith(']'):
+        text = text.rstrip(',') + ']'
+    return json.loads(text)
+
+
+def _record(trace: Trace, begin: int, end: int, function_name: str, span_id: int, parent_id: Optional[int]):
+    trace.events.append(Event(begin=begin, end=end, function_name=function_name, span_id=span_id,
+                              parent_id=parent_id, thread_id=threading.get_ident()))
+
+
+@contextmanager
+def span(function_name: str):
+    """
+    Context manager that saves the time taken by its body to the current trace as an event called function_name.
+    Does nothing if there is no current trace.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    span_id = trace.new_span_id()
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    begin = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        end = time.perf_counter_ns()
+        _current_span.reset(token)
+        _record(trace, begin, end, function_name, span_id, parent_id)
+
+
+class LatencyStats:
+    """
+    Collects the latency of each function across many traces, and reports percentiles. Only the most recent
+    max_samples latencies of each function are kept (all of them, if max_samples is None). Thread-safe.
+    """
+    def __init__(self, max_samples: Optional[int] = 10000):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.max_samples))
+
+    def add(self, function_name: str, latency_ms: float):
+        with self._lock:
+            self._latencies[function_name].append(latency_ms)
 
-# A globally accessible list of events
-event_list = []
+    def add_trace(self, trace: Trace):
+        with self._lock:
+            for event in trace.events:
+                self._latencies[event.function_name].append((event.end - event.begin) / 1000000)
 
-# The name of dynamodb table where event_list should be saved
+    def add_trace_events(self, trace_events: List[dict]):
+        """Add events in Chrome trace event format, e.g. from load_trace_file"""
+        with self._lock:
+            for event in trace_events:
+                if event.get('ph') == 'X':
+                    self._latencies[event['name']].append(event['dur'] / 1000)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Returns a dict mapping each function name to its count and p50 / p95 / p99 latency, in milliseconds"""
+        with self._lock:
+            latencies = {name: sorted(values) for name, values in self._latencies.items()}
+        return {name: {'count': len(values), 'p50': _percentile(values, 50), 'p95': _percentile(values, 95),
+                       'p99': _percentile(values, 99)}
+                for name, values in latencies.items() if values}
+
+    def format_summary(self) -> str:
+        rows = sorted(self.summary().items(), key=lambda item: item[1]['p50'], reverse=True)
+        width = max([len(name) for name, _ in rows], default=8)
+        lines = [f"{'function':<{width}} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"]
+        for name, stats in rows:
+            lines.append(f"{name:<{width}} {stats['count']:>7} {stats['p50']:>9.2f} {stats['p95']:>9.2f} {stats['p99']:>9.2f}")
+        return '\n'.join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._latencies.clear()
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    """Returns the p-th percentile of sorted_values, using the nearest-rank method"""
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+# Latencies of every finished trace in this process
+latency_stats = LatencyStats()
+
+# The name of dynamodb table where the events should be saved
 dynamodb_table_name = 'latency_log'
 
 def log_events_to_dynamodb(conversation_id:str, session_id:str, creation_date_time: str):
     """
-    Logs event_list to dynamodb table. This function should be called at the end of every turn.
+    Logs the current trace's events to dynamodb table. This function should be called at the end of every turn.
     :param conversation_id:
     :param session_id:
     :param creation_date_time:
@@ -37,22 +247,16 @@ def log_events_to_dynamodb(conversation_id:str, session_id:str, creation_date_ti
     from cobot_python_sdk.dynamodb_manager import DynamoDbManager
     logger.info("log_events ended")
 
-def clear_events():
-    """
-    Clear the global event_list. Should be called at the beginning of each turn
-    """
-    event_list.clear()
-
 def save_latency_plot(path: str):
     """
-    Save a latency plot of the current events in event_list
+    Save a latency plot of the events in the current trace
     :param path: the path to save the latency plot
     """
 
     from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
     from matplotlib.figure import Figure
     fig = Figure(figsize=FIGSIZE)
-    plot_latency(event_list, fig)
+    plot_latency(get_events(), fig)
     canvas = FigureCanvas(fig)
     fig.savefig(path, format='png')
 
@@ -116,52 +320,75 @@ def plot_latency(event_list, fig):
 
 def measure(fn=None, name=None):
     """
-    A decorator to wrap a function with code to measure begin and end time
+    A decorator to wrap a function with code to measure begin and end time. The event is saved to the current trace
+    (if there is one), as a child of the enclosing event.
     :param fn: the function to wrap
     :return: wrapped function
     """
     @wraps(fn)
     def measured_fn(*args, **kwargs):
+        trace = _current_trace.get()
+        if trace is None:
+            return fn(*args, **kwargs)
+        span_id = trace.new_span_id()
+        parent_id = _current_span.get()
+        token = _current_span.set(span_id)
         begin = time.perf_counter_ns()
-        result = fn(*args, **kwargs)
-        end = time.perf_counter_ns()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            end = time.perf_counter_ns()
+            _current_span.reset(token)
 
-        # Special case for catching functions run using `run_module`
-        if name is not None:
-            function_name = name
-        else:
-            function_name = fn.__qualname__
-            if function_name == 'run_module':
-                class_object = args[0]
-                class_name = type(class_object).__name__
-                if class_name == 'RemoteServiceModule':
-                    class_name = class_object.module_name
-                function_name = f'{class_name}.{args[1]}'
-            elif function_name == 'initialize_module':
-                module_class = args[0]
-                class_name = module_class.__name__
-                function_name = "{}.__init__".format(class_name)
-
-
-        event_list.append(Event(begin=begin, end=end, function_name=function_name))
-        return result
+            # Special case for catching functions run using `run_module`
+            if name is not None:
+                function_name = name
+            else:
+                function_name = fn.__qualname__
+                if function_name == 'run_module':
+                    class_object = args[0]
+                    class_name = type(class_object).__name__
+                    if class_name == 'RemoteServiceModule':
+                        class_name = class_object.module_name
+                    function_name = f'{class_name}.{args[1]}'
+                elif function_name == 'initialize_module':
+                    module_class = args[0]
+                    class_name = module_class.__name__
+                    function_name = "{}.__init__".format(class_name)
+
+            _record(trace, begin, end, function_name, span_id, parent_id)
     return measured_fn
 
 def create_measured_task(coro):
+    trace = _current_trace.get()
+    if trace is None:
+        return asyncio.create_task(coro)
+    span_id = trace.new_span_id()
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)  # so the task (which copies the current context) is the parent of its events
     begin = time.perf_counter_ns()
-    task = asyncio.create_task(coro)
+    try:
+        task = asyncio.create_task(coro)
+    finally:
+        _current_span.reset(token)
     def done_callback(fut):
         end = time.perf_counter_ns()
-        function_name = coro.__qualname__
-        event_list.append(Event(begin=begin, end=end, function_name=function_name))
+        _record(trace, begin, end, coro.__qualname__, span_id, parent_id)
 
     task.add_done_callback(done_callback)
     return task
 
 def measured_run(main, debug=False):
-    begin = time.perf_counter_ns()
-    retval = asyncio.run(main, debug)
-    end = time.perf_counter_ns()
-    function_name = main.__qualname__
-    event_list.append(Event(begin=begin, end=end, function_name=function_name))
-    return retval
\ No newline at end of file
+    with span(main.__qualname__):
+        return asyncio.run(main, debug=debug)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Print p50 / p95 / p99 latency per function for trace files saved by export_trace')
+    parser.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+    stats = LatencyStats(max_samples=None)
+    for path in args.paths:
+        stats.add_trace_events(load_trace_file(path))
+    print(stats.format_summary())
@@ -1,7 +1,12 @@
+import bisect
 import logging
 import os
+import re
 import string
-from chirpy.core.util import load_text_file, contains_phrase
+from typing import List, Set, Tuple
+
+from chirpy.core.phrase_matcher import PhraseMatcher
+from chirpy.core.util import load_text_file
 
 logger = logging.getLogger('chirpylogger')
 
@@ -55,28 +60,40 @@ WHITELIST_PHRASES = set(['kill bill', 'beavis and butt head', 'beavis and butt-h
                          'they suck', 'he\'s sexy', 'she\'s sexy', 'vegas strip', 'hell comes to frogtown',
                          'dick van dyke', 'blood and bullets', 'blood prison', 'dick powell', 'comic strip', 'comic strips'])
 
+# Removes the whitelisted phrases from text in one pass. Longer phrases go first so that e.g. "to kill a mockingbird"
+# is removed whole rather than leaving "to".
+WHITELIST_REGEX = re.compile('|'.join(re.escape(phrase) for phrase in sorted(WHITELIST_PHRASES, key=len, reverse=True)))
+
+# Translation tables used to make the variants of text that are checked against the blacklist
+REMOVE_SPECIAL_CHARS = str.maketrans('', '', SPECIAL_CHARS)
+PUNCTUATION_TO_SPACE = str.maketrans({p: ' ' for p in string.punctuation})
+REMOVE_PUNCTUATION = str.maketrans('', '', string.punctuation)
+
+
 class OffensiveClassifier(object):
     """A class to load, and check text against, our preprocessed offensive phrases file"""
 
     preprocessed_blacklist_file = os.path.join(os.path.dirname(__file__), 'data_preprocessed/offensive_phrases_preprocessed.txt')
 
-    def __init__(self):
+    def __init__(self, additional_phrases: Set[str] = set()):
         """
-        Load the preprocessed blacklist from file. The blacklist is lowercase and already contains alternative versions
-        of offensive phrases (singulars, plurals, variants with and without punctuation).
+        Load the preprocessed blacklist from file, add additional_phrases, and compile it into a PhraseMatcher. The
+        blacklist is lowercase and already contains alternative versions of offensive phrases (singulars, plurals,
+        variants with and without punctuation).
         """
         self.blacklist = load_text_file(self.preprocessed_blacklist_file)  # set of lowercase strings
         self.blacklist = self.blacklist.difference(REMOVE_FROM_BLACKLIST)
-        self.blacklist = self.blacklist.union(ADD_TO_BLACKLIST)
+        self.blacklist = self.blacklist.union(ADD_TO_BLACKLIST).union(additional_phrases)
         self.blacklist_max_len = max({len(phrase.split()) for phrase in self.blacklist})
+        self.matcher = PhraseMatcher(self.blacklist)
 
     def contains_offensive(self, text: str, log_message: str = 'text "{}" contains offensive phrase "{}"') -> bool:
         """
         Returns True iff text contains an offensive phrase.
 
         This function copies the checking function in profanity_checker.py, however:
-            (a) we use contains_phrase rather than their _text_contains_exact_word_fast because contains_phrase is
-                faster when the blacklist is long
+            (a) we use a PhraseMatcher rather than their _text_contains_exact_word_fast because it is faster when the
+                blacklist is long
             (b) we remove punctuation from text in the same way as profanity_checker.py, but we also try removing in
                 other ways and check those variants too.
         """
@@ -84,50 +101,95 @@ class OffensiveClassifier(object):
         text = text.lower().strip()
 
         # Remove whitelisted phrases from text
-        for whitelisted_phrase in WHITELIST_PHRASES:
-            if whitelisted_phrase in text:
-                logger.debug(f'Removing whitelisted phrase "{whitelisted_phrase}" from text "{text}" before checking for offensive phrases')
-                text = text.replace(whitelisted_phrase, '').strip()
+        text, num_removed = WHITELIST_REGEX.subn('', text)
+        if num_removed:
+            logger.debug(f'Removed {num_removed} whitelisted phrase(s) from text before checking for offensive phrases, leaving "{text}"')
+        text = text.strip()
 
         # List of variants of text to check
-        texts = set()
+        texts = []
 
         # Remove special characters the same way the Amazon code does (leaving * and ' in)
-        texts.add(text.translate({ord(p): '' for p in SPECIAL_CHARS}))
+        texts.append(text.translate(REMOVE_SPECIAL_CHARS))
 
         # Remove all string.punctuation, replacing with ''.
         # Unlike the Amazon code, this will catch things like "pissin'".
         # "pissin" and "pissing" are in our blacklist, but "pissin'" is not.
-        # texts.add(text.translate({ord(p): '' for p in string.punctuation}))
+        # texts.append(text.translate(REMOVE_PUNCTUATION))
 
         # Remove all string.punctuation, replacing with ' '.
         # This will catch things like "fuck-day" or "shit's" where we have an offensive word ("fuck", "shit") connected
         # via punctuation to a non-offensive word ("day", "s"), and the compound is not in our blacklist.
-        texts.add(' '.join(text.translate({ord(p): ' ' for p in string.punctuation}).split()))
+        texts.append(text.translate(PUNCTUATION_TO_SPACE))
 
         # Also check the original text with no punctuation removed
         # This will catch things like "a$$" which are on our blacklist.
         # However, it won't catch "a$$" if it occurs next to non-whitespace e.g. "I love a$$."
-        texts.add(text)
+        texts.append(text)
 
         # Check all the variants
-        for text in texts:
-            if contains_phrase(text, self.blacklist, log_message, lowercase_text=False, lowercase_phrases=False,
-                               remove_punc_text=False, remove_punc_phrases=False, max_phrase_len=self.blacklist_max_len):
-                logger.primary_info(f"[Offensive Classifier] Detected blacklisted word {text}")
+        for variant in dict.fromkeys(texts):
+            offensive_phrase = self.matcher.find_first(variant)
+            if offensive_phrase is not None:
+                if log_message:
+                    logger.info(log_message.format(variant, offensive_phrase))
+                logger.primary_info(f"[Offensive Classifier] Detected blacklisted word {variant}")
                 return True
 
-        # dealing with false positives for "He'll"
-        if contains_phrase(text.translate({ord(p): '' for p in string.punctuation}), self.blacklist - {'hell'}, log_message, lowercase_text=False, lowercase_phrases=False,
-                           remove_punc_text=False, remove_punc_phrases=False, max_phrase_len=self.blacklist_max_len):
+        # With all punctuation removed, "he'll" becomes "hell", so ignore that
+        for _, offensive_phrase in self.matcher.find_all(text.translate(REMOVE_PUNCTUATION)):
+            if offensive_phrase != 'hell':
+                if log_message:
+                    logger.info(log_message.format(text, offensive_phrase))
                 return True
         return False
 
+    def find_offensive_windows(self, text: str) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+        """
+        Finds the offensive and whitelisted phrases in text once, so that contains_offensive can be answered for all
+        the ngrams of text without checking each one.
+
+        Returns (offensive_windows, whitelisted_windows), lists of (start, end) windows of word indices into
+        text.split(). For an ngram of text that contains no whitelisted window, contains_offensive(ngram) is True iff
+        some offensive window lies within the ngram. Whitelisted phrases are removed as substrings (which can split or
+        join words), so ngrams that contain a whitelisted window have to be checked with contains_offensive.
+        """
+        words = text.lower().split()
+
+        # Find every occurrence of every whitelisted phrase, and the words it starts and ends in
+        joined_text = ' '.join(words)
+        word_starts, word_ends, offset = [], [], 0
+        for word in words:
+            word_starts.append(offset)
+            word_ends.append(offset + len(word))
+            offset += len(word) + 1
+        whitelisted_windows = []
+        for phrase in WHITELIST_PHRASES:
+            occurrence_start = joined_text.find(phrase)
+            while occurrence_start != -1:
+                occurrence_end = occurrence_start + len(phrase)
+                whitelisted_windows.append((bisect.bisect_right(word_starts, occurrence_start) - 1,
+                                            bisect.bisect_left(word_ends, occurrence_end) + 1))
+                occurrence_start = joined_text.find(phrase, occurrence_start + 1)
+
+        # The variants of text checked by contains_offensive (with the phrases to ignore in each). Each one transforms
+        # each word separately, so we match the whole text and map each match back to the words it came from.
+        offensive_windows = []
+        for translation, ignored_phrases in [(REMOVE_SPECIAL_CHARS, ()), (PUNCTUATION_TO_SPACE, ()), (None, ()),
+                                             (REMOVE_PUNCTUATION, ('hell',))]:
+            variant_words, variant_word2word = [], []
+            for i, word in enumerate(words):
+                for variant_word in (word if translation is None else word.translate(translation)).split():
+                    variant_words.append(variant_word)
+                    variant_word2word.append(i)
+            for start, offensive_phrase in self.matcher.find_all(' '.join(variant_words)):
+                if offensive_phrase not in ignored_phrases:
+                    end = start + len(offensive_phrase.split())
+                    offensive_windows.append((variant_word2word[start], variant_word2word[end - 1] + 1))
+        return offensive_windows, whitelisted_windows
 
 OFFENSIVE_CLASSIFIER = OffensiveClassifier()
-NEWS_OFFENSIVE_CLASSIFIER = OffensiveClassifier()
-NEWS_OFFENSIVE_CLASSIFIER.blacklist = NEWS_OFFENSIVE_CLASSIFIER.blacklist.union(ADD_TO_BLACKLIST_NEWS)
-NEWS_OFFENSIVE_CLASSIFIER.blacklist_max_len = max({len(phrase.split()) for phrase in NEWS_OFFENSIVE_CLASSIFIER.blacklist})
+NEWS_OFFENSIVE_CLASSIFIER = OffensiveClassifier(ADD_TO_BLACKLIST_NEWS)
 
 
 def contains_offensive(text: str, log_message: str = 'text "{}" contains offensive phrase "{}"'):
@@ -143,6 +205,13 @@ def contains_offensive(text: str, log_message: str = 'text "{}" contains offensi
     """
     return OFFENSIVE_CLASSIFIER.contains_offensive(text, log_message)
 
+def find_offensive_windows(text: str) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+    """
+    Returns the (start, end) word windows of the offensive and of the whitelisted phrases in text, which determine
+    contains_offensive for the ngrams of text (see OffensiveClassifier.find_offensive_windows).
+    """
+    return OFFENSIVE_CLASSIFIER.find_offensive_windows(text)
+
 def contains_offensive_news(text: str, log_message: str = 'text "{}" contains offensive phrase "{}"'):
     """
     Checks whether the text contains any offensive phrases on our blacklist for news rg only
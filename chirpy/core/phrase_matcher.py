@@ -0,0 +1,83 @@
+"""
+A compiled matcher for checking text against a large, fixed set of phrases (e.g. the offensive phrases blacklist).
+"""
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class PhraseMatcher:
+    """
+    An Aho-Corasick automaton over words, built once from a set of phrases. It finds every occurrence of every phrase
+    in a text in a single pass over the text's words, however many phrases there are.
+
+    Matching has the same semantics as contains_phrase: text and phrases are split on whitespace, and a phrase occurs
+    in text iff it's equal to a whole-word ngram of text (so "cat" doesn't occur in "category"). No lowercasing or
+    punctuation removal is done; normalize text the same way as the phrases before matching.
+    """
+
+    def __init__(self, phrases: Iterable[str]):
+        # Like contains_phrase, only phrases that are equal to a space-separated ngram can ever match
+        self.phrases = frozenset(phrase for phrase in phrases if phrase and ' '.join(phrase.split()) == phrase)
+        self.max_phrase_len = max((len(phrase.split()) for phrase in self.phrases), default=0)
+
+        # State 0 is the root. _goto[s] maps a word to the next state, _output[s] is the phrase ending at state s (if
+        # any), _fail[s] is the state for the longest proper suffix of s's words that is a prefix of some phrase, and
+        # _output_link[s] is the nearest state on s's fail chain that has an output (0 if there is none).
+        self._goto: List[Dict[str, int]] = [{}]
+        self._output: List[Optional[str]] = [None]
+        for phrase in self.phrases:
+            state = 0
+            for word in phrase.split():
+                next_state = self._goto[state].get(word)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][word] = next_state
+                    self._goto.append({})
+                    self._output.append(None)
+                state = next_state
+            self._output[state] = phrase
+
+        self._fail = [0] * len(self._goto)
+        self._output_link = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, next_state in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(word, 0)
+                fail = self._fail[next_state]
+                self._output_link[next_state] = fail if self._output[fail] is not None else self._output_link[fail]
+                queue.append(next_state)
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def find_all(self, text: str) -> Iterator[Tuple[int, str]]:
+        """
+        Yields (start, phrase) for each occurrence of a phrase in text, where start is the index of the phrase's first
+        word in text.split(). Occurrences are yielded in order of their last word; for occurrences ending at the same
+        word, longer phrases come first.
+        """
+        goto, fail, output, output_link = self._goto, self._fail, self._output, self._output_link
+        state = 0
+        for end, word in enumerate(text.split(), 1):
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            match_state = state if output[state] is not None else output_link[state]
+            while match_state:
+                phrase = output[match_state]
+                yield end - len(phrase.split()), phrase
+                match_state = output_link[match_state]
+
+    def find_first(self, text: str) -> Optional[str]:
+        """Returns the first phrase (see find_all) that occurs in text, or None if there is none"""
+        for _, phrase in self.find_all(text):
+            return phrase
+        return None
+
+    def contains(self, text: str) -> bool:
+        """Returns True iff some phrase occurs in text"""
+        return self.find_first(text) is not None
@@ -0,0 +1,137 @@
+"""
+Pooled, thread-safe access to the Postgres databases used by the RGs and agents (the twitter opinions, MusicBrainz and
+the session store).
+
+Each database has one PostgresPool per process, created at import time by the module that uses it. A PostgresPool
+opens its connections lazily and keeps them open between queries, so connecting isn't on the response path. Queries
+are always parameterized (psycopg2 binds the args), and can have a timeout, which Postgres enforces as a
+statement_timeout for that query only.
+"""
+
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+import psycopg2
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+logger = logging.getLogger('chirpylogger')
+
+# Args of a query: a sequence for %s placeholders, or a dict for %(name)s placeholders
+QueryArgs = Optional[Union[Sequence[Any], Dict[str, Any]]]
+
+# The most connections each PostgresPool opens, per process
+MAX_CONNECTIONS = int(os.environ.get('POSTGRES_POOL_MAX_CONNECTIONS', 8))
+
+
+class _LazyThreadedConnectionPool(ThreadedConnectionPool):
+    """
+    A ThreadedConnectionPool that doesn't open any connections until they're needed, but then keeps up to maxconn of
+    them open. (ThreadedConnectionPool opens minconn connections up front, and closes connections beyond minconn when
+    they're returned.)
+    """
+
+    def __init__(self, maxconn: int, **kwargs):
+        super().__init__(0, maxconn, **kwargs)
+        self.minconn = maxconn
+
+
+class PostgresPool:
+    """
+    A pool of up to max_connections connections to one database, which can be shared by all the threads of a process.
+
+    Each query checks out a connection (waiting up to checkout_timeout seconds for one to be free), runs in its own
+    transaction, and returns the connection. Connections that were closed (e.g. by a database restart) are replaced.
+    """
+
+    def __init__(self, max_connections: int = MAX_CONNECTIONS, checkout_timeout: float = 2.0, timeout: Optional[float] = None,
+                 **connect_kwargs):
+        """
+        @param max_connections: the most connections the pool opens
+        @param checkout_timeout: how long a query waits for a free connection before raising PoolError (seconds)
+        @param timeout: the default timeout of each query (seconds), or None for no timeout
+        @param connect_kwargs: the args of psycopg2.connect (host, port, database / dbname, user, password...)
+        """
+        self.max_connections = max_connections
+        self.checkout_timeout = checkout_timeout
+        self.timeout = timeout
+        self.connect_kwargs = connect_kwargs
+        self._pool: Optional[_LazyThreadedConnectionPool] = None
+        self._pool_lock = threading.Lock()
+        self._available = threading.BoundedSemaphore(max_connections)
+
+    @property
+    def name(self) -> str:
+        return self.connect_kwargs.get('database') or self.connect_kwargs.get('dbname') or 'postgres'
+
+    def _get_pool(self) -> _LazyThreadedConnectionPool:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = _LazyThreadedConnectionPool(self.max_connections, **self.connect_kwargs)
+            return self._pool
+
+    @contextmanager
+    def connection(self) -> Iterator['psycopg2.extensions.connection']:
+        """
+        Checks out a connection, for the duration of the with block. The connection is in a transaction, which is
+        committed at the end of the block, or rolled back if the block raises.
+        """
+        if not self._available.acquire(timeout=self.checkout_timeout):
+            raise PoolError(f'No free connection to {self.name} after {self.checkout_timeout} seconds')
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+            if conn.closed:
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+            close = False
+            try:
+                yield conn
+                conn.commit()
+            except BaseException as e:
+                if conn.closed or isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+                    logger.warning(f'Discarding connection to {self.name} after {type(e).__name__}: {e}')
+                    close = True
+                else:
+                    conn.rollback()
+                raise
+            finally:
+                pool.putconn(conn, close=close)
+        finally:
+            self._available.release()
+
+    def _execute(self, cursor, sql: str, args: QueryArgs, timeout: Optional[float]):
+        timeout = self.timeout if timeout is None else timeout
+        if timeout is not None:
+            cursor.execute('SET LOCAL statement_timeout = %s', (int(timeout * 1000),))
+        cursor.execute(sql, args)
+
+    def fetchall(self, sql: str, args: QueryArgs = None, timeout: Optional[float] = None) -> List[tuple]:
+        """Runs the query sql with args, and returns all its rows. timeout overrides the pool's default."""
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                self._execute(cursor, sql, args, timeout)
+                return cursor.fetchall()
+
+    def fetchone(self, sql: str, args: QueryArgs = None, timeout: Optional[float] = None) -> Optional[tuple]:
+        """Runs the query sql with args, and returns its first row, or None if there are none"""
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                self._execute(cursor, sql, args, timeout)
+                return cursor.fetchone()
+
+    def execute(self, sql: str, args: QueryArgs = None, timeout: Optional[float] = None) -> int:
+        """Runs the statement sql with args (e.g. an INSERT), commits it, and returns the number of rows it affected"""
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                self._execute(cursor, sql, args, timeout)
+                return cursor.rowcount
+
+    def close(self):
+        """Closes all the connections. The pool opens new ones if it's used again."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
@@ -1,5 +1,7 @@
 import re
+import threading
 from time import perf_counter_ns
+from typing import Dict, List, Optional, Type
 import unittest
 import logging
 
@@ -18,11 +20,82 @@ def print_exception(title, msg):
     print(msg)
     print()
 
+class CompiledRegexTemplate:
+    """
+    The runtime matcher of a RegexTemplate subclass: its templates, with the slots filled in, compiled to regexes.
+    Each RegexTemplate subclass is compiled once per process (see get_compiled_template), and the result is shared by
+    all the callers, so executing a template doesn't construct a TestCase or compile anything.
+    """
+
+    def __init__(self, name: str, compiled_regexes: List['re.Pattern']):
+        self.name = name
+        self.compiled_regexes = compiled_regexes
+
+    def execute(self, input_string: str) -> Optional[Dict[str, str]]:
+        """
+        Try to match input_string against self.compiled_regexes, in order.
+        Returns the slot values for the FIRST matched regex, or returns None if no match is found.
+        """
+        for r in self.compiled_regexes:
+            matched = r.match(input_string)
+            if matched:
+                return {k: v for k, v in matched.groupdict().items() if v is not None}
+        return None
+
+
+def compile_template(template_cls: Type['RegexTemplate']) -> CompiledRegexTemplate:
+    """Fills in the slots of template_cls's templates and compiles them"""
+    t0 = perf_counter_ns()
+
+    # Check that slots and templates have been defined by the subclass
+    assert template_cls.slots is not None, 'self.slots should not be None. It should be defined as a class constant in the class inheriting from RegexTemplate.'
+    assert template_cls.templates is not None, 'self.templates should not be None. It should be defined as a class constant in the class inheriting from RegexTemplate.'
+
+    # Dictionary from slot name -> regex for that slot in a named group. Lists of strings become "OR" regex strings.
+    # e.g. 'my_name_is' -> '(?P<my_name_is>my name is|call me|i'm called)'
+    slot_name_to_regex_group = {}
+    for slot_name, slot_regex in template_cls.slots.items():
+        if isinstance(slot_regex, list):
+            slot_regex = oneof(slot_regex)
+        else:
+            assert isinstance(slot_regex, str), f"The values in the slots dictionary should be either strings or lists of strings, not {type(slot_regex)}"
+        slot_name_to_regex_group[slot_name] = "(?P<{}>{})".format(slot_name, slot_regex)
+
+    # For each template, replace each {slot_name} with its regex. Also add start and end characters (^ and $).
+    # e.g. '{my_name_is} {name}' -> '^(?P<my_name_is>my name is|call me|i'm called) (?P<name>.+?)$'
+    regexes = ['^' + template.format(**slot_name_to_regex_group) + '$' for template in template_cls.templates]
+    compiled_regexes = [re.compile(r) for r in regexes]
+
+    logger.debug(f'RegexTemplate ({template_cls.__name__}) compiled {len(compiled_regexes)} regexes in '
+                 f'{(perf_counter_ns()-t0)/10**9} seconds.')
+    return CompiledRegexTemplate(template_cls.__name__, compiled_regexes)
+
+
+_compiled_templates: Dict[type, CompiledRegexTemplate] = {}
+_compiled_templates_lock = threading.Lock()
+
+
+def get_compiled_template(template_cls: Type['RegexTemplate']) -> CompiledRegexTemplate:
+    """Returns the CompiledRegexTemplate of template_cls, compiling it if this is the first time it's needed"""
+    compiled_template = _compiled_templates.get(template_cls)
+    if compiled_template is None:
+        with _compiled_templates_lock:
+            compiled_template = _compiled_templates.get(template_cls)
+            if compiled_template is None:
+                compiled_template = compile_template(template_cls)
+                _compiled_templates[template_cls] = compiled_template
+    return compiled_template
+
+
 class RegexTemplate(unittest.TestCase):
     """
     A class to specify a regex template that can be used to match text and extract slots.
     This class inherits from TestCase and implements a test (test_examples) so that any subclass of RegexTemplate
     will automatically be a TestCase with the test_examples test.
+
+    To match text at runtime, use the shared compiled template, which avoids constructing a TestCase:
+
+        slots = MyNameIsTemplate.compiled().execute(text)
     """
 
     # The following class constants should be overwritten by the subclass inheriting from RegexTemplate:
@@ -48,74 +121,29 @@ class RegexTemplate(unittest.TestCase):
         Note that we can't change the signature of __init__ because we're inheriting from TestCase.
         TestCase needs to be able to init this class with its expected args/kwargs.
         """
-        logger.debug(f'RegexTemplate ({type(self).__name__}) is starting __init__...')
-        t0 = perf_counter_ns()
         super().__init__(*args, **kwargs)  # init TestCase parent class
-        time_for_parent_init = perf_counter_ns()-t0
 
         # Only need to do the rest of initializing if we're initializing a subclass of RegexTemplate
         if type(self) == RegexTemplate:
             return
 
-        # Check that slots, templates, positive_examples and negative_examples have been defined by the subclass
-        assert self.slots is not None, 'self.slots should not be None. It should be defined as a class constant in the class inheriting from RegexTemplate.'
-        assert self.templates is not None, 'self.templates should not be None. It should be defined as a class constant in the class inheriting from RegexTemplate.'
+        # Check that positive_examples and negative_examples have been defined by the subclass
         assert self.positive_examples is not None, 'self.positive_examples should not be None. It should be defined as a class constant in the class inheriting from RegexTemplate.'
         assert self.negative_examples is not None, 'self.negative_examples should not be None. It should be defined as a class constant in the class inheriting from RegexTemplate.'
 
-        # In self.slots, convert lists of strings to "OR" regex strings
-        for name, value in self.slots.items():
-            if isinstance(value, list):
-                self.slots[name] = oneof(value)
-            else:
-                assert isinstance(value, str), f"The values in the slots dictionary should be either strings or lists of strings, not {type(value)}"
-
-        # Dictionary from slot name -> regex for that slot in a named group
-        # e.g. 'my_name_is' -> '(?P<my_name_is>my name is|call me|i'm called)'
-        slot_name_to_regex_group = {
-            slot_name: "(?P<{}>{})".format(slot_name, slot_regex) for slot_name, slot_regex in
-            self.slots.items()
-        }
-
-        # For each template, replace each {slot_name} with its regex. Also add start and end characters (^ and $).
-        # e.g. '{my_name_is} {name}' -> '^(?P<my_name_is>my name is|call me|i'm called) (?P<name>.+?)$'
-        regexes = ['^' + template.format(**slot_name_to_regex_group) + '$' for template in
-                   self.templates]
-
-        # Compile the regexes
-        t0_compile = perf_counter_ns()
-        self.compiled_regexes = []
-        for r in regexes:
-            # t0_indiv = perf_counter_ns()
-            self.compiled_regexes.append(re.compile(r))
-            # logger.debug(f'RegexTemplate ({type(self).__name__}) took {(perf_counter_ns()-t0_indiv)/10**9} seconds to compile {r}')
-        time_to_compile = perf_counter_ns() - t0_compile
-
-        logger.debug(f'RegexTemplate ({type(self).__name__}) finished __init__, compiling {len(self.compiled_regexes)} regexes. '
-                     f'Took {(perf_counter_ns()-t0)/10**9} seconds total, of which {time_for_parent_init/10**9} seconds were for TestCase.__init__ '
-                     f'and {time_to_compile/10**9} seconds were for re.compile.')
+        self.compiled_regexes = self.compiled().compiled_regexes
+
+    @classmethod
+    def compiled(cls) -> CompiledRegexTemplate:
+        """Returns the CompiledRegexTemplate of this class, which is compiled once per process"""
+        return get_compiled_template(cls)
 
     def execute(self, input_string: str):
         """
         Try to match input_string against self.compiled_regexes, in order.
         Returns the slot values for the FIRST matched regex, or returns None if no match is found.
         """
-        t0 = perf_counter_ns()
-        logger.setLevel(logging.DEBUG)
-        logger.debug(f'RegexTemplate ({type(self).__name__}) is executing on "{input_string}", checking against {len(self.compiled_regexes)} compiled regexes...')
-        for idx, r in enumerate(self.compiled_regexes):
-            # t0_indiv = perf_counter_ns()
-            matched = r.match(input_string)
-            # logger.debug(f'RegexTemplate ({type(self).__name__}) took {(perf_counter_ns()-t0_indiv)/10**9} seconds for regex {r}')
-            if matched:
-                logger.debug(f'RegexTemplate ({type(self).__name__}) finished executing on "{input_string}". '
-                             f'Matched with compiled regex {idx} of {len(self.compiled_regexes)}, '
-                             f'Took {(perf_counter_ns()-t0)/10**9} seconds total')
-                return {k: v for k,v in matched.groupdict().items() if v is not None}
-        logger.debug(f'RegexTemplate ({type(self).__name__}) finished executing on "{input_string}". '
-                     f'Matched with none of {len(self.compiled_regexes)} compiled regexes. '
-                     f'Took {(perf_counter_ns() - t0)/10**9} seconds total')
-        return None
+        return self.compiled().execute(input_string)
 
     def test_examples(self):
         # This function checks that self.positive_examples match the template and self.negative_examples don't
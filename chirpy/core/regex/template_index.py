@@ -0,0 +1,158 @@
+"""
+Matches an utterance against many RegexTemplates at once.
+
+Most templates start with OPTIONAL_TEXT_PRE, so each of their regexes has to be tried from every position of the
+utterance, and each template's regexes are tried one after another. But almost every regex can only match if the
+utterance contains one of a few literal strings (e.g. one of the words of a slot). TemplateIndex finds those literals
+for each regex, and scans the utterance once for all of them. Then only the regexes whose literals were found are
+tried, in the templates' order, so the results are the same as executing each template.
+"""
+
+import re
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple, Type
+
+from chirpy.core.regex.regex_template import get_compiled_template
+
+try:
+    from re import _parser as sre_parse  # python >= 3.11
+except ImportError:
+    import sre_parse
+
+# The ops of the parsed regex that can contain required literals (some only exist in newer versions of python)
+_LITERAL = sre_parse.LITERAL
+_SUBPATTERN = sre_parse.SUBPATTERN
+_BRANCH = sre_parse.BRANCH
+_REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT} | \
+           ({sre_parse.POSSESSIVE_REPEAT} if hasattr(sre_parse, 'POSSESSIVE_REPEAT') else set())
+_ATOMIC_GROUP = getattr(sre_parse, 'ATOMIC_GROUP', None)
+
+
+def _score(literals: FrozenSet[str]) -> Tuple[int, int]:
+    """Longer literals are rarer in utterances, and fewer alternatives are fewer chances to occur"""
+    return min(len(literal) for literal in literals), -len(literals)
+
+
+def _required_literals(subpattern) -> Optional[FrozenSet[str]]:
+    """
+    Returns a set of literals such that any string that subpattern matches contains at least one of them, or None if
+    we can't tell. When there are several such sets, returns the one with the best _score.
+    """
+    best = None
+    run = []  # consecutive literal characters
+
+    def consider(literals: Optional[FrozenSet[str]]):
+        nonlocal best
+        if literals and all(literals) and (best is None or _score(literals) > _score(best)):
+            best = literals
+
+    for op, av in subpattern:
+        if op is _LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            consider(frozenset([''.join(run)]))
+            run = []
+        if op is _SUBPATTERN:
+            _, add_flags, _, p = av
+            if not add_flags & re.IGNORECASE:
+                consider(_required_literals(p))
+        elif op is _BRANCH:
+            branch_literals = [_required_literals(branch) for branch in av[1]]
+            if all(literals is not None for literals in branch_literals):
+                consider(frozenset().union(*branch_literals))
+        elif op in _REPEATS:
+            min_repeats, _, p = av
+            if min_repeats >= 1:
+                consider(_required_literals(p))
+        elif op is _ATOMIC_GROUP:
+            consider(_required_literals(av))
+        # Any other op (character sets, wildcards, anchors, assertions...) doesn't require a literal
+    if run:
+        consider(frozenset([''.join(run)]))
+    return best
+
+
+def required_literals(regex: 're.Pattern') -> Optional[FrozenSet[str]]:
+    """
+    Returns a set of literal strings such that regex can only match a string that contains at least one of them, or
+    None if there's no such set (or we can't find it).
+    """
+    if regex.flags & re.IGNORECASE:
+        return None
+    return _required_literals(sre_parse.parse(regex.pattern, regex.flags))
+
+
+def _trie_regex(literals: Iterable[str]) -> str:
+    """
+    Returns a regex that matches any of literals, written as a trie so that the regex engine doesn't try each literal
+    in turn. At each position, it matches the longest of literals that starts there.
+    """
+    trie = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[''] = {}  # marks the end of a literal
+
+    def to_regex(node) -> str:
+        alternatives = [re.escape(char) + to_regex(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ''
+        regex = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+        return f'(?:{regex})?' if '' in node else regex
+
+    return to_regex(trie)
+
+
+class TemplateIndex:
+    """
+    An index of the required literals of the regexes of template_classes (RegexTemplate subclasses), which matches an
+    utterance against all of them with one scan of the utterance. Safe to share between threads.
+    """
+
+    def __init__(self, template_classes: Iterable[Type]):
+        self.template_classes = list(template_classes)
+
+        # For each template class, its regexes in order, with their required literals (None if a regex has none)
+        self.template_regexes: Dict[Type, List[Tuple['re.Pattern', Optional[FrozenSet[str]]]]] = {}
+        all_literals = set()
+        for template_cls in self.template_classes:
+            regexes = [(regex, required_literals(regex)) for regex in get_compiled_template(template_cls).compiled_regexes]
+            self.template_regexes[template_cls] = regexes
+            for _, literals in regexes:
+                all_literals.update(literals or [])
+
+        # The scanner finds the longest literal that starts at each position (with a lookahead, so matches can
+        # overlap). Every other literal that starts at the same position is a prefix of it.
+        self._scanner = re.compile('(?=(' + _trie_regex(all_literals) + '))') if all_literals else None
+        self._prefixes = {literal: frozenset(literal[:i] for i in range(1, len(literal) + 1) if literal[:i] in all_literals)
+                          for literal in all_literals}
+
+    def scan(self, utterance: str) -> FrozenSet[str]:
+        """Returns the required literals of the indexed regexes that occur in utterance"""
+        if self._scanner is None:
+            return frozenset()
+        found = set()
+        for longest in set(self._scanner.findall(utterance)):
+            found.update(self._prefixes[longest])
+        return frozenset(found)
+
+    def execute(self, template_cls: Type, utterance: str, found: Optional[FrozenSet[str]] = None) -> Optional[Dict[str, str]]:
+        """
+        Returns what template_cls.compiled().execute(utterance) returns, trying only the regexes whose required
+        literals are in found (the result of scan(utterance), which is computed if it's not given).
+        """
+        if found is None:
+            found = self.scan(utterance)
+        for regex, literals in self.template_regexes[template_cls]:
+            if literals is not None and literals.isdisjoint(found):
+                continue
+            matched = regex.match(utterance)
+            if matched:
+                return {k: v for k, v in matched.groupdict().items() if v is not None}
+        return None
+
+    def match_all(self, utterance: str) -> Dict[Type, Optional[Dict[str, str]]]:
+        """Returns a dict from each indexed template class to the slots it matches in utterance (None if no match)"""
+        found = self.scan(utterance)
+        return {template_cls: self.execute(template_cls, utterance, found) for template_cls in self.template_classes}
@@ -0,0 +1,103 @@
+"""
+A cache of the responses of remote generative modules (e.g. BlenderBot), keyed by a canonical form of their input.
+
+ResponseCache keeps recently used responses in memory (a TTLCache), in front of an optional ResponseStore that's
+shared by all the processes on the machine and survives restarts. SqliteResponseStore is a store in a SQLite file; put
+it on a tmpfs (e.g. /dev/shm) to keep it in shared memory.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from chirpy.core.ttl_cache import TTLCache
+
+logger = logging.getLogger('chirpylogger')
+
+
+def make_cache_key(**parts) -> str:
+    """
+    Returns a canonical key for parts (JSON-serializable values, e.g. history, prefix and decoding config), which is
+    the same for equal parts regardless of the order of dict keys.
+    """
+    canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseStore:
+    """The interface of the persistent stores behind a ResponseCache. Values are JSON-serializable."""
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def put(self, key: str, value: Any):
+        raise NotImplementedError
+
+
+class SqliteResponseStore(ResponseStore):
+    """A key -> JSON value mapping in a SQLite database, which can be shared by several processes"""
+
+    def __init__(self, path: str, table: str, ttl: float = float('inf')):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=1.0, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(f'CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)')
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            row = self.conn.execute(f'SELECT value, created FROM {self.table} WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] + self.ttl <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any):
+        with self.lock:
+            self.conn.execute(f'INSERT OR REPLACE INTO {self.table} (key, value, created) VALUES (?, ?, ?)',
+                              (key, json.dumps(value), time.time()))
+
+
+class ResponseCache:
+    """
+    A thread-safe cache of responses, with least-recently-used eviction in memory, in front of an optional store.
+    Errors of the store are logged and otherwise ignored, so the cache is never the reason a call fails.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, store: Optional[ResponseStore] = None):
+        self.name = name
+        self.memory = TTLCache(name, maxsize, ttl=ttl)
+        self.store = store
+        self.store_hits = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns the cached response for key, or None if there isn't one"""
+        value = self.memory.get(key)
+        if value is not None or self.store is None:
+            return value
+        try:
+            value = self.store.get(key)
+        except Exception:
+            logger.warning(f'Unable to read from the {self.name} store', exc_info=True)
+            return None
+        if value is not None:
+            self.store_hits += 1
+            self.memory.put(key, value)
+        return value
+
+    def put(self, key: str, value: Any):
+        """Caches value, which must be JSON-serializable and not None, for key"""
+        self.memory.put(key, value)
+        if self.store is not None:
+            try:
+                self.store.put(key, value)
+            except Exception:
+                logger.warning(f'Unable to write to the {self.name} store', exc_info=True)
+
+    def stats(self) -> Dict[str, float]:
+        return {**self.memory.stats(), 'store_hits': self.store_hits}
@@ -132,7 +132,7 @@ def user_said_chatty_phrase(state_manager):
     state = state_manager.current_state
     utterance = state.text
     nav_intent_output = state.navigational_intent
-    chatty_slots = ChattyTemplate().execute(utterance)
+    chatty_slots = ChattyTemplate.compiled().execute(utterance)
     if chatty_slots: return chatty_slots
 
     # if didn't match chatty_slots, but still should respond w/ a default chatty-phrase response:
@@ -163,7 +163,7 @@ def user_requested_repetition(state_manager) -> bool:
     """
     state = state_manager.current_state
     utterance = state.text
-    say_that_again_slots = SayThatAgainTemplate().execute(utterance)
+    say_that_again_slots = SayThatAgainTemplate.compiled().execute(utterance)
     return say_that_again_slots
 
 
@@ -200,13 +200,13 @@ def user_requested_clarification(state_manager):
 
     # template: CLARIFICATION PHRASE + OVERLAP WITH BOT = "yes, X is what I said"
     # CLARIFICATION PHRASE + NO OVERLAP WITH BOT = "actually, I said X"
-    clarifier_slots = ClarifyingPhraseTemplate().execute(user_utterance)
+    clarifier_slots = ClarifyingPhraseTemplate.compiled().execute(user_utterance)
     return clarifier_slots
 
 def user_interrupted(state_manager) -> bool:
     state = state_manager.current_state
     user_utterance = state.text
-    interruption_slots = InterruptionQuestionTemplate().execute(user_utterance)
+    interruption_slots = InterruptionQuestionTemplate.compiled().execute(user_utterance)
     return interruption_slots
 
 def user_asked_ablities_question(state_manager):
@@ -228,14 +228,14 @@ def user_asked_ablities_question(state_manager):
 
     # template: CLARIFICATION PHRASE + OVERLAP WITH BOT = "yes, X is what I said"
     # CLARIFICATION PHRASE + NO OVERLAP WITH BOT = "actually, I said X"
-    ability_slots = AbilitiesQuestionTemplate().execute(user_utterance)
+    ability_slots = AbilitiesQuestionTemplate.compiled().execute(user_utterance)
     return ability_slots
 
 def user_asked_personal_question(state_manager):
     state = state_manager.current_state
     if len(state.history) < 1: return False
     user_utterance = state.text
-    pq_slots = PersonalWhQuestionTemplate().execute(user_utterance)
+    pq_slots = PersonalWhQuestionTemplate.compiled().execute(user_utterance)
     #logger.primary_info(f"Detected personal question slots: {pq_slots} for user_utterance {user_utterance}")
     if pq_slots: logger.primary_info(f"Detected personal question slots: {pq_slots}")
     return pq_slots
@@ -244,13 +244,13 @@ def user_asked_personal_question(state_manager):
 def user_requested_name(state_manager):
     state = state_manager.current_state
     utterance = state.text
-    request_name_slots = RequestNameTemplate().execute(utterance)
+    request_name_slots = RequestNameTemplate.compiled().execute(utterance)
     return request_name_slots
 
 def is_game_or_music_request(state):
     utterance = state.text
-    request_play_slots = RequestPlayTemplate().execute(utterance)
-    not_request_play_slots = NotRequestPlayTemplate().execute(utterance)
+    request_play_slots = RequestPlayTemplate.compiled().execute(utterance)
+    not_request_play_slots = NotRequestPlayTemplate.compiled().execute(utterance)
     cur_entity = state.entity_tracker.cur_entity
     prev_bot_utt = state.history[-1] if len(state.history) >= 1 else ''
     did_not_ask_user_activity = "what do you like to do" not in prev_bot_utt.lower()
@@ -267,8 +267,8 @@ def is_game_or_music_request(state):
 def user_wants_name_correction(state_manager):
     state = state_manager.current_state
     utterance = state.text
-    my_name_slots = MyNameIsNonContextualTemplate().execute(utterance)
-    not_my_name_slots = MyNameIsNotTemplate().execute(utterance)
+    my_name_slots = MyNameIsNonContextualTemplate.compiled().execute(utterance)
+    not_my_name_slots = MyNameIsNotTemplate.compiled().execute(utterance)
     if my_name_slots and state_manager.last_state_active_rg and state_manager.last_state_active_rg != 'LAUNCH':
         return my_name_slots
     if not_my_name_slots:
@@ -283,18 +283,18 @@ def user_wants_name_correction(state_manager):
 def user_gave_nevermind(state_manager):
     state = state_manager.current_state
     utterance = state.text
-    slots = NeverMindTemplate().execute(utterance)
+    slots = NeverMindTemplate.compiled().execute(utterance)
     return slots
 
 def user_asked_for_story(state_manager):
     state = state_manager.current_state
     utterance = state.text
-    request_story_slots = RequestStoryTemplate().execute(utterance)
+    request_story_slots = RequestStoryTemplate.compiled().execute(utterance)
     return request_story_slots
 
 def user_shared_personal_problem(state_manager):
     utterance = state_manager.current_state.text
-    return PersonalSharingTemplate().execute(utterance)
+    return PersonalSharingTemplate.compiled().execute(utterance)
 
 def user_said_anything(state_manager):
     """
@@ -321,21 +321,21 @@ def user_said_anything(state_manager):
     ]
     if any(previous_bot_utterance.endswith(i) for i in triggers):
         if any(i in utterance for i in nothing_replies): return True
-        if DontKnowTemplate().execute(utterance) is not None: return True
+        if DontKnowTemplate.compiled().execute(utterance) is not None: return True
     return False
 
 
 def user_gave_compliment(state_manager):
     state = state_manager.current_state
     utterance = state.text
-    compliment_slots = ComplimentTemplate().execute(utterance)
+    compliment_slots = ComplimentTemplate.compiled().execute(utterance)
     return compliment_slots
 
 def user_got_cutoff(state_manager):
     state = state_manager.current_state
     utterance = state.text
     nav_intent_output = state.navigational_intent
-    cutoff_slot = CutOffTemplate().execute(utterance)
+    cutoff_slot = CutOffTemplate.compiled().execute(utterance)
     logger.primary_info(f"========={cutoff_slot}")
     # logger.primary_info(f"========={(nav_intent_output.pos_intent and nav_intent_output.pos_topic_is_hesitate and "depends on" not in utterance)}")
     return cutoff_slot or (nav_intent_output.pos_intent
@@ -346,32 +346,32 @@ def user_got_cutoff(state_manager):
 def user_asked_for_our_age(state_manager):
     state = state_manager.current_state
     utterance = state.text
-    request_age_slots = RequestAgeTemplate().execute(utterance)
+    request_age_slots = RequestAgeTemplate.compiled().execute(utterance)
     return request_age_slots
 
 def misheard_complaint(state_manager):
     state = state_manager.current_state
     utterance = state.text
-    complaint_misheard_slots = ComplaintMisheardTemplate().execute(utterance)
+    complaint_misheard_slots = ComplaintMisheardTemplate.compiled().execute(utterance)
     return complaint_misheard_slots
 
 def unclear_complaint(state_manager):
     state = state_manager.current_state
     utterance = state.text
-    clarification_slots = ComplaintClarificationTemplate().execute(utterance)
+    clarification_slots = ComplaintClarificationTemplate.compiled().execute(utterance)
     had_confusion_word = ("confused" in utterance or "confusing" in utterance)
     return (clarification_slots or had_confusion_word) and state_manager.last_state_active_rg != 'WIKI'
 
 def repetition_complaint(state_manager):
     state = state_manager.current_state
     utterance = state.text
-    repetition_slots = ComplaintRepetitionTemplate().execute(utterance)
+    repetition_slots = ComplaintRepetitionTemplate.compiled().execute(utterance)
     return repetition_slots
 
 def privacy_complaint(state_manager):
     state = state_manager.current_state
     utterance = state.text
-    privacy_slots = ComplaintPrivacyTemplate().execute(utterance)
+    privacy_slots = ComplaintPrivacyTemplate.compiled().execute(utterance)
     return privacy_slots
 
 def you_cant_do_that_complaint(state_manager):
@@ -391,11 +391,11 @@ def generic_complaint(state_manager):
 def user_asked_about_weather(state_manager):
     state = state_manager.current_state
     utterance = state.text
-    weather_slots = WeatherTemplate().execute(utterance)
+    weather_slots = WeatherTemplate.compiled().execute(utterance)
     return weather_slots
 
 def user_asked_about_time(state_manager):
     state = state_manager.current_state
     utterance = state.text
-    time_slots = WhatTimeIsItTemplate().execute(utterance)
+    time_slots = WhatTimeIsItTemplate.compiled().execute(utterance)
     return time_slots
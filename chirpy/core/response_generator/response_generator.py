@@ -342,6 +342,13 @@ class ResponseGenerator(NamedCallable):
         """Updates current topic of conversation"""
         return UpdateEntity(False)
 
+    def prefetch(self):
+        """
+        Runs in the background after a turn has been returned (see ResponseGenerators.prefetch), with the final state
+        of the turn. RGs can override it to precompute (and cache) what they will likely need next turn.
+        """
+        pass
+
     def emptyResult_with_conditional_state(self, conditional_state=None):
         return emptyResult_with_conditional_state(self.state, conditional_state)
 
@@ -367,7 +374,7 @@ class ResponseGenerator(NamedCallable):
                     logger.info(f"{self.name} found a proposed navigational intent: triggered term {tok}")
                     return {"responding_template": "trigger_word", "trigger_word": tok}
         for intent_class in self.intent_templates:
-            proposed_intent = intent_class().execute(self.utterance)
+            proposed_intent = intent_class.compiled().execute(self.utterance)
             if proposed_intent:
                 proposed_intent.update({"responding_template": intent_class.__name__})
                 logger.info(f"{self.name} found a proposed navigational intent {proposed_intent}")
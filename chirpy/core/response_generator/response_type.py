@@ -1,6 +1,8 @@
 from chirpy.core.response_generator.regex_templates import *
 from chirpy.core.regex.templates import *
+from chirpy.core.regex.template_index import TemplateIndex
 from enum import IntEnum, auto
+from functools import lru_cache
 from typing import Set, List
 import logging
 
@@ -39,7 +41,18 @@ def add_response_types(response_type_enum, additional_response_types: List[str])
                    )
 
 
+@lru_cache(maxsize=None)
+def get_base_response_type_index() -> TemplateIndex:
+    """The TemplateIndex of the templates that identify_base_response_types matches"""
+    return TemplateIndex([DisinterestedTemplate, NoTemplate, YesTemplate, NotYesTemplate, ChangeTopicTemplate,
+                          RequestRepeatTemplate, SayThatAgainTemplate, DontKnowTemplate, ThatsTemplate, DidntKnowTemplate,
+                          SurprisedReallyTemplate, NotThingTemplate, BackChannelingTemplate])
+
+
 def identify_base_response_types(rg, utterance) -> Set[ResponseType]:
+    # Match all the templates with one scan of the utterance, so that the checks below only read the cache
+    rg.state_manager.analysis_cache.execute_all(get_base_response_type_index(), utterance)
+
     retval = set()
     if is_disinterested(rg, utterance):
         retval.add(ResponseType.DISINTERESTED)
@@ -85,11 +98,11 @@ def is_disinterested(rg, utterance):
     Classifies whether the user sounds disinterested
     """
     return rg.state_manager.current_state.navigational_intent.neg_intent or \
-           DisinterestedTemplate().execute(utterance) is not None
+           rg.state_manager.analysis_cache.matches(DisinterestedTemplate, utterance)
 
 
 def is_no(rg, utterance):
-    return NoTemplate().execute(utterance) is not None or rg.state_manager.current_state.dialogact['is_no_answer']
+    return rg.state_manager.analysis_cache.matches(NoTemplate, utterance) or rg.state_manager.current_state.dialogact['is_no_answer']
 
 
 def is_question(rg, utterance):
@@ -97,7 +110,7 @@ def is_question(rg, utterance):
 
 
 def is_yes(rg, utterance):
-    return (YesTemplate().execute(utterance) is not None and NotYesTemplate().execute(utterance) is None) \
+    return (rg.state_manager.analysis_cache.matches(YesTemplate, utterance) and not rg.state_manager.analysis_cache.matches(NotYesTemplate, utterance)) \
            or rg.state_manager.current_state.dialogact['is_yes_answer']
 
 
@@ -106,33 +119,33 @@ def is_complaint(rg, utterance):
 
 
 def is_change_topic(rg, utterance):
-    return ChangeTopicTemplate().execute(utterance) is not None
+    return rg.state_manager.analysis_cache.matches(ChangeTopicTemplate, utterance)
 
 
 def is_request_repeat(rg, utterance):
-    return RequestRepeatTemplate().execute(utterance) is not None or SayThatAgainTemplate().execute(
-        utterance) is not None
+    return rg.state_manager.analysis_cache.matches(RequestRepeatTemplate, utterance) or \
+           rg.state_manager.analysis_cache.matches(SayThatAgainTemplate, utterance)
 
 
 def is_dont_know_response(rg, utterance):
-    template_match = DontKnowTemplate().execute(utterance) is not None
+    template_match = rg.state_manager.analysis_cache.matches(DontKnowTemplate, utterance)
     is_difficult = any([x in utterance for x in ['tough', 'tricky', 'difficult']]) and rg.get_current_entity(
         initiated_this_turn=True) is None
     return template_match or is_difficult
 
 
 def is_thats_response(rg, utterance):
-    return ThatsTemplate().execute(utterance) is not None
+    return rg.state_manager.analysis_cache.matches(ThatsTemplate, utterance)
 
 
 def is_didnt_know_response(rg, utterance):
-    return DidntKnowTemplate().execute(utterance) is not None or \
-           (SurprisedReallyTemplate().execute(utterance) is not None and len(utterance) <= 15)
+    return rg.state_manager.analysis_cache.matches(DidntKnowTemplate, utterance) or \
+           (rg.state_manager.analysis_cache.matches(SurprisedReallyTemplate, utterance) and len(utterance) <= 15)
 
 
 def is_nothing_response(rg, utterance):
-    return NotThingTemplate().execute(utterance) is not None
+    return rg.state_manager.analysis_cache.matches(NotThingTemplate, utterance)
 
 
 def is_backchannel(rg, utterance):
-    return BackChannelingTemplate().execute(utterance) is not None
+    return rg.state_manager.analysis_cache.matches(BackChannelingTemplate, utterance)
@@ -3,6 +3,7 @@ from typing import *
 from datetime import datetime
 import copy
 
+from chirpy.core.entity_linker.entity_linker_classes import restoring_entities
 from chirpy.core.entity_tracker.entity_tracker import EntityTrackerState
 from chirpy.core.experiment import Experiments
 from chirpy.core.flags import SIZE_THRESHOLD
@@ -13,6 +14,9 @@ import logging
 
 logger = logging.getLogger('chirpylogger')
 
+# Attributes of State that reduce_size might shrink
+PURGABLE_ATTRIBUTES = ['entity_linker', 'entity_tracker', 'response_results', 'prompt_results']
+
 # Set jsonpickle to always order keys alphabetically.
 # ============================ Reason why we do this: ============================
 # We jsonpickle python objects into strings and write them to the dynamodb StateTable.
@@ -136,9 +140,11 @@ class State(object):
                 f"Total encoded size of state is {total_size}, which is greater than allowed {SIZE_THRESHOLD}\n"
                 f"Size of each value in the dictionary is:\n{print_dict_linebyline({k: len(v) for k, v in encoded_dict.items()})}")
 
-            # Tries to reduce size of the current state
+            # Tries to reduce size of the current state. Only the purgable attributes change, so only re-encode those
             self.reduce_size()
-            encoded_dict = {k: jsonpickle.encode(v) for k, v in self.__dict__.items()}
+            for k in PURGABLE_ATTRIBUTES:
+                if k in encoded_dict:
+                    encoded_dict[k] = jsonpickle.encode(getattr(self, k))
             total_size = sum(len(k) + len(v) for k, v in encoded_dict.items())
         logger.primary_info(
             f"Total encoded size of state is {total_size}\n"
@@ -150,11 +156,12 @@ class State(object):
     def deserialize(cls, mapping: dict):
         decoded_items = {}
         # logger.debug(mapping.items())
-        for k, v in mapping.items():
-            try:
-                decoded_items[k] = jsonpickle.decode(v)
-            except:
-                logger.error(f"Unable to decode {k}: {v} from past state")
+        with restoring_entities():  # the state's compactly encoded WikiEntities are fetched together when first used
+            for k, v in mapping.items():
+                try:
+                    decoded_items[k] = jsonpickle.decode(v)
+                except:
+                    logger.error(f"Unable to decode {k}: {v} from past state")
 
         constructor_args = ['session_id', 'creation_date_time']
         base_self = cls(**{k: decoded_items.get(k, None) for k in constructor_args})
@@ -186,12 +193,11 @@ class State(object):
         """
         Attribute specific size reduction
         """
-        purgable_attributes = ['entity_linker', 'entity_tracker', 'response_results', 'prompt_results']
         objs = []
 
         logger.primary_info("Running reduce_size on the state object")
         # Collect all purgable objects from within lists and dicts
-        for attr in purgable_attributes:
+        for attr in PURGABLE_ATTRIBUTES:
             try:
                 attr = getattr(self, attr)
                 if isinstance(attr, list):
@@ -0,0 +1,197 @@
+"""
+Storing the serialized states of a conversation as deltas against the previous turn's state.
+
+A serialized state (see State.serialize) maps each attribute name to its jsonpickle encoding. From one turn to the
+next most attributes are unchanged, and the big growing ones (e.g. history) only have something appended. So rather
+than storing every turn's full state, we store a delta: the attributes that changed, with appended-to attributes
+stored as just their suffix, and other changed objects stored as a patch of the fields that changed.
+"""
+import json
+import threading
+from typing import Dict, Optional, Tuple
+
+# Key in a delta under which we store its metadata. Not a valid attribute name, so it can't clash with one.
+DELTA_KEY = '__delta__'
+
+# How many deltas in a row we store before storing a full state, which bounds the cost of resolving a state
+KEYFRAME_INTERVAL = 10
+
+# Changed encodings shorter than this are always stored in full, since a suffix or patch wouldn't save much
+MIN_DIFF_LENGTH = 64
+
+
+def diff_json(base: dict, new: dict) -> dict:
+    """
+    Returns a patch that turns the JSON object base into new (see patch_json). The patch maps each key that changed to
+    ['=', new value], ['-'] if it was removed, or ['~', patch] if both values are objects.
+    """
+    patch = {}
+    for key, value in new.items():
+        if key not in base:
+            patch[key] = ['=', value]
+        elif base[key] != value:
+            if isinstance(value, dict) and isinstance(base[key], dict):
+                patch[key] = ['~', diff_json(base[key], value)]
+            else:
+                patch[key] = ['=', value]
+    for key in base:
+        if key not in new:
+            patch[key] = ['-']
+    return patch
+
+
+def patch_json(base: dict, patch: dict) -> dict:
+    """Returns a copy of the JSON object base with patch (see diff_json) applied"""
+    patched = dict(base)
+    for key, change in patch.items():
+        if change[0] == '=':
+            patched[key] = change[1]
+        elif change[0] == '-':
+            del patched[key]
+        else:
+            patched[key] = patch_json(base[key], change[1])
+    return patched
+
+
+def diff_encodings(encoding: str, base_encoding: str) -> Optional[str]:
+    """
+    If encoding and base_encoding are both (sorted, jsonpickle-encoded) JSON objects, returns the JSON encoding of a
+    patch that turns base_encoding into encoding, if that's smaller. Otherwise returns None.
+    """
+    if not (encoding.startswith('{') and base_encoding.startswith('{')):
+        return None
+    patch = diff_json(json.loads(base_encoding), json.loads(encoding))
+    patch_encoding = json.dumps(patch, sort_keys=True)
+    if len(patch_encoding) >= len(encoding):
+        return None
+    # Values that compare equal can have different encodings (e.g. 1 and true), so check the patch gives encoding back
+    if json.dumps(patch_json(json.loads(base_encoding), patch), sort_keys=True) != encoding:
+        return None
+    return patch_encoding
+
+
+def diff_serialized_states(serialized: Dict[str, str], base: Dict[str, str], base_key) -> Dict[str, str]:
+    """
+    Returns a delta that turns base into serialized (see apply_serialized_state_delta). base_key is stored in the delta
+    (under DELTA_KEY) so the delta can later be resolved against the right state.
+
+    Attributes that are unchanged from base are left out. If an attribute's encoding is its encoding in base with
+    something inserted before the final character (e.g. a list that was appended to), only the inserted part is stored.
+    If it's an object, only the fields that changed are stored (see diff_json).
+    """
+    delta = {}
+    appended = {}
+    patched = {}
+    for k, v in serialized.items():
+        base_v = base.get(k)
+        if base_v is None or len(base_v) < MIN_DIFF_LENGTH:
+            if v != base_v:
+                delta[k] = v
+        elif v == base_v:
+            continue
+        elif len(v) > len(base_v) and v.startswith(base_v[:-1]):
+            appended[k] = v[len(base_v) - 1:]
+        else:
+            patch = diff_encodings(v, base_v)
+            if patch is not None:
+                patched[k] = patch
+            else:
+                delta[k] = v
+    removed = [k for k in base if k not in serialized]
+    delta[DELTA_KEY] = json.dumps({'base': base_key, 'appended': appended, 'patched': patched, 'removed': removed})
+    return delta
+
+
+def is_delta(record: Dict[str, str]) -> bool:
+    return DELTA_KEY in record
+
+
+def get_delta_base_key(delta: Dict[str, str]):
+    base_key = json.loads(delta[DELTA_KEY])['base']
+    return tuple(base_key) if isinstance(base_key, list) else base_key
+
+
+def apply_serialized_state_delta(delta: Dict[str, str], base: Dict[str, str]) -> Dict[str, str]:
+    """Returns the serialized state that delta (made by diff_serialized_states against base) was made from"""
+    metadata = json.loads(delta[DELTA_KEY])
+    serialized = {k: v for k, v in base.items() if k not in metadata['removed']}
+    for k, suffix in metadata['appended'].items():
+        serialized[k] = base[k][:-1] + suffix
+    for k, patch in metadata['patched'].items():
+        serialized[k] = json.dumps(patch_json(json.loads(base[k]), json.loads(patch)), sort_keys=True)
+    serialized.update((k, v) for k, v in delta.items() if k != DELTA_KEY)
+    return serialized
+
+
+def record_size(record: Dict[str, str]) -> int:
+    """Size of a full serialized state or a delta, in the same units as State.serialize's total_size"""
+    return sum(len(k) + len(v) for k, v in record.items())
+
+
+class DeltaStateStore:
+    """
+    A mapping from keys to serialized states, which stores each session's states as deltas against the session's
+    previous state, with a full state every keyframe_interval states. The latest state of each session is kept
+    resolved, so fetching the last state (the common case) doesn't need to apply any deltas.
+    """
+
+    def __init__(self, keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.records: Dict[object, Dict[str, str]] = {}
+
+        # session_id -> (key, number of deltas since the last full state) for the latest state of each session, and
+        # key -> serialized state for those latest states
+        self.latest: Dict[object, Tuple[object, int]] = {}
+        self.latest_states: Dict[object, Dict[str, str]] = {}
+        self.lock = threading.Lock()
+
+    def put(self, key, session_id, serialized: Dict[str, str]):
+        with self.lock:
+            latest = self.latest.get(session_id)
+            if latest is None or latest[0] == key or latest[1] + 1 >= self.keyframe_interval:
+                self.records[key] = dict(serialized)
+                num_deltas = 0
+            else:
+                base_key, num_deltas = latest
+                self.records[key] = diff_serialized_states(serialized, self.latest_states[base_key], base_key)
+                num_deltas += 1
+            if latest is not None:
+                self.latest_states.pop(latest[0], None)
+            self.latest[session_id] = (key, num_deltas)
+            self.latest_states[key] = dict(serialized)
+
+    def get(self, key) -> Optional[Dict[str, str]]:
+        """Returns the serialized state stored under key, or None if there is none"""
+        with self.lock:
+            if key in self.latest_states:
+                return dict(self.latest_states[key])
+            record = self.records.get(key)
+            if record is None:
+                return None
+            chain = [record]
+            while is_delta(chain[-1]):
+                chain.append(self.records[get_delta_base_key(chain[-1])])
+        serialized = chain.pop()
+        while chain:
+            serialized = apply_serialized_state_delta(chain.pop(), serialized)
+        return serialized
+
+    def __getitem__(self, key) -> Dict[str, str]:
+        serialized = self.get(key)
+        if serialized is None:
+            raise KeyError(key)
+        return serialized
+
+    def __contains__(self, key) -> bool:
+        return key in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def keys(self):
+        return self.records.keys()
+
+    def stored_size(self) -> int:
+        """Total size of the stored full states and deltas"""
+        with self.lock:
+            return sum(record_size(record) for record in self.records.values())
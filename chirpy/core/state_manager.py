@@ -1,10 +1,11 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import jsonpickle
 import logging
 from boto3.dynamodb.conditions import Key
 from typing import List, Tuple, Optional # NOQA
 
+from chirpy.core.analysis_cache import AnalysisCache
 from chirpy.core.user_attributes import UserAttributes
 from chirpy.core.state import State
 import chirpy.core.flags as flags
@@ -20,6 +21,8 @@ class StateManager:
     current_state: State
     user_attributes: UserAttributes
     last_state: Optional[State] = None
+    # Analyses of this turn's utterance that are shared by the RGs
+    analysis_cache: AnalysisCache = field(default_factory=AnalysisCache, repr=False, compare=False)
 
     @property
     def last_state_active_rg(self):
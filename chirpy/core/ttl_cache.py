@@ -0,0 +1,98 @@
+"""
+A bounded, thread-safe, in-process cache with least-recently-used eviction and a time to live for each entry.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class TTLCache:
+    """
+    A mapping from keys to values, holding at most maxsize entries. When it's full, the least recently used entry is
+    evicted. Entries expire ttl seconds after they were put.
+
+    None is a valid value, and is used for negative caching (i.e. remembering that there is nothing for a key). Those
+    entries expire after negative_ttl seconds instead.
+
+    The cache keeps counts of hits (including negative_hits), misses, evictions and expirations, see stats().
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, negative_ttl: Optional[float] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()  # key -> (expiry time, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_many(self, keys: Iterable[Hashable]) -> Tuple[Dict[Hashable, Any], List[Hashable]]:
+        """
+        Returns (found, misses), where found maps each key that's in the cache to its value (which might be None),
+        and misses is the list of keys that aren't.
+        """
+        found, misses = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] <= now:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    misses.append(key)
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[1]
+                if entry[1] is None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+        return found, misses
+
+    def get(self, key: Hashable, default=None):
+        found, _ = self.get_many([key])
+        return found.get(key, default)
+
+    def put(self, key: Hashable, value):
+        self.put_many({key: value})
+
+    def put_many(self, items: Dict[Hashable, Any]):
+        now = time.monotonic()
+        with self._lock:
+            for key, value in items.items():
+                ttl = self.negative_ttl if value is None else self.ttl
+                self._entries[key] = (now + ttl, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {'size': len(self._entries), 'hits': self.hits, 'negative_hits': self.negative_hits,
+                    'misses': self.misses, 'evictions': self.evictions, 'expirations': self.expirations,
+                    'hit_rate': (self.hits + self.negative_hits) / lookups if lookups else 0.0}
+
+    def __repr__(self):
+        return f'<TTLCache {self.name}: {self.stats()}>'
@@ -8,14 +8,16 @@ import unicodedata
 import sys
 from functools import lru_cache
 import functools
+import contextvars
 from pathlib import Path
 
 import boto3
 import logging
 import datetime
 import pytz
-from typing import List, Dict, Set, Optional, Iterable, Any, Callable
-from chirpy.core.latency import measure
+from typing import List, Dict, Set, Optional, Iterable, Any, Callable, Union
+from chirpy.core.latency import measure, span
+from chirpy.core.phrase_matcher import PhraseMatcher
 import random
 from random import choices
 from elasticsearch import Elasticsearch, ElasticsearchException
@@ -195,7 +197,7 @@ def catch_errors(default_output):
 
 @measure
 def query_es_index(es: Elasticsearch, index_name: str, query: dict, size: int, timeout: float,
-                   filter_path: List[str] = []) -> List[dict]:
+                   filter_path: List[str] = [], raise_errors: bool = False) -> List[dict]:
     """
     Send the query to the ES index, catch any errors and do sensible logging, and return the results.
 
@@ -208,6 +210,8 @@ def query_es_index(es: Elasticsearch, index_name: str, query: dict, size: int, t
         size: max number of results
         timeout: timeout in seconds
         filter_path: if you only want some fields, specify them here.
+        raise_errors: if True, errors and timeouts are raised (after logging) rather than returning an empty list, so
+            the caller can tell them apart from a query with no results.
 
     Returns:
         A list of results. If there's an error or a timeout, returns an empty list.
@@ -215,8 +219,9 @@ def query_es_index(es: Elasticsearch, index_name: str, query: dict, size: int, t
     timeout = timeout if use_timeouts else inf_timeout
     logger.info(f"Querying ElasticSearch '{index_name}' index with timeout={timeout}s, size={size}, and this query: {query}")
     try:
-        results = es.search(index=index_name, body=query, size=size, filter_path=filter_path,
-                            request_timeout=timeout)
+        with span(f'es.search.{index_name}'):
+            results = es.search(index=index_name, body=query, size=size, filter_path=filter_path,
+                                request_timeout=timeout)
         # logger.debug('Query to ElasticSearch "{}" took {}ms'.format(index_name, results['took']))  # sometimes 'took' isn't in results, I'm not sure why
         if not results:
             return []
@@ -224,10 +229,14 @@ def query_es_index(es: Elasticsearch, index_name: str, query: dict, size: int, t
     except ElasticsearchException as e:
         logger.warning(f'When querying "{index_name}" index with timeout = {timeout} seconds, size={size}, and query={query},'
                        f'Elasticsearch returned the following exception:\n{e}.\nReturning empty list.')
+        if raise_errors:
+            raise
         return []
     except Exception:
         logger.error(f'When querying "{index_name}" index with timeout = {timeout} seconds, size={size}, and query={query}'
                      f'Elasticsearch returned an exception.\nReturning empty list.', exc_info=True)
+        if raise_errors:
+            raise
         return []
 
 
@@ -311,7 +320,7 @@ def get_ngrams(text, n):
     return [" ".join(tokens[i:i+n]) for i in range(len(tokens)-(n-1))]  # list of str
 
 
-def contains_phrase(text: str, phrases: Set[str], log_message: str = 'text "{}" contains phrase {}',
+def contains_phrase(text: str, phrases: Union[Set[str], PhraseMatcher], log_message: str = 'text "{}" contains phrase {}',
                     lowercase_text: bool = True, lowercase_phrases: bool = True,
                     remove_punc_text: bool = True, remove_punc_phrases: bool = True,
                     max_phrase_len: Optional[int] = None):
@@ -330,7 +339,9 @@ def contains_phrase(text: str, phrases: Set[str], log_message: str = 'text "{}"
 
     Inputs:
         text: string, space-separated.
-        phrases: set of strings, space-separated.
+        phrases: set of strings, space-separated. For a large set that is checked often, pass a PhraseMatcher built
+            from it instead; its phrases should already be normalized (lowercase_phrases and remove_punc_phrases are
+            ignored).
         log_message: If not empty, a str to be formatted with (text, phrase) that gives an informative log message when
             the result is True.
         lowercase_text: if True, text will be lowercased before checking.
@@ -341,10 +352,15 @@ def contains_phrase(text: str, phrases: Set[str], log_message: str = 'text "{}"
     """
     if lowercase_text:
         text = text.lower()
-    if lowercase_phrases:
-        phrases = set([p.lower() for p in phrases])
     if remove_punc_text:
         text = remove_punc(text)
+    if isinstance(phrases, PhraseMatcher):
+        phrase = phrases.find_first(text)
+        if phrase is not None and log_message:
+            logger.info(log_message.format(text, phrase))
+        return phrase is not None
+    if lowercase_phrases:
+        phrases = set([p.lower() for p in phrases])
     if remove_punc_phrases:
         phrases = set([remove_punc(p) for p in phrases])
     if max_phrase_len is None:
@@ -525,7 +541,7 @@ def killable(func):
                 out['out'] = result
 
             # logging.warning(f"args {args}")
-            client_thread = threading.Thread(target=wrapper, args=args, kwargs=kwargs)
+            client_thread = threading.Thread(target=contextvars.copy_context().run, args=(wrapper, *args), kwargs=kwargs)
             client_thread.start()
             while client_thread.is_alive():
                 client_thread.join(timeout=0.1)
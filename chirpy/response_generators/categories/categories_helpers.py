@@ -28,7 +28,7 @@ def get_user_initiated_category(user_utterance, current_state) -> Tuple[Optional
         category: the category being activated
         posnav: whether the user has posnav
     """
-    slots = CategoriesTemplate().execute(user_utterance)
+    slots = CategoriesTemplate.compiled().execute(user_utterance)
 
     # Legacy code; not removing in case it breaks something
     # if slots is not None and slots["keyword"] in ACTIVATIONPHRASE2CATEGORYNAME:
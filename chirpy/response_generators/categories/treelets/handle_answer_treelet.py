@@ -100,7 +100,7 @@ class HandleAnswerTreelet(Treelet):
         cur_state = self.get_current_state()
         state_manager = self.rg.state_manager
         about_alexa = ""
-        if WhatAboutYouTemplate().execute(utterance) is not None:
+        if WhatAboutYouTemplate.compiled().execute(utterance) is not None:
             if "What TV show are you watching right now?" in cur_state.history[-1]:
                 about_alexa = "I watched the office again. I've re-watched it so many times!"
             elif "What did you eat for dinner last night?" in cur_state.history[-1]:
@@ -111,13 +111,13 @@ class HandleAnswerTreelet(Treelet):
         if ResponseType.DONT_KNOW in response_types:
             text = " ".join((self.choose(RESPONSE_TO_DONT_KNOW), about_alexa))
             cur_entity = None
-        elif BackChannelingTemplate().execute(utterance) is not None:
+        elif BackChannelingTemplate.compiled().execute(utterance) is not None:
             text = " ".join((self.choose(RESPONSE_TO_BACK_CHANNELING), about_alexa))
             cur_entity = prev_turn_entity
-        elif EverythingTemplate().execute(utterance) is not None:
+        elif EverythingTemplate.compiled().execute(utterance) is not None:
             text = " ".join((self.choose(RESPONSE_TO_EVERYTHING_ANS), about_alexa))
             cur_entity = prev_turn_entity
-        elif NotThingTemplate().execute(utterance) is not None or ResponseType.NO in response_types:
+        elif NotThingTemplate.compiled().execute(utterance) is not None or ResponseType.NO in response_types:
             text = " ".join((self.choose(RESPONSE_TO_NOTHING_ANS), about_alexa))
             cur_entity = None
 
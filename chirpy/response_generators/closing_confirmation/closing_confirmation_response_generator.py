@@ -59,7 +59,7 @@ class ClosingConfirmationResponseGenerator(ResponseGenerator):
         #     return True
 
         # Check regex
-        if TryingToStopTemplate().execute(utt) is not None:
+        if TryingToStopTemplate.compiled().execute(utt) is not None:
             logger.primary_info("Trying to stop template was triggered.")
             return True
 
@@ -86,14 +86,14 @@ class ClosingConfirmationResponseGenerator(ResponseGenerator):
         if state.has_just_asked_to_exit:
             # If the user wants to end the conversation, exit
             if ResponseType.YES in response_types or \
-                    ClosingPositiveConfirmationTemplate().execute(utterance) is not None:
+                    ClosingPositiveConfirmationTemplate.compiled().execute(utterance) is not None:
                 return ResponseGeneratorResult(text=CLOSING_CONFIRMATION_STOP,
                                                priority=ResponsePriority.STRONG_CONTINUE, needs_prompt=False,
                                                state=state, cur_entity=None,
                                                conditional_state=ConditionalState(has_just_asked_to_exit=False))
             # If the user wants to continue talking, request prompt and continue
             if ResponseType.NO in response_types or \
-                    ClosingNegativeConfirmationTemplate().execute(utterance) is not None:
+                    ClosingNegativeConfirmationTemplate.compiled().execute(utterance) is not None:
                 return ResponseGeneratorResult(text=random.choice(CLOSING_CONFIRMATION_CONTINUE),
                                                priority=ResponsePriority.STRONG_CONTINUE, needs_prompt=True,
                                                state=state, cur_entity=None,
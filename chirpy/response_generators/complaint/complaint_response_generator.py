@@ -55,23 +55,23 @@ class ComplaintResponseGenerator(ResponseGenerator):
         response_text = None
         priority = ResponsePriority.NO
 
-        if ComplaintMisheardTemplate().execute(utterance) is not None:
+        if ComplaintMisheardTemplate.compiled().execute(utterance) is not None:
             logger.primary_info(f'User\'s utterance "{utterance}" matches matches misheard template. Responding with MISHEARD_COMPLAINT_RESPONSE')
             priority = ResponsePriority.FORCE_START
             response_text = self.choose(MISHEARD_COMPLAINT_RESPONSE)
 
-        elif ComplaintClarificationTemplate().execute(utterance) is not None and not (self.state_manager.last_state_active_rg == 'WIKI'):
+        elif ComplaintClarificationTemplate.compiled().execute(utterance) is not None and not (self.state_manager.last_state_active_rg == 'WIKI'):
             logger.primary_info(f'User\'s utterance "{utterance}" matches matches clarificaton template. Responding with CLARIFICATION_COMPLAINT_RESPONSE')
             priority = ResponsePriority.FORCE_START
             response_text = self.choose(CLARIFICATION_COMPLAINT_RESPONSE)
 
         # Sometimes when doing convpara in wiki, they ask a "surprised/doubtful" what which is handled there
-        elif ComplaintRepetitionTemplate().execute(utterance) is not None:
+        elif ComplaintRepetitionTemplate.compiled().execute(utterance) is not None:
             logger.primary_info(f'User\'s utterance "{utterance}" matches matches repetition template. Responding with REPETITION_COMPLAINT_RESPONSE')
             priority = ResponsePriority.FORCE_START
             response_text = self.choose(REPETITION_COMPLAINT_RESPONSE)
 
-        elif ComplaintPrivacyTemplate().execute(utterance) is not None:
+        elif ComplaintPrivacyTemplate.compiled().execute(utterance) is not None:
             logger.primary_info(f'User\'s utterance "{utterance}" matches matches privacy template. Responding with PRIVACY_COMPLAINT_RESPONSE')
             priority = ResponsePriority.FORCE_START
             response_text = self.choose(PRIVACY_COMPLAINT_RESPONSE)
@@ -41,13 +41,13 @@ class FallbackResponseGenerator(ResponseGenerator):
         state, utterance, response_types = self.get_state_utterance_response_types()
         text = None
         if self.get_last_active_rg() == self.name:
-            if DontKnowTemplate().execute(utterance) is not None:
+            if DontKnowTemplate.compiled().execute(utterance) is not None:
                 text = self.choose(RESPONSE_TO_DONT_KNOW)
-            elif BackChannelingTemplate().execute(utterance) is not None:
+            elif BackChannelingTemplate.compiled().execute(utterance) is not None:
                 text = self.choose(RESPONSE_TO_BACK_CHANNELING)
-            elif EverythingTemplate().execute(utterance) is not None:
+            elif EverythingTemplate.compiled().execute(utterance) is not None:
                 text = self.choose(RESPONSE_TO_EVERYTHING_ANS)
-            elif NotThingTemplate().execute(utterance) is not None:
+            elif NotThingTemplate.compiled().execute(utterance) is not None:
                 text = self.choose(RESPONSE_TO_NOTHING_ANS)
         else:
             if self.get_navigational_intent_output().pos_intent:
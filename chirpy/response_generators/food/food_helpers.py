@@ -19,11 +19,11 @@ ResponseType = add_response_types(ResponseType, ADDITIONAL_RESPONSE_TYPES)
 
 
 def is_recognized_food(rg, utterance):
-    slots = FavoriteTypeTemplate().execute(utterance)
+    slots = FavoriteTypeTemplate.compiled().execute(utterance)
     return slots is not None and is_known_food(slots['type'])
 
 def is_unknown_food(rg, utterance):
-    slots = FavoriteTypeTemplate().execute(utterance)
+    slots = FavoriteTypeTemplate.compiled().execute(utterance)
     return slots is not None and not is_known_food(slots['type'])
 
 
@@ -17,7 +17,7 @@ from chirpy.response_generators.food.treelets.comment_on_favorite_type_treelet i
 from chirpy.response_generators.food.treelets.factoid_treelet import FactoidTreelet
 from chirpy.response_generators.food.treelets.ask_favorite_food_treelet import AskFavoriteFoodTreelet
 from chirpy.response_generators.food.state import State, ConditionalState
-from chirpy.core.offensive_classifier.offensive_classifier import OffensiveClassifier
+from chirpy.core.offensive_classifier.offensive_classifier import contains_offensive
 from chirpy.response_generators.food.food_helpers import *
 
 logger = logging.getLogger('chirpylogger')
@@ -77,8 +77,7 @@ class FoodResponseGenerator(ResponseGenerator):
 
     def get_neural_response(self, prefix=None, allow_questions=False, conditions=None) -> Optional[str]:
         if conditions is None: conditions = []
-        offensive_classifier = OffensiveClassifier()
-        conditions = [lambda response: not offensive_classifier.contains_offensive(response),
+        conditions = [lambda response: not contains_offensive(response),
                       lambda response: not any(bad in response for bad in BAD_WORDS)] + conditions
         response = super().get_neural_response(prefix, allow_questions, conditions)
         if response is None: return "That's great to hear."
@@ -40,7 +40,7 @@
 #             response = None
 #             return response, slots, strong_response_flag
 #
-#         slots = FavoriteTypeTemplate().execute(utterance)
+#         slots = FavoriteTypeTemplate.compiled().execute(utterance)
 #         if slots is not None:
 #             if is_known_food(slots['type']):
 #                 response = self.UserResponses.recognized_type
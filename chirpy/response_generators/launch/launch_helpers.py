@@ -54,7 +54,7 @@ def get_name_from_utterance(rg, user_utterance, remove_no=False) -> Optional[str
     :return:
     """
     # Next try matching with MyNameIs regex
-    my_name_is_slots = MyNameIsTemplate().execute(user_utterance)
+    my_name_is_slots = MyNameIsTemplate.compiled().execute(user_utterance)
 
     proper_nouns = rg.state_manager.current_state.corenlp['proper_nouns']
     proper_nouns = list(proper_nouns) + list(word for word in rg.state_manager.current_state.text if word in NAMES and word not in proper_nouns)
@@ -31,7 +31,7 @@ class HandleNameTreelet(Treelet):
         """Tries to get user's name from their utterance. Returns bool (if user wanted to give name) and the name (string) (or None)"""
 
         # Check if user explicitly said they did not want to tell us their name, or expressed a negative sentiment
-        no_slots = DoesNotWantToSayNameTemplate().execute(utterance)
+        no_slots = DoesNotWantToSayNameTemplate.compiled().execute(utterance)
         if no_slots or ResponseType.NEGATIVE_USER_SENTIMENT in response_types:
             self.rg.reset_user_attributes()
             logger.primary_info('Detected that user did not want to say name. Moving onto HOWDY conversation.')
@@ -30,7 +30,7 @@ class RecognizedNameTreelet(Treelet):
         """
         state, user_utterance, response_types = self.get_state_utterance_response_types()
 
-        no_slots = DoesNotWantToSayNameTemplate().execute(user_utterance)
+        no_slots = DoesNotWantToSayNameTemplate.compiled().execute(user_utterance)
         extracted_name = get_name_from_utterance(self.rg, user_utterance, remove_no=True)
 
         # If user said no, and nothing else set user intent accordingly
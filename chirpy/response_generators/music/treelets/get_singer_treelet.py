@@ -61,7 +61,7 @@ class GetSingerTreelet(Treelet):
             next_treelet_str = self.rg.get_song_treelet.name
         else:
             # Try to parse singer name from utterance
-            slots = NameFavoriteSongTemplate().execute(utterance)
+            slots = NameFavoriteSongTemplate.compiled().execute(utterance)
             if slots is not None and 'favorite' in slots:
                 cur_singer_str = slots['favorite']
                 cur_singer_ent = self.rg.get_song_entity(cur_singer_str)
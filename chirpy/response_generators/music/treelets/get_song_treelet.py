@@ -84,7 +84,7 @@ class GetSongTreelet(Treelet):
                 response, needs_prompt, next_treelet_str = self.rg.try_talking_about_fav_song_else_exit(response)
             else:
                 # Try to parse song name from utterance
-                song_slots = NameFavoriteSongTemplate().execute(utterance)
+                song_slots = NameFavoriteSongTemplate.compiled().execute(utterance)
                 if song_slots is not None and 'favorite' in song_slots:
                     cur_song_str = song_slots['favorite']
                     cur_song_ent = self.rg.get_song_entity(cur_song_str)
@@ -29,7 +29,7 @@ class HandoffTreelet(Treelet):
         ])
 
         cur_song_ent, cur_singer_ent = self.get_music_entity()
-        song_slots = NameFavoriteSongTemplate().execute(utterance)
+        song_slots = NameFavoriteSongTemplate.compiled().execute(utterance)
         # First, if user mentions a song we try to compliment it
         if cur_song_ent:
             response = self.choose(templates.compliment_user_song_choice())
@@ -1,10 +1,10 @@
 import logging
 import re
-import psycopg2
 import os
 from collections import Counter
 
 from chirpy.core.entity_linker.entity_groups import EntityGroup
+from chirpy.core.postgres import PostgresPool
 from chirpy.core.entity_linker.entity_linker_simple import get_entity_by_wiki_name, link_span_to_entity
 
 from chirpy.response_generators.wiki2.wiki_utils import overview_entity
@@ -25,6 +25,9 @@ DATABASE = 'musicbrainz'
 PORT = 5432
 USER = os.environ.get('POSTGRES_USER')
 PASSWORD = os.environ.get('POSTGRES_PASSWORD')
+QUERY_TIMEOUT = 1.0  # seconds
+MUSICBRAINZ_POOL = PostgresPool(host=HOST, port=PORT, database=DATABASE, user=USER, password=PASSWORD,
+                                timeout=QUERY_TIMEOUT)
 
 
 class MusicEntity:
@@ -45,7 +48,7 @@ class MusicBrainzInterface:
             SELECT release.name AS release_name
             FROM musicbrainz.artist_credit
             INNER JOIN musicbrainz.release ON artist_credit.id = release.artist_credit
-            WHERE LOWER(artist_credit.name) = LOWER('{placeholder}');
+            WHERE LOWER(artist_credit.name) = LOWER(%(placeholder)s);
             """
         TOP_SONGS_BY_MUSICIAN = """
             SELECT
@@ -54,7 +57,7 @@ class MusicBrainzInterface:
             FROM musicbrainz.track
             LEFT JOIN musicbrainz.artist_credit ON
             track.artist_credit = artist_credit.id
-            WHERE LOWER(artist_credit.name) = LOWER('{placeholder}')
+            WHERE LOWER(artist_credit.name) = LOWER(%(placeholder)s)
             GROUP BY track.name
             ORDER BY count DESC
             LIMIT 5
@@ -63,7 +66,7 @@ class MusicBrainzInterface:
             SELECT artist_credit.name AS artist_name
             FROM musicbrainz.artist_credit
             INNER JOIN musicbrainz.release ON artist_credit.id = release.artist_credit
-            WHERE LOWER(release.name) = LOWER('{placeholder}');
+            WHERE LOWER(release.name) = LOWER(%(placeholder)s);
         """
         SONG_META = """
             SELECT
@@ -83,7 +86,7 @@ class MusicBrainzInterface:
             ON release.release_group = release_group_tag.release_group
             LEFT JOIN musicbrainz.tag
             ON release_group_tag.tag = tag.id
-            WHERE LOWER(release.name) = LOWER('{placeholder}')
+            WHERE LOWER(release.name) = LOWER(%(placeholder)s)
             AND artist_credit.ref_count IS NOT NULL
             AND artist_credit_name.name != 'Various Artists'
             GROUP BY release.name, first_release_date_year, artist_credit_name.name, artist_credit.ref_count
@@ -109,8 +112,8 @@ class MusicBrainzInterface:
             ON release.release_group = release_group_tag.release_group
             LEFT JOIN musicbrainz.tag
             ON release_group_tag.tag = tag.id
-            WHERE LOWER(release.name) = LOWER('{song}')
-            AND LOWER(artist_credit_name.name) = LOWER('{singer}')
+            WHERE LOWER(release.name) = LOWER(%(song)s)
+            AND LOWER(artist_credit_name.name) = LOWER(%(singer)s)
             AND artist_credit.ref_count IS NOT NULL
             GROUP BY release.name, first_release_date_year, artist_credit_name.name, artist_credit.ref_count
             ORDER BY artist_credit.ref_count DESC,
@@ -125,44 +128,30 @@ class MusicBrainzInterface:
             ON artist_tag.artist = artist.id
             LEFT JOIN musicbrainz.tag
             ON tag.id = artist_tag.tag
-            WHERE LOWER(artist.name) = LOWER('{placeholder}')
+            WHERE LOWER(artist.name) = LOWER(%(placeholder)s)
             AND tag.name IS NOT NULL
             ORDER BY ref_count DESC
             LIMIT 1
         """
 
-    def __init__(self):
-        self.conn = psycopg2.connect(
-            host=HOST,
-            port=PORT,
-            database=DATABASE,
-            user=USER,
-            password=PASSWORD
-        )
-        self.cur = self.conn.cursor()
+    def __init__(self, pool: PostgresPool = MUSICBRAINZ_POOL):
+        self.pool = pool
 
     def get_musician_entities_by_song(self, song_name):
         # TODO: Maybe select the most common musician
         song_name = WikiEntityInterface.make_title(song_name)
-        song_name = song_name.replace("'", "''")
-        query = MusicBrainzInterface.Query.MUSICIAN_BY_SONG.format(placeholder=song_name)
-        musician_entities = self.get_results(query)
+        musician_entities = self.get_results(MusicBrainzInterface.Query.MUSICIAN_BY_SONG, {'placeholder': song_name})
         return musician_entities
 
     def get_song_entities_by_musician(self, musician_name):
         musician_name = WikiEntityInterface.make_title(musician_name)
-        musician_name = musician_name.replace("'", "''")
-        query = MusicBrainzInterface.Query.SONG_BY_MUSICIAN.format(placeholder=musician_name)
-        song_entities = self.get_results(query)
+        song_entities = self.get_results(MusicBrainzInterface.Query.SONG_BY_MUSICIAN, {'placeholder': musician_name})
         return song_entities
 
     def get_top_songs_by_musician(self, musician_name):
         musician_name = WikiEntityInterface.make_title(musician_name)
         logger.primary_info(f"Getting top songs by {musician_name}")
-        musician_name = musician_name.replace("'", "''")
-        query = MusicBrainzInterface.Query.TOP_SONGS_BY_MUSICIAN.format(placeholder=musician_name)
-        self.cur.execute(query)
-        results = self.cur.fetchall()
+        results = self.pool.fetchall(MusicBrainzInterface.Query.TOP_SONGS_BY_MUSICIAN, {'placeholder': musician_name})
         song_names = [r[0] for r in results]
         logger.primary_info(f"Retrieved songs {song_names} by {musician_name}")
         return song_names
@@ -170,19 +159,14 @@ class MusicBrainzInterface:
     def get_song_meta(self, song_name, singer_name=None):
         logger.primary_info(f"Getting metadata for {song_name}")
         song_name = WikiEntityInterface.make_title(song_name)
-        song_name = song_name.replace("'", "''")
         results = []
         if singer_name:
             singer_name = WikiEntityInterface.make_title(singer_name)
-            singer_name = singer_name.replace("'", "''")
-            query = MusicBrainzInterface.Query.SONG_META_NAMED_SINGER.format(song=song_name, singer=singer_name)
-            self.cur.execute(query)
-            results = self.cur.fetchall()
+            results = self.pool.fetchall(MusicBrainzInterface.Query.SONG_META_NAMED_SINGER,
+                                         {'song': song_name, 'singer': singer_name})
 
         if len(results) == 0:
-            query = MusicBrainzInterface.Query.SONG_META.format(placeholder=song_name)
-            self.cur.execute(query)
-            results = self.cur.fetchall()
+            results = self.pool.fetchall(MusicBrainzInterface.Query.SONG_META, {'placeholder': song_name})
 
         logger.primary_info(f"Retrieved metadata {results} for {song_name}")
         if len(results):
@@ -197,17 +181,13 @@ class MusicBrainzInterface:
     def get_singer_genre(self, singer_name):
         logger.primary_info(f"Getting genre of {singer_name}")
         singer_name = WikiEntityInterface.make_title(singer_name)
-        singer_name = singer_name.replace("'", "''")
-        query = MusicBrainzInterface.Query.SINGER_META.format(placeholder=singer_name)
-        self.cur.execute(query)
-        results = self.cur.fetchall()
+        results = self.pool.fetchall(MusicBrainzInterface.Query.SINGER_META, {'placeholder': singer_name})
         logger.primary_info(f"Retrieved genre {results} for {singer_name}")
         if len(results):
             return results[0][0]
 
-    def get_results(self, query):
-        self.cur.execute(query)
-        results = self.cur.fetchall()
+    def get_results(self, query, args):
+        results = self.pool.fetchall(query, args)
         results = [r[0] for r in results]
         results = Counter(results).most_common(5) # TODO
         results = [r[0] for r in results]
@@ -128,7 +128,7 @@ class Treelet(BaseTreelet):
 
         DEPRECATED
         """
-        return ReturnQuestionTemplate().execute(history[-1]) is not None
+        return ReturnQuestionTemplate.compiled().execute(history[-1]) is not None
 
     @property
     def return_question_answer(self) -> str:
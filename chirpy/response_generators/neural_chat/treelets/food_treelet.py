@@ -175,7 +175,7 @@ class FoodTreelet(Treelet):
             return None, [], []
 
         # If user is saying they haven't eaten, give the scripted response
-        if HaventEatenTemplate().execute(history[-1]) is not None:
+        if HaventEatenTemplate.compiled().execute(history[-1]) is not None:
             logger.primary_info(f"User utterance '{history[-1]}' matches HaventEatenTemplate so using scripted response")
             return HAVENT_EATEN_RESPONSE, ['HAVENT_EATEN'], []
 
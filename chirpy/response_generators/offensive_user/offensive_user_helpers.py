@@ -45,11 +45,11 @@ with open(CONTEXTUAL_RESPONSES_CSV_PATH, 'r') as f:
 
 
 def categorize_offense(utterance) -> str:
-    if CriticismTemplate().execute(utterance) is not None:
+    if CriticismTemplate.compiled().execute(utterance) is not None:
         return 'criticism'
-    if SexualOffensesTemplate().execute(utterance) is not None:
+    if SexualOffensesTemplate.compiled().execute(utterance) is not None:
         return 'sexual'
-    if InappropOffensesTemplate().execute(utterance) is not None:
+    if InappropOffensesTemplate.compiled().execute(utterance) is not None:
         return 'inappropriate topic'
     for offense_type, examples in EXAMPLES_OF_OFFENSES.items():
         if offense_type == 'curse' and contains_phrase(utterance, examples):
@@ -40,14 +40,14 @@ class OneTurnHackResponseGenerator(ResponseGenerator):
                                            smooth_handoff=SmoothHandoff.ONE_TURN_TO_WIKI_GF)
 
         # Check for chatty phrases in utterance
-        chatty_slots = ChattyTemplate().execute(utterance)
-        my_name_slots = MyNameIsNonContextualTemplate().execute(utterance)
-        not_my_name_slots = MyNameIsNotTemplate().execute(utterance)
-        say_that_again_slots = SayThatAgainTemplate().execute(utterance)
-        request_name_slots = RequestNameTemplate().execute(utterance)
-        request_story_slots = RequestStoryTemplate().execute(utterance)
-        compliment_slots = ComplimentTemplate().execute(utterance)
-        request_age_slots = RequestAgeTemplate().execute(utterance)
+        chatty_slots = ChattyTemplate.compiled().execute(utterance)
+        my_name_slots = MyNameIsNonContextualTemplate.compiled().execute(utterance)
+        not_my_name_slots = MyNameIsNotTemplate.compiled().execute(utterance)
+        say_that_again_slots = SayThatAgainTemplate.compiled().execute(utterance)
+        request_name_slots = RequestNameTemplate.compiled().execute(utterance)
+        request_story_slots = RequestStoryTemplate.compiled().execute(utterance)
+        compliment_slots = ComplimentTemplate.compiled().execute(utterance)
+        request_age_slots = RequestAgeTemplate.compiled().execute(utterance)
 
         # logger.primary_info(f"Request name is present: {request_name_slots is not None}")
         if chatty_slots is not None:
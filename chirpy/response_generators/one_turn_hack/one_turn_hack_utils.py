@@ -8,8 +8,8 @@ def is_game_or_music_request(rg, utterance):
     :param utterance:
     :return:
     """
-    request_play_slots = RequestPlayTemplate().execute(utterance)
-    not_request_play_slots = NotRequestPlayTemplate().execute(utterance)
+    request_play_slots = RequestPlayTemplate.compiled().execute(utterance)
+    not_request_play_slots = NotRequestPlayTemplate.compiled().execute(utterance)
     current_state = rg.state_manager.current_state
     cur_entity = current_state.entity_tracker.cur_entity
     prev_bot_utt = current_state.history[-1] if len(current_state.history) >= 1 else ''
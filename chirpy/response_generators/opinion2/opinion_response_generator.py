@@ -308,7 +308,7 @@ class OpinionResponseGenerator2(ResponseGenerator):
                         or linked_span.top_ent.name in self.opinionable_entities for linked_span in high_prec): # type: ignore
             self.logger.primary_info(f'Opinion realized that there is a high precision entity, will not CAN_START our conversation') # type: ignore
             priority = ResponsePriority.NO
-        # if WhatsYourOpinion().execute(utterance) is not None:
+        # if WhatsYourOpinion.compiled().execute(utterance) is not None:
         #     self.logger.primary_info(f"Opinion detected user is asking for our opinion, raising priority to FORCE_START") # type: ignore
         #     priority = ResponsePriority.FORCE_START
         else:
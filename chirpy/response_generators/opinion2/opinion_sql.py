@@ -1,8 +1,8 @@
 import logging
 from functools import lru_cache
 from chirpy.core.latency import measure
+from chirpy.core.postgres import PostgresPool
 import re
-import psycopg2
 from typing import List, Optional, Set, Tuple
 from dataclasses import dataclass
 import os
@@ -18,6 +18,8 @@ port = 5432
 database = 'twitter_opinions'
 user = os.environ.get('POSTGRES_USER')
 password = os.environ.get('POSTGRES_PASSWORD')
+POOL = PostgresPool(host=host_stream, port=port, database=database, user=user, password=password)
+OPINIONS_QUERY_TIMEOUT = 1.0  # seconds
 
 NOT_ALPHA_NUMERIC_RE = r'[^a-zA-Z0-9\s]'
 HASHTAG = r'#[^\s]+'
@@ -47,25 +49,15 @@ class Opinion:
     attitude : str
     sentiment : int # 0 - negative, 4 - positive
 
-def fetch_sql(sql_statement, args=None):
+def fetch_sql(sql_statement, args=None, timeout=None):
     """
 
-    :param sql_statement: SQL query
+    :param sql_statement: SQL query, with %s placeholders for args
     :param args: tuple
+    :param timeout: seconds after which the query is cancelled, or None for no timeout
     :return:
     """
-    print(host_stream, port, database, user, password)
-    conn = psycopg2.connect(host=host_stream, port=port, database=database, user=user, password=password)
-    cur = conn.cursor()
-    if args is None:
-        cur.execute(sql_statement)
-    else:
-        cur.execute(sql_statement, args)
-    result = cur.fetchall()
-    conn.commit()
-    cur.close()
-    conn.close()
-    return result
+    return POOL.fetchall(sql_statement, args, timeout=timeout)
 
 def parse_entry(entry : Tuple[str, str, str, str]) -> Opinion:
     """This method parses a specific entry returned which is a list in the form of
@@ -112,7 +104,7 @@ def get_opinions(phrase : str) -> Set[Opinion]:
     :rtype: Set[Opinion]
     """
     query = "select distinct phrase, reason, attitude, sentiment from labeled_opinions where phrase = %s and reason_appropriateness = 4"
-    results = fetch_sql(query, (phrase,))
+    results = fetch_sql(query, (phrase,), timeout=OPINIONS_QUERY_TIMEOUT)
     opinions = set(parse_entry(entry) for entry in results)
     opinions = set(opinion for opinion in opinions if not contains_offensive(opinion.reason))
     opinions = set(opinion for opinion in opinions if 'i love money' not in opinion.reason)
@@ -101,7 +101,7 @@ def is_like(utterance : str) -> Tuple[bool, Optional[str]]:
     :return: True if user said "i like ...", together with a reason if there is any
     :rtype: Tuple[bool, Optional[str]]
     """
-    slots = LikeRegex().execute(utterance)
+    slots = LikeRegex.compiled().execute(utterance)
     if slots is None:
         return False, None
     return True, slots['reason'] if 'reason' in slots else None
@@ -114,7 +114,7 @@ def is_not_like(utterance : str) -> Tuple[bool, Optional[str]]:
     :return: True if user said "i don't like ...", together with a reason if there is any
     :rtype: Tuple[bool, Optional[str]]
     """
-    slots = DislikeRegex().execute(utterance)
+    slots = DislikeRegex.compiled().execute(utterance)
     if slots is None:
         return False, None
     return True, slots['reason'] if 'reason' in slots else None
@@ -30,7 +30,7 @@ def is_gratitude_response(rg, utterance):
         bool: a boolean variable representing whether the user is grateful.
     """
     return rg.state_manager.current_state.corenlp['sentiment'] >= Sentiment.NEUTRAL and \
-           GratitudeTemplate().execute(utterance) is not None and NegatedGratitudeTemplate().execute(utterance) is None
+           GratitudeTemplate.compiled().execute(utterance) is not None and NegatedGratitudeTemplate.compiled().execute(utterance) is None
 
 
 def is_short_response(utterance):
@@ -55,7 +55,7 @@ def is_noncommittal_response(rg, utterance):
 PERSONAL_ISSUE_THRESHOLD = 0.7
 def is_personal_issue(rg, utterance):
     sentiment = rg.state_manager.current_state.corenlp['sentiment']
-    template_match = PersonalSharingTemplate().execute(utterance) is not None
+    template_match = PersonalSharingTemplate.compiled().execute(utterance) is not None
     # logger.primary_info(f"Personal sharing template match: {template_match}")
     return sentiment <= Sentiment.NEUTRAL and template_match
     # return (sentiment <= Sentiment.NEUTRAL and
@@ -66,12 +66,12 @@ def is_personal_issue(rg, utterance):
 NEUTRAL_SHARING_THRESHOLD = 0.45
 def is_continued_sharing(rg, utterance):
     num_tokens = len(utterance.split())
-    neg_emotion = NegativeEmotionRegexTemplate().execute(utterance) is not None
+    neg_emotion = NegativeEmotionRegexTemplate.compiled().execute(utterance) is not None
     long_response_with_personal_pronouns = num_tokens >= 5 and \
-                                           PersonalPronounRegexTemplate().execute(utterance) is not None
+                                           PersonalPronounRegexTemplate.compiled().execute(utterance) is not None
     long_sharing = num_tokens >= 10
     personal_disclosure = rg.state_manager.current_state.dialogact['personal_issue_score'] >= NEUTRAL_SHARING_THRESHOLD
-    change_topic = ChangeTopicTemplate().execute(utterance) is not None
+    change_topic = ChangeTopicTemplate.compiled().execute(utterance) is not None
     logger.primary_info(f"Continued sharing checks: neg_emotion {neg_emotion is not None}, "
                         f"is long response with personal pronouns {long_response_with_personal_pronouns}, "
                         f"personal_disclosure {personal_disclosure}")
@@ -79,7 +79,7 @@ def is_continued_sharing(rg, utterance):
     if rg.state_manager.current_state.question['is_question'] or change_topic:
         return False
 
-    template_match = PersonalSharingContinuedTemplate().execute(utterance) is not None
+    template_match = PersonalSharingContinuedTemplate.compiled().execute(utterance) is not None
 
     return neg_emotion or long_response_with_personal_pronouns or personal_disclosure or long_sharing or template_match
 
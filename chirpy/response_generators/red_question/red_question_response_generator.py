@@ -92,7 +92,7 @@ class RedQuestionResponseGenerator(ResponseGenerator):
         if advice_type_ is not None:
             response_types.add(ResponseType.REQUEST_ADVICE)
 
-        if AreYouRecordingTemplate().execute(utterance) is not None:
+        if AreYouRecordingTemplate.compiled().execute(utterance) is not None:
             response_types.add(ResponseType.ASKS_RECORDING)
 
         return response_types
@@ -0,0 +1,74 @@
+"""
+Tests for the TransitionStore file format: build a store from a few articles' transitions and read it back
+
+Run:
+    python -m unittest -v chirpy/response_generators/transition/test_transition_store.py
+"""
+
+import os
+import struct
+import tempfile
+import unittest
+
+from chirpy.response_generators.transition.transition_store import VERSION, TransitionStore, build_store
+
+TITLE2TRANSITIONS = {
+    'Cat': {'animal': ('Dog', 'Cats are often compared to dogs.'),
+            'musical': ('Cats (musical)', 'The musical Cats is named after them.')},
+    'Dog': {'animal': ('Wolf', 'Dogs descend from wolves.')},
+    'Café': {'food': ('Croissant', 'A café often serves croissants.')},
+    'Zebra': {},
+}
+
+
+class TestTransitionStore(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, 'transitions.bin')
+        self.assertEqual(build_store(TITLE2TRANSITIONS.items(), self.path), len(TITLE2TRANSITIONS))
+
+    def open_store(self) -> TransitionStore:
+        store = TransitionStore(self.path)
+        self.addCleanup(store.close)
+        return store
+
+    def test_round_trip(self):
+        store = self.open_store()
+        self.assertEqual(len(store), len(TITLE2TRANSITIONS))
+        for title, transitions in TITLE2TRANSITIONS.items():
+            self.assertEqual(store.get(title), transitions)
+        # Only the store is left in the directory
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ['transitions.bin'])
+
+    def test_rebuild_replaces_store(self):
+        store = self.open_store()
+        build_store([('Cat', {})], self.path)
+        self.assertEqual(store.get('Dog'), TITLE2TRANSITIONS['Dog'])
+        new_store = self.open_store()
+        self.assertEqual(len(new_store), 1)
+        self.assertEqual(new_store.get('Cat'), {})
+        self.assertIsNone(new_store.get('Dog'))
+
+    def test_missing_key(self):
+        store = self.open_store()
+        for title in ['', 'cat', 'Bird', 'Cafe', 'Zebras']:
+            self.assertIsNone(store.get(title))
+
+    def test_bad_magic(self):
+        with open(self.path, 'r+b') as f:
+            f.write(b'NOTCHIRP')
+        with self.assertRaises(ValueError):
+            TransitionStore(self.path)
+
+    def test_bad_version(self):
+        with open(self.path, 'r+b') as f:
+            f.seek(8)
+            f.write(struct.pack('<I', VERSION + 1))
+        with self.assertRaises(ValueError):
+            TransitionStore(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,16 @@
+import os
 import re
 import boto3
 from requests_aws4auth import AWS4Auth
 from elasticsearch import Elasticsearch, RequestsHttpConnection
 import logging
 import random
+from typing import Dict, List, Tuple
 
 from chirpy.core.entity_linker.entity_groups import ENTITY_GROUPS_FOR_EXPECTED_TYPE
+from chirpy.core.entity_linker.entity_linker_classes import WikiEntity
 from chirpy.core.entity_linker.wiki_data_fetching import get_entities_by_wiki_name
+from chirpy.response_generators.transition.transition_store import TransitionStore
 from chirpy.annotators.sentseg import NLTKSentenceSegmenter
 
 logger = logging.getLogger('chirpylogger')
@@ -27,43 +31,69 @@ es = Elasticsearch(
 
 INDEX='enwiki-20201201-sections'
 
+# If set, the path of a TransitionStore (see transition_store.py) that get_transitions reads from before querying ES
+TRANSITION_STORE_PATH = os.environ.get('TRANSITION_STORE_PATH')
+
+def get_transition_store():
+    if TRANSITION_STORE_PATH:
+        try:
+            return TransitionStore(TRANSITION_STORE_PATH)
+        except Exception:
+            logger.warning(f'Unable to open the transition store at {TRANSITION_STORE_PATH}, so getting transitions from ES', exc_info=True)
+    return None
+
+transition_store = get_transition_store()
+
+# The expected types we transition to, see ENTITY_GROUPS_FOR_EXPECTED_TYPE
+TRANSITION_TYPES = ['book_related', 'location_related', 'food_related', 'sport_related', 'film']
+
 def prune_section(section):
     return section['text'][0] in {'†', '+', '*'}
 
 def prune_text(text):
     return sum(1 if x in text else 0 for x in {'|', '[', ']'}) != 0
 
-def get_related_candidate_entities(ent_name):
-    query = {'query': {'bool': {'filter': [
-            {'term': {'doc_title': ent_name}}]}}}
-    sections = es.search(index=INDEX, body=query, size=100)
-    links, text = set([]), set([])
-    for section in sections['hits']['hits']:
-        source = section['_source']
+def get_transition_links_and_text(sections: List[dict]) -> Tuple[List[str], str]:
+    """
+    Given the sections of an article (as in the sections index), returns the wiki_links and the text of the sections
+    we take transitions from (the overview, and the cuisine section).
+    """
+    links, text = set([]), {}  # text is an ordered set of paragraphs
+    for source in sections:
         if (source['title'].lower() == '' or source['title'].lower() == 'cuisine') and not prune_section(source):
             source_text = source['text'].split('\n\n')
             for st in source_text:
                 if not prune_text(st):
-                    text.add(st)
+                    text[st] = None
                     links.update(source['wiki_links'])
+    return list(links), '\n'.join(text)
 
-    links, text = list(links), '\n'.join(list(text))
-    ents = []
-    type2ent = {'book_related':[], 'location_related':[], 'food_related':[], 'sport_related':[], 'film':[]}
-    if len(links) > 0:
-        ents = list(get_entities_by_wiki_name(links).values())
-        for et in type2ent:
-            try:
-                expected_type = getattr(ENTITY_GROUPS_FOR_EXPECTED_TYPE,et)
-                type2ent[et] = [e for e in ents if expected_type.matches(e)]
-            except:
-                logger.error(f"Expected type: {et} doesn't exist")
+def group_by_transition_type(ents: List[WikiEntity]) -> Dict[str, List[WikiEntity]]:
+    type2ent = {et: [] for et in TRANSITION_TYPES}
+    for et in type2ent:
+        try:
+            expected_type = getattr(ENTITY_GROUPS_FOR_EXPECTED_TYPE,et)
+            type2ent[et] = [e for e in ents if expected_type.matches(e)]
+        except:
+            logger.error(f"Expected type: {et} doesn't exist")
+    return type2ent
 
+def get_related_candidate_entities(ent_name):
+    query = {'query': {'bool': {'filter': [
+            {'term': {'doc_title': ent_name}}]}}}
+    sections = es.search(index=INDEX, body=query, size=100)
+    links, text = get_transition_links_and_text([section['_source'] for section in sections['hits']['hits']])
+    type2ent = {et: [] for et in TRANSITION_TYPES}
+    if len(links) > 0:
+        type2ent = group_by_transition_type(list(get_entities_by_wiki_name(links).values()))
     return type2ent, text
 
-def get_transitions(ent_name):
+def choose_transitions(type2ent: Dict[str, List[WikiEntity]], text: str) -> Dict[str, Tuple[WikiEntity, str]]:
+    """
+    For each type, chooses the most viewed entity of that type that the text mentions (by one of its top anchortexts),
+    and the first sentence of the text that mentions it. Returns a dict from type to (entity, sentence).
+    """
     sentseg = NLTKSentenceSegmenter(None)
-    type2ent, text = get_related_candidate_entities(ent_name)
     text_sentences = []
     sents = {}
     for et, ents in type2ent.items():
@@ -82,6 +112,21 @@ def get_transitions(ent_name):
                     break
     return sents
 
+def get_transitions(ent_name) -> Dict[str, Tuple[WikiEntity, str]]:
+    """
+    Returns a dict from type to (entity, sentence) for the entities we can transition to from ent_name, and the
+    sentences we can use to do so. They're read from the TransitionStore if it has ent_name, and computed from the
+    sections index otherwise.
+    """
+    if transition_store is not None:
+        name2transition = transition_store.get(ent_name)
+        if name2transition is not None:
+            entname2ent = get_entities_by_wiki_name([ent for ent, _ in name2transition.values()])
+            return {et: (entname2ent[ent], sent) for et, (ent, sent) in name2transition.items() if ent in entname2ent}
+        logger.info(f"{ent_name} isn't in the transition store at {TRANSITION_STORE_PATH}, so getting its transitions from ES")
+    type2ent, text = get_related_candidate_entities(ent_name)
+    return choose_transitions(type2ent, text)
+
 STARTER_TEXTS = ["did you know, ",
      "i recently learned that ",
      "i was reading recently and found out that ",
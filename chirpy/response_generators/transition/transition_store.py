@@ -0,0 +1,120 @@
+"""
+A read-only store of the precomputed transitions of each Wikipedia article: for each expected type (see
+transition_helpers.TRANSITION_TYPES), the entity the TRANSITION RG would transition to from the article, and the
+sentence of the article it would use to do so. With it, get_transitions is a lookup in a memory-mapped file rather than
+a sections query, a WikiEntity query for every link of the article, and a scan of its text on every call.
+
+The transitions are computed offline by wiki-es-dump/transitions.py (with the same code as get_transitions), and the
+store is built from its output:
+
+    python -m chirpy.response_generators.transition.transition_store "/path/to/enwiki-...-transitions.json/part-*" /path/to/transitions.bin
+
+and used by setting TRANSITION_STORE_PATH=/path/to/transitions.bin. The file is memory-mapped read-only, so all the
+worker processes on a machine share one copy.
+"""
+
+import argparse
+import bz2
+import json
+import mmap
+import os
+import struct
+import tempfile
+from ast import literal_eval
+from glob import glob
+from typing import Dict, Iterable, Optional, Tuple
+
+from chirpy.core.entity_linker.wiki_entity_store import SortedKeyTable, write_sorted_key_table
+
+VERSION = 1
+
+# File header: magic, version, number of articles, and the offsets of the article entries, titles blob and transitions blob
+HEADER = struct.Struct('<8sIIQQQ')
+MAGIC = b'CHIRPYTR'
+
+# One ARTICLE per article, sorted by title: offset and length of the title in the titles blob, and offset and length of
+# its transitions (a JSON dict from type to [entity name, sentence]) in the transitions blob
+ARTICLE = struct.Struct('<QIQI')
+
+
+class TransitionStore:
+    """Read-only access to a store built by build_store. Safe to share between threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self.buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.num_articles, articles_offset, titles_offset, self.transitions_offset = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f'{path} is not a version {VERSION} TransitionStore file')
+        self.articles = SortedKeyTable(self.buf, ARTICLE, articles_offset, titles_offset, self.num_articles)
+
+    def close(self):
+        self.buf.close()
+        self._file.close()
+
+    def __len__(self):
+        return self.num_articles
+
+    def get(self, title: str) -> Optional[Dict[str, Tuple[str, str]]]:
+        """
+        Returns a dict from type to (entity name, sentence) for the transitions from the article called title, or None
+        if the article isn't in the store. Articles with no transitions map to an empty dict.
+        """
+        entry = self.articles.find(title)
+        if entry is None:
+            return None
+        _, _, offset, length = entry
+        start = self.transitions_offset + offset
+        return {et: tuple(transition) for et, transition in json.loads(self.buf[start:start + length]).items()}
+
+
+def build_store(title2transitions: Iterable[Tuple[str, Dict[str, Tuple[str, str]]]], path: str) -> int:
+    """
+    Writes a TransitionStore of title2transitions, (title, dict from type to (entity name, sentence)) pairs, to path.
+    The file is written next to path and then renamed, so processes that are reading an old store at path are
+    unaffected. Returns the number of articles.
+    """
+    items, transitions_offset = [], 0
+    transitions_blobs = []
+    for title, transitions in sorted(title2transitions, key=lambda item: item[0].encode('utf-8')):
+        transitions = json.dumps(transitions, separators=(',', ':')).encode('utf-8')
+        items.append((title.encode('utf-8'), transitions_offset, len(transitions)))
+        transitions_blobs.append(transitions)
+        transitions_offset += len(transitions)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.transitions-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'\0' * HEADER.size)
+            articles_offset = f.tell()
+            titles_offset = write_sorted_key_table(f, items, ARTICLE)
+            transitions_section_offset = f.tell()
+            for transitions in transitions_blobs:
+                f.write(transitions)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, len(items), articles_offset, titles_offset, transitions_section_offset))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(items)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a TransitionStore from the output of wiki-es-dump/transitions.py')
+    parser.add_argument('transitions_glob', type=str, help='Glob of the transitions part files (optionally .bz2)')
+    parser.add_argument('path', type=str, help='Where to write the store')
+    args = parser.parse_args()
+
+    def read_title2transitions():
+        for part_path in sorted(glob(args.transitions_glob)):
+            with (bz2.open(part_path, 'rt') if part_path.endswith('.bz2') else open(part_path)) as f:
+                for line in f:
+                    title, transitions = literal_eval(line)
+                    yield title, json.loads(transitions)
+
+    num_articles = build_store(read_title2transitions(), args.path)
+    print(f'Wrote the transitions of {num_articles} articles to {args.path}')
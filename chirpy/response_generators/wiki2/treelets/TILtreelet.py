@@ -67,7 +67,7 @@ class TILTreelet(Treelet):
         paraphrases = filter_and_log(lambda p: p.finished, paraphrases, "Paraphrases for TIL", "they were unfinished")
         paraphrases = filter_and_log(lambda p: not contains_offensive(p.readable_text()), paraphrases, "Paraphrases for TIL", "contained offensive phrase")
 
-        did_you_know = DidYouKnowQuestionTemplate()
+        did_you_know = DidYouKnowQuestionTemplate.compiled()
         if statement_or_question:
             if statement_or_question == 'question':
                 paraphrases = sorted(paraphrases,
@@ -223,11 +223,11 @@
 #
 #         # Check of some standard templates are matched - if so return appropriate response and handover
 #         handover_response = None
-#         if DontKnowTemplate().execute(utterance) is not None:
+#         if DontKnowTemplate.compiled().execute(utterance) is not None:
 #             handover_response = self.choose(RESPONSE_TO_DONT_KNOW)
-#         elif BackChannelingTemplate().execute(utterance) is not None:
+#         elif BackChannelingTemplate.compiled().execute(utterance) is not None:
 #             handover_response = self.choose(RESPONSE_TO_BACK_CHANNELING)
-#         elif NotThingTemplate().execute(utterance) is not None:
+#         elif NotThingTemplate.compiled().execute(utterance) is not None:
 #             handover_response = self.choose(RESPONSE_TO_NOTHING_ANS)
 #         elif ResponseType.NO in response_types:
 #             handover_response = self.choose(HANDOVER_TEXTS)
@@ -14,8 +14,8 @@ ADDITIONAL_RESPONSE_TYPES = ['CONFUSED', 'WHAT_ABOUT_YOU', 'HIGH_INITIATIVE', 'P
 ResponseType = add_response_types(ResponseType, ADDITIONAL_RESPONSE_TYPES)
 
 def user_is_confused(rg, utterance):
-    return (ClarificationQuestionTemplate().execute(utterance) and not rg.get_navigational_intent_output().pos_intent) \
-           or DoubtfulTemplate().execute(utterance)
+    return (ClarificationQuestionTemplate.compiled().execute(utterance) and not rg.get_navigational_intent_output().pos_intent) \
+           or DoubtfulTemplate.compiled().execute(utterance)
 
 def is_high_initiative(rg, utterance):
     corenlp_output = rg.state_manager.current_state.corenlp
@@ -32,14 +32,14 @@ def is_neutral_sentiment(rg, utterance):
     return rg.get_sentiment() == Sentiment.NEUTRAL
 
 def is_appreciative(rg, utterance):
-    return rg.get_top_dialogact() == 'appreciation' or AppreciativeTemplate().execute(utterance) is not None
+    return rg.get_top_dialogact() == 'appreciation' or AppreciativeTemplate.compiled().execute(utterance) is not None
 
 def starts_with_what(rg, utterance):
     tokens = list(utterance.split())
     return 'what' in tokens[:3]
 
 def user_wants_to_know_more(rg, utterance):
-    return KnowMoreTemplate().execute(utterance) is not None
+    return KnowMoreTemplate.compiled().execute(utterance) is not None
 
 FIRST_PERSON_WORDS = {
     "i", "i'd", "i've", "i'll", "i'm",
@@ -69,10 +69,10 @@ def is_no_to_sections(rg, utterance):
 #     state =
 
 def user_agrees(rg, utterance):
-    return AgreementTemplate().execute(utterance) is not None
+    return AgreementTemplate.compiled().execute(utterance) is not None
 
 def user_disagees(rg, utterance):
-    return DisagreementTemplate().execute(utterance) is not None
+    return DisagreementTemplate.compiled().execute(utterance) is not None
 
 def original_til_templates(apologize: bool, original_til: str):
     APOLOGIZE_THEN_ORIGINAL = \
@@ -1,5 +1,5 @@
 import logging
-from typing import List
+from typing import List, Tuple
 import re
 import functools
 
@@ -14,6 +14,7 @@ from chirpy.core.util import get_ngrams
 from chirpy.annotators.sentseg import NLTKSentenceSegmenter
 from chirpy.core.offensive_classifier.offensive_classifier import contains_offensive
 from chirpy.core.smooth_handoffs import SmoothHandoff
+from chirpy.core.ttl_cache import TTLCache
 import json
 import os
 import chirpy.response_generators.wiki2.wiki_utils as wiki_utils
@@ -209,6 +210,24 @@ def call_colbertinfiller(tuples, sentences, max_length, contexts, prompts):
         'repetition_penalty': 1.0,
     })
 
+def get_infiller_fn():
+    """Returns the infiller to call, call_colbertinfiller or call_infiller depending on $usecolbert"""
+    return call_colbertinfiller if os.environ['usecolbert'] else call_infiller
+
+def get_infiller_args(input_data) -> Tuple:
+    """Returns the args of call_infiller / call_colbertinfiller for input_data"""
+    return (input_data.get('tuples'),
+            input_data.get('sentences'),
+            input_data.get('max_length'),
+            input_data.get('contexts', tuple()),
+            input_data.get('prompts', tuple()))
+
+# Infiller results that WikiResponseGenerator.prefetch computed after a turn, for the input that it predicts the next
+# turn will have. Keyed by (session_id, infiller args), so a session only uses the infills prefetched for it.
+INFILL_PREFETCH_CACHE_SIZE = 2000  # number of (session, input) pairs
+INFILL_PREFETCH_TTL = 10 * 60  # seconds
+infill_prefetch_cache = TTLCache('session, infiller input -> prefetched infills', INFILL_PREFETCH_CACHE_SIZE, INFILL_PREFETCH_TTL)
+
 def filter_handwritten_responses(self, responses, entity_name, n_gram_size=2, n_past_bot_utterances=10, threshold=0.5):
     # Remove responses with high history overlap
     bot_utterances_to_consider = self.rg.state_manager.current_state.history[-n_past_bot_utterances:]
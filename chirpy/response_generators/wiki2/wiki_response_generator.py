@@ -1,3 +1,4 @@
+import contextvars
 import os
 import logging
 from typing import Optional, Set, Tuple
@@ -36,6 +37,11 @@ except ModuleNotFoundError:
     use_responseranker = False
 
 
+# The user utterance that prefetch assumes for the next turn. FactoidTreelet is reached when the user says yes to
+# WIKI's prompt about an entity.
+PREFETCH_USER_UTTERANCE = 'yes'
+
+
 class WikiResponseGenerator(ResponseGenerator):
     name='WIKI'
     killable = True
@@ -302,23 +308,13 @@ class WikiResponseGenerator(ResponseGenerator):
             # assert not include_acknowledgements, "Infiller cache should only be set while prompting"
             logger.primary_info(f"Using the infiller cache.")
             return infiller_cache
-        if os.environ['usecolbert']:
-            infiller_results = call_colbertinfiller(
-                input_data.get('tuples'),
-                input_data.get('sentences'),
-                input_data.get('max_length'),
-                input_data.get('contexts', tuple()),
-                input_data.get('prompts', tuple()),
-            )
-        else:
-            infiller_results = call_infiller(
-                input_data.get('tuples'),
-                input_data.get('sentences'),
-                input_data.get('max_length'),
-                input_data.get('contexts', tuple()),
-                input_data.get('prompts', tuple()),
-            )
-        return infiller_results
+        infiller_args = get_infiller_args(input_data)
+        prefetched_results = infill_prefetch_cache.get((self.state_manager.current_state.session_id, infiller_args))
+        logger.primary_info(f"Infill prefetch cache stats: {infill_prefetch_cache.stats()}")
+        if prefetched_results is not None:
+            logger.primary_info(f"Using the infills prefetched after the last turn.")
+            return prefetched_results
+        return get_infiller_fn()(*infiller_args)
 
     def _select_best_response(self, utterance, responses, contexts, prompts, acknowledgements=None) -> Tuple[str, str]:
         """
@@ -370,12 +366,81 @@ class WikiResponseGenerator(ResponseGenerator):
 
         return top_res, top_ack
 
-    def get_wiki_sentences(self, cur_entity):
+    def get_wiki_sentences(self, cur_entity, first_turn=None, user_utterance=None, bot_utterance=None):
+        """
+        Returns the sentences of the sections of cur_entity's article that are most relevant to this turn. Pass
+        first_turn, user_utterance and bot_utterance to get them for a different turn (see prefetch).
+        """
         sections = wiki_utils.get_text_for_entity(cur_entity.name)
         sentences = wiki_utils.get_sentences_from_sections_tfidf(sections, self.state_manager,
-                                                                 first_turn=self.active_last_turn())
+                                                                 first_turn=self.active_last_turn() if first_turn is None else first_turn,
+                                                                 user_utterance=user_utterance, bot_utterance=bot_utterance)
         return sentences
 
+    def get_infiller_input_data(self, state, cur_entity, sentences):
+        """
+        Returns the infiller input for a statement about cur_entity, with the templates of its entity group that state
+        hasn't used yet, or None if there are no templates for cur_entity.
+        """
+        ## Step 2a: Get the relevant templates for the entity
+        # Retrieve questions, text.
+        specific_responses, best_ent_group = get_templates(cur_entity)
+        if specific_responses is None:
+            return None
+        # specific_responses example:
+        # [["In my opinion, the best place for [clothing] is [store].", ["clothing", "fashion", "retailer", "dress", "suits"]]]
+        ## Step 2b:
+        # We replace pronouns on second one onwards.
+        # Note that this is irrelevant for the prompt case, since we reconstruct the prompts later anyway.
+        pronouns = get_pronoun(best_ent_group, sentences)
+        prompt_to_pronoun_prompt = {prompt: replace_entity_placeholder(prompt, pronouns, cur_entity.talkable_name, omit_first=True)
+                                    for (prompt, _) in specific_responses}
+        specific_responses = [(prompt_to_pronoun_prompt[a], b) for (a, b) in specific_responses]
+        # logger.primary_info(f"After replacement: {specific_questions} {type(specific_questions[0])}")
+        specific_responses = [q for q in specific_responses if q[0] not in state.entity_state[cur_entity.name].templates_used]
+
+        return {
+            'tuples': tuple((q[0], tuple(q[1])) for q in specific_responses),
+            'sentences': tuple(s.strip().strip('.') for s in sentences), # TODO tuple(s.strip().strip('.') for s in sentences),
+            'max_length': 40
+        }
+
+    def prefetch(self):
+        """
+        If WIKI is in control after this turn, computes the infills that get_infilling_statement (via FactoidTreelet)
+        would ask for next turn if the user says yes, and puts them in infill_prefetch_cache for this session.
+        The next turn uses them only if its infiller input turns out to be exactly the predicted one.
+        """
+        current_state = self.state_manager.current_state
+        if current_state.active_rg != self.name:
+            return
+        state = current_state.response_generator_states.get(self.name)
+        cur_entity = state.cur_entity if state is not None else None
+        if cur_entity is None:
+            return
+        if not cur_entity.is_hydrated:
+            # Its templates depend on its LAZY_FIELDS, and we don't want to fetch them in the background (see WikiEntityHandler)
+            logger.info(f'Not prefetching infills for {cur_entity.name}, which was restored without its fields')
+            return
+
+        # Next turn, WIKI will have been active last turn, and the bot's last utterance will be this turn's response
+        sentences = self.get_wiki_sentences(cur_entity, first_turn=True, user_utterance=PREFETCH_USER_UTTERANCE,
+                                            bot_utterance=current_state.response)
+        if len(sentences) < 4:
+            return
+        input_data = self.get_infiller_input_data(state, cur_entity, sentences)
+        if input_data is None:
+            return
+        infiller_args = get_infiller_args(input_data)
+        key = (current_state.session_id, infiller_args)
+        if key in infill_prefetch_cache:
+            return
+        # Call the infiller without its lru_cache, so that speculative results don't evict the ones that were used
+        infiller_results = get_infiller_fn().__wrapped__(*infiller_args)
+        if infiller_results and not infiller_results.get('error'):
+            infill_prefetch_cache.put(key, infiller_results)
+            logger.primary_info(f"Prefetched {len(infiller_results['completions'])} infills about {cur_entity.name} for the next turn")
+
     def _get_infilling_ack_components(self, top_da):
         """
 
@@ -442,8 +507,8 @@ class WikiResponseGenerator(ResponseGenerator):
 
         with futures.ThreadPoolExecutor(max_workers=2, initializer=initializer, initargs=(should_kill,)) as executor:
             if execute_neural:
-                neural_future = executor.submit(execute_neural)
-            infiller_future = executor.submit(self._execute_infiller, input_data)
+                neural_future = executor.submit(contextvars.copy_context().run, execute_neural)
+            infiller_future = executor.submit(contextvars.copy_context().run, self._execute_infiller, input_data)
 
         if execute_neural:
             acknowledgements = neural_future.result()
@@ -497,28 +562,10 @@ class WikiResponseGenerator(ResponseGenerator):
             logger.primary_info("Infiller does not have enough sentences to work with")
             return None, None
 
-        ## Step 2a: Get the relevant templates for the entity
-        # Retrieve questions, text.
-        specific_responses, best_ent_group = get_templates(cur_entity)
-        if specific_responses is None:
+        ## Step 2: Get the infiller input, with the relevant templates for the entity
+        input_data = self.get_infiller_input_data(state, cur_entity, sentences)
+        if input_data is None:
             return None, None
-        # specific_responses example:
-        # [["In my opinion, the best place for [clothing] is [store].", ["clothing", "fashion", "retailer", "dress", "suits"]]]
-        ## Step 2b:
-        # We replace pronouns on second one onwards.
-        # Note that this is irrelevant for the prompt case, since we reconstruct the prompts later anyway.
-        pronouns = get_pronoun(best_ent_group, sentences)
-        prompt_to_pronoun_prompt = {prompt: replace_entity_placeholder(prompt, pronouns, cur_entity.talkable_name, omit_first=True)
-                                    for (prompt, _) in specific_responses}
-        specific_responses = [(prompt_to_pronoun_prompt[a], b) for (a, b) in specific_responses]
-        # logger.primary_info(f"After replacement: {specific_questions} {type(specific_questions[0])}")
-        specific_responses = [q for q in specific_responses if q[0] not in state.entity_state[cur_entity.name].templates_used]
-
-        input_data = {
-            'tuples': tuple((q[0], tuple(q[1])) for q in specific_responses),
-            'sentences': tuple(s.strip().strip('.') for s in sentences), # TODO tuple(s.strip().strip('.') for s in sentences),
-            'max_length': 40
-        }
 
         execute_neural = None
         acknowledgements = None
@@ -550,8 +597,8 @@ class WikiResponseGenerator(ResponseGenerator):
 
         with futures.ThreadPoolExecutor(max_workers=2, initializer=initializer, initargs=(should_kill,)) as executor:
             if execute_neural:
-                neural_future = executor.submit(execute_neural)
-            infiller_future = executor.submit(self._execute_infiller, input_data)
+                neural_future = executor.submit(contextvars.copy_context().run, execute_neural)
+            infiller_future = executor.submit(contextvars.copy_context().run, self._execute_infiller, input_data)
         ### END THREADING ###
 
         if execute_neural:
@@ -425,7 +425,13 @@ def get_sentences(sections, state_manager):
 
 GOOD_SECTIONS = ['culture', 'cuisine']
 
-def get_sentences_from_sections_tfidf(sections, state_manager, strategy="all", num_sections=3, first_turn=False):
+def get_sentences_from_sections_tfidf(sections, state_manager, strategy="all", num_sections=3, first_turn=False,
+                                      user_utterance: Optional[str] = None, bot_utterance: Optional[str] = None):
+    """
+    Selects up to num_sections sections and returns their sentences. Sections are ranked by their TF-IDF similarity
+    to the user utterance (and the bot's last utterance, if the user's is short). By default these are the utterances
+    of the current turn; pass user_utterance and bot_utterance to rank for a different turn (e.g. a predicted one).
+    """
     sections = [(title, text) for (title, text) in sections if len(text) > 500]
     sections = dict(sections)
     selected_titles = set()
@@ -443,10 +449,10 @@ def get_sentences_from_sections_tfidf(sections, state_manager, strategy="all", n
     # logger.primary_info(f"Selected titles: {selected_titles}")
     # If we need more sections, use TF-IDF
     if len(selected_titles) < num_sections:
-        utterance = state_manager.current_state.text
+        utterance = state_manager.current_state.text if user_utterance is None else user_utterance
         logger.primary_info(f"Pulling more text, {utterance}")
         if len(utterance.split(' ')) < 6:
-            utterance += ' ' + state_manager.current_state.history[-1]
+            utterance += ' ' + (state_manager.current_state.history[-1] if bot_utterance is None else bot_utterance)
             logger.primary_info(f"Short user utterance, expanding utterance to: {utterance}")
         remaining_titles = list(set(sections.keys()) - selected_titles)
         logger.primary_info(f"Remaining titles are: {remaining_titles}")
@@ -6,6 +6,12 @@ import uuid
 
 #from agent.agents.remote_non_persistent import RemoteNonPersistentAgent as Agent
 from agents.remote_psql_persistent import RemotePersistentAgent as Agent
+import chirpy.core.flags as flags
+
+# This server handles many sessions concurrently, so merge their concurrent calls to batchable remote modules
+# (e.g. dialogact) that arrive within this many seconds of each other
+flags.request_batching_window = 0.01
+
 app = Flask(__name__)
 from flask_cors import CORS
 CORS(app, origins='*')
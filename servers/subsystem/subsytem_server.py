@@ -51,6 +51,18 @@ def init_logger():
                                      logtoscreen_allow_multiline=True, integ_test=False, remove_root_handlers=False)
     setup_logger(logger_settings)
 
+# create handler (pass in RGs + annotators) once; it keeps no per-request state so all requests share it
+handler = Handler(
+    response_generator_classes = [LaunchResponseGenerator, ComplaintResponseGenerator, ClosingConfirmationResponseGenerator,
+                                  OneTurnHackResponseGenerator, FallbackResponseGenerator, WikiResponseGenerator,
+                                  OffensiveUserResponseGenerator, OpinionResponseGenerator2, AcknowledgmentResponseGenerator,
+                                  NeuralChatResponseGenerator, CategoriesResponseGenerator, ClosingConfirmationResponseGenerator,
+                                  MusicResponseGenerator],
+        annotator_classes = [QuestionAnnotator, DialogActAnnotator, NavigationalIntentModule, StanfordnlpModule, CorenlpModule,
+                            EntityLinkerModule, NeuralGraphemeToPhoneme],
+        annotator_timeout = NLP_PIPELINE_TIMEOUT
+)
+
 """
 Initialize chirpy state from request
 """
@@ -113,18 +125,6 @@ json dict with the fields
 @app.route('/process_utterance', methods=['POST'])
 def process_utterance():
 
-    # create handler (pass in RGs + annotators)
-    handler = Handler(
-        response_generator_classes = [LaunchResponseGenerator, ComplaintResponseGenerator, ClosingConfirmationResponseGenerator,
-                                      OneTurnHackResponseGenerator, FallbackResponseGenerator, WikiResponseGenerator,
-                                      OffensiveUserResponseGenerator, OpinionResponseGenerator2, AcknowledgmentResponseGenerator,
-                                      NeuralChatResponseGenerator, CategoriesResponseGenerator, ClosingConfirmationResponseGenerator,
-                                      MusicResponseGenerator],
-            annotator_classes = [QuestionAnnotator, DialogActAnnotator, NavigationalIntentModule, StanfordnlpModule, CorenlpModule,
-                                EntityLinkerModule, NeuralGraphemeToPhoneme],
-            annotator_timeout = NLP_PIPELINE_TIMEOUT
-    )
-
     # get current_state and last_state from request
     state_attributes = init_current_state(request)
     user_attributes = init_user_attributes(request)
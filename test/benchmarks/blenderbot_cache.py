@@ -0,0 +1,121 @@
+"""
+Counts the remote BlenderBot calls over a seeded replay of turns, where the contexts (the last few utterances) follow
+a long-tailed distribution, like real conversations, which mostly start with the same greetings:
+
+- per call: the previous cache, keyed by str(input_data), with the decoding config's min_length drawn at random on
+  every call, so the same context rarely hit the cache;
+- ResponseCache: canonical keys, and a min_length seeded by the context (see get_decode_config);
+- second process: a fresh in-memory cache in front of the same SqliteResponseStore, as another worker process (or a
+  restarted one) would have.
+
+The turns run on a thread pool, like the annotators and RGs do. The remote module is a stub that returns a canned
+response, so no BlenderBot container is needed.
+
+Run:
+    python -m test.benchmarks.blenderbot_cache --turns 5000
+"""
+
+import argparse
+import logging
+import os
+import random
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from chirpy.annotators import blenderbot
+from chirpy.core.logging_utils import LoggerSettings, setup_logger
+from chirpy.core.response_cache import ResponseCache, SqliteResponseStore
+
+GREETING = "hi, this is an alexa prize socialbot. i'd love to get to know you a bit better. how are you doing today?"
+USER_REPLIES = ['good', 'good how are you', 'fine', 'not bad', "i'm okay", 'great', 'tired', 'pretty good thanks']
+TOPICS = ['movies', 'music', 'my dog', 'pizza', 'basketball', 'the weather', 'my job', 'video games', 'school', 'books']
+
+
+def make_contexts(num_contexts: int, rng: random.Random):
+    """Returns num_contexts distinct (history, user utterance) pairs, most common first"""
+    contexts = [(['', GREETING], reply) for reply in USER_REPLIES]
+    while len(contexts) < num_contexts:
+        contexts.append((['', GREETING, rng.choice(USER_REPLIES), 'what would you like to talk about?'],
+                         f'{rng.choice(["i like", "tell me about", "let us talk about", "i love"])} {rng.choice(TOPICS)} '
+                         f'{len(contexts)}'))
+    return contexts
+
+
+class StubBlenderBot(blenderbot.BlenderBot):
+    def __init__(self, state_manager, counter):
+        super().__init__(state_manager, url='http://localhost:0')
+        self.counter = counter
+
+    def remote_call(self, input_data):
+        with self.counter['lock']:
+            self.counter['calls'] += 1
+        return {'responses': ['that sounds great'], 'response_probabilities': [1.0]}
+
+
+def make_blenderbot(turn, counter) -> StubBlenderBot:
+    history, user_utterance = turn
+    current_state = SimpleNamespace(history=history, text=user_utterance, dialogact=None)
+    return StubBlenderBot(SimpleNamespace(current_state=current_state), counter)
+
+
+def replay(turns, run_turn, num_threads: int):
+    with ThreadPoolExecutor(num_threads) as executor:
+        list(executor.map(run_turn, turns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=5000)
+    parser.add_argument('--contexts', type=int, default=2000, help='number of distinct contexts')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_logger(LoggerSettings(logtoscreen_level=logging.ERROR, logtoscreen_usecolor=False, logtofile_level=None,
+                                logtofile_path=None, logtoscreen_allow_multiline=False, integ_test=False,
+                                remove_root_handlers=True))
+    rng = random.Random(args.seed)
+    contexts = make_contexts(args.contexts, rng)
+    weights = [1 / (rank + 1) for rank in range(len(contexts))]
+    turns = rng.choices(contexts, weights=weights, k=args.turns)
+
+    # The previous cache: an unlocked OrderedDict keyed by str(input_data), and a random min_length on every call
+    counter = {'calls': 0, 'lock': threading.Lock()}
+    old_cache, old_cache_lock = OrderedDict(), threading.Lock()  # locked here only so that the replay doesn't crash
+    call_rng = random.Random(args.seed)
+
+    def run_turn_per_call(turn):
+        bot = make_blenderbot(turn, counter)
+        config = dict(blenderbot.NEURAL_DECODE_CONFIG, min_length=call_rng.randint(1, 5) * 5)
+        cache_key = str({'history': bot.edit_history_for_remote(bot.get_history()), 'config': config})
+        with old_cache_lock:
+            if cache_key in old_cache:
+                old_cache.move_to_end(cache_key)
+                return
+        with counter['lock']:
+            counter['calls'] += 1
+        with old_cache_lock:
+            old_cache[cache_key] = {}
+            if len(old_cache) > blenderbot.MAX_CACHE_SIZE:
+                old_cache.popitem(last=False)
+
+    replay(turns, run_turn_per_call, args.threads)
+    print(f'{"per call":>15}: {counter["calls"]} remote calls for {args.turns} turns')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = SqliteResponseStore(os.path.join(tmp_dir, 'blenderbot.sqlite'), 'blenderbot', ttl=blenderbot.CACHE_TTL)
+        for name in ['ResponseCache', 'second process']:
+            blenderbot.CACHE = ResponseCache('blenderbot', blenderbot.MAX_CACHE_SIZE, blenderbot.CACHE_TTL, store=store)
+            counter['calls'] = 0
+
+            replay(turns, lambda turn: make_blenderbot(turn, counter).execute(), args.threads)
+            stats = blenderbot.CACHE.stats()
+            print(f'{name:>15}: {counter["calls"]} remote calls for {args.turns} turns '
+                  f'(memory hit rate {stats["hit_rate"]:.2f}, {stats["store_hits"]} store hits)')
+
+
+if __name__ == '__main__':
+    main()
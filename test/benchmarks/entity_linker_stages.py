@@ -0,0 +1,151 @@
+"""
+Measures the latency of neural_link_spans, whose fetches (the ASR-aware anchortext search, the neural entity linker
+and the WikiEntity lookups) run as a dependency graph under one deadline (see run_stage_graph), against running the
+same fetches one after another, as neural_link_spans used to.
+
+The fetches are replaced by local stand-ins that sleep for a seeded lognormal latency, so neither ES nor the neural
+entity linker container is needed. The stand-in neural entity linker only returns entities that the anchortext and
+ASR candidate lookups also return, which is the best case for the stage graph. With --slow_asr, the ASR branch takes
+longer than the deadline, and we check that neural_link_spans still returns the LinkedSpans of the other branch.
+
+The anchortext candidates only come from the anchortext cache, so the stage graph runs once with it empty and once with
+every span in it. For each, we report the candidate hit rate from the turns' traces: the fraction of the WikiEntity
+lookups (entity_linker.entities and entity_linker.asr_entities) that found all their entities among the candidates,
+so didn't need an entity_linker.fetch_missing_entities lookup.
+
+Run:
+    python -m test.benchmarks.entity_linker_stages --repeats 50
+    python -m test.benchmarks.entity_linker_stages --slow_asr
+"""
+
+import argparse
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+
+from chirpy.core.entity_linker import entity_linker
+from chirpy.core.entity_linker.entity_linker_classes import WikiEntity
+from chirpy.core.latency import trace_turn
+from chirpy.core.logging_utils import LoggerSettings, setup_logger
+from test.benchmarks.stubs import lognormal_latency, percentile
+
+USER_UTTERANCE = 'i recently watched their eyes of skywalker and it was really good'
+SPANS = {'their eyes of skywalker', 'eyes of skywalker', 'skywalker', 'watched'}
+ASR_ENTITY_INFO = {'their eyes of skywalker': {'the rise of skywalker': {'similarity': 0.9,
+                                                                        'entnames': ['Star Wars: The Rise of Skywalker']}}}
+ASR_SPAN2ENTITY_NAME = {'the rise of skywalker': 'Star Wars: The Rise of Skywalker'}
+
+
+class Latencies:
+    """Seeded latency for each kind of fetch, shared by the threads that make the fetches"""
+
+    def __init__(self, seed: int, asr_median: float, neural_el_median: float, es_median: float):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.latency_fns = {'asr': lognormal_latency(asr_median, 0.3), 'neural_el': lognormal_latency(neural_el_median, 0.3),
+                            'es': lognormal_latency(es_median, 0.3)}
+
+    def sleep(self, kind: str):
+        with self.lock:
+            latency = self.latency_fns[kind](self.rng)
+        time.sleep(latency)
+
+
+class StubNeuralEntityLinker:
+    def __init__(self, latencies: Latencies):
+        self.latencies = latencies
+
+    def execute(self, context, spans):
+        self.latencies.sleep('neural_el')
+        return {'result': [[ASR_SPAN2ENTITY_NAME.get(span, f'Entity for {span}'), 0.8, span]
+                           for span_set in spans for span in span_set if 'skywalker' in span]}
+
+
+def make_stubs(latencies: Latencies, cached_spans: set):
+    def get_asr_aware_span2entsim(spans, g2p_module):
+        latencies.sleep('asr')
+        return ASR_ENTITY_INFO
+
+    def get_entities_by_wiki_name(names):
+        latencies.sleep('es')
+        return {name: make_entity(name) for name in names}
+
+    def get_cached_entities_by_anchortext(spans):
+        return {make_entity(f'Entity for {span}') for span in spans if 'skywalker' in span and span in cached_spans}
+
+    return get_asr_aware_span2entsim, get_entities_by_wiki_name, get_cached_entities_by_anchortext
+
+
+def make_entity(name: str) -> WikiEntity:
+    return WikiEntity(name, abs(hash(name)), 1000, 0.0, [], {'skywalker': 10}, [], name)
+
+
+def link_sequentially(user_utterance, spans, get_asr_aware_span2entsim, get_entities_by_wiki_name, neural_entity_linker):
+    """The fetches neural_link_spans makes, one after another"""
+    asr_entity_info = get_asr_aware_span2entsim(spans, None)
+    user_utterance_to_span_set = defaultdict(set)
+    for span in spans:
+        user_utterance_to_span_set['. ' + user_utterance].add(span)
+        for asr_span in asr_entity_info.get(span, {}):
+            user_utterance_to_span_set['. ' + user_utterance.replace(span, asr_span)].add(asr_span)
+    output = neural_entity_linker.execute(context=user_utterance_to_span_set.keys(), spans=user_utterance_to_span_set.values())
+    return get_entities_by_wiki_name([entity_name for entity_name, _, _ in output['result']])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--asr_latency', type=float, default=0.08, help='median latency of the ASR-aware search (s)')
+    parser.add_argument('--neural_el_latency', type=float, default=0.1, help='median latency of the neural entity linker (s)')
+    parser.add_argument('--es_latency', type=float, default=0.03, help='median latency of a WikiEntity lookup (s)')
+    parser.add_argument('--slow_asr', action='store_true', help='make the ASR-aware search miss the deadline')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_logger(LoggerSettings(logtoscreen_level=logging.ERROR, logtoscreen_usecolor=False, logtofile_level=None,
+                                logtofile_path=None, logtoscreen_allow_multiline=False, integ_test=False,
+                                remove_root_handlers=True))
+    timeout = entity_linker.NEURAL_LINK_SPANS_TIMEOUT
+    asr_latency = 2 * timeout if args.slow_asr else args.asr_latency
+    latencies = Latencies(args.seed, asr_latency, args.neural_el_latency, args.es_latency)
+    cached_spans = set()
+    get_asr_aware_span2entsim, get_entities_by_wiki_name, get_cached_entities_by_anchortext = make_stubs(latencies, cached_spans)
+    entity_linker.get_asr_aware_span2entsim = get_asr_aware_span2entsim
+    entity_linker.get_entities_by_wiki_name = get_entities_by_wiki_name
+    entity_linker.get_cached_entities_by_anchortext = get_cached_entities_by_anchortext
+    neural_entity_linker = StubNeuralEntityLinker(latencies)
+
+    repeats = 1 if args.slow_asr else args.repeats
+    if not args.slow_asr:
+        times = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            link_sequentially(USER_UTTERANCE, SPANS, get_asr_aware_span2entsim, get_entities_by_wiki_name, neural_entity_linker)
+            times.append(time.perf_counter() - t0)
+        print(f"{'sequential':>24}: mean={sum(times) / len(times) * 1000:.1f}ms p50={percentile(times, 50) * 1000:.1f}ms "
+              f"p95={percentile(times, 95) * 1000:.1f}ms")
+
+    for warm_cache in [False, True]:
+        cached_spans.clear()
+        if warm_cache:
+            cached_spans.update(SPANS)
+        times = []
+        lookups, misses = 0, 0
+        for _ in range(repeats):
+            with trace_turn() as trace:
+                t0 = time.perf_counter()
+                linked_spans = entity_linker.neural_link_spans(USER_UTTERANCE, '', True, SPANS, {}, [], {}, None,
+                                                               neural_entity_linker)
+                times.append(time.perf_counter() - t0)
+            event_names = [event.function_name for event in trace.events]
+            lookups += sum(name in ('entity_linker.entities', 'entity_linker.asr_entities') for name in event_names)
+            misses += event_names.count('entity_linker.fetch_missing_entities')
+        name = 'stage graph (warm cache)' if warm_cache else 'stage graph (cold cache)'
+        print(f"{name:>24}: mean={sum(times) / len(times) * 1000:.1f}ms p50={percentile(times, 50) * 1000:.1f}ms "
+              f"p95={percentile(times, 95) * 1000:.1f}ms, candidate hit rate {1 - misses / max(lookups, 1):.2f}")
+        print(f'Linked spans (last run): {sorted(linked_span.span for linked_span in linked_spans)}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Compares the size and (de)serialization time of the entity tracker and entity linker states of a long conversation,
+with WikiEntities encoded in full against the compact (doc_id, name, confidence) encoding of
+flags.compact_entity_serialization (see WikiEntityHandler).
+
+The conversation is synthetic: each turn the user mentions a few seeded random entities (with realistically sized
+anchortext_counts, categories and redirects), one of which becomes the cur_entity. We also time the first use of a
+restored entity, which for the compact encoding fetches the fields of all the restored entities in one lookup: from the
+WikiEntity caches (warm), as for entities that came up earlier in the conversation on the same process, and from a
+stand-in for ES that sleeps for --es_latency (cold), as after a restart or on another process.
+
+Run:
+    python -m test.benchmarks.entity_state_size --turns 60
+"""
+
+import argparse
+import copy
+import logging
+import random
+import time
+
+import jsonpickle
+
+from chirpy.core import flags
+from chirpy.core.logging_utils import LoggerSettings, setup_logger
+from chirpy.core.entity_linker import wiki_data_fetching
+from chirpy.core.entity_linker.entity_linker_classes import EntityLinkerResult, LinkedSpan, WikiEntity
+from chirpy.core.entity_tracker.entity_tracker import EntityTrackerState
+import chirpy.core.state  # sets the jsonpickle encoder options
+
+
+def make_entity(rng: random.Random, i: int) -> WikiEntity:
+    name = f'Entity {i}'
+    anchortext_counts = {f'anchor {i} {j}': rng.randint(1, 5000) for j in range(rng.randint(20, 200))}
+    wikidata_categories = [f'category {rng.randrange(1000)}' for _ in range(rng.randint(3, 15))]
+    redirects = [f'Redirect {i} {j}' for j in range(rng.randint(0, 40))]
+    return WikiEntity(name, i, rng.randint(100, 10**6), rng.random(), wikidata_categories, anchortext_counts,
+                      redirects, name)
+
+
+def make_states(num_turns: int, num_entities: int, seed: int):
+    """Returns the entities, and the EntityTrackerState and the EntityLinkerResults of a num_turns long conversation"""
+    rng = random.Random(seed)
+    entities = [make_entity(rng, i) for i in range(num_entities)]
+    wiki_data_fetching.entity_cache.put_many({ent.name: ent for ent in entities})
+    entity_tracker = EntityTrackerState()
+    entity_linker_results = []
+    for _ in range(num_turns):
+        entity_tracker.init_for_new_turn()
+        linked_spans = [LinkedSpan(f'span {rng.randrange(10**6)}', rng.sample(entities, rng.randint(1, 5)))
+                        for _ in range(rng.randint(1, 3))]
+        entity_linker_results.append(EntityLinkerResult(high_prec=linked_spans))
+        if entity_tracker.cur_entity is not None and rng.random() < 0.3:
+            entity_tracker.talked_finished.append(entity_tracker.cur_entity)
+        entity_tracker.cur_entity = linked_spans[0].top_ent
+        entity_tracker.history[-1] = {'user': entity_tracker.cur_entity, 'response': entity_tracker.cur_entity}
+    return entities, entity_tracker, entity_linker_results
+
+
+def make_cold_lookup(entities, es_latency: float):
+    """Returns a stand-in for get_entities_by_wiki_name that misses the caches, so sleeps for es_latency"""
+    name2ent = {ent.name: ent for ent in entities}
+
+    def get_entities_by_wiki_name(wiki_names):
+        time.sleep(es_latency)
+        return {name: copy.copy(name2ent[name]) for name in wiki_names if name in name2ent}
+    return get_entities_by_wiki_name
+
+
+def measure(entity_tracker, entity_linker_results, compact: bool, repeats: int, cold_lookup):
+    """Returns the encoded size of each turn's state, and the mean encode, decode and first use (warm and cold) times"""
+    flags.compact_entity_serialization = compact
+    encode_times, decode_times, first_use_times, cold_first_use_times = [], [], [], []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        encoded = jsonpickle.encode(entity_tracker)
+        encoded_linker = jsonpickle.encode(entity_linker_results[-1])
+        encode_times.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        decoded = jsonpickle.decode(encoded)
+        jsonpickle.decode(encoded_linker)
+        decode_times.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        decoded.cur_entity.anchortext_counts
+        first_use_times.append(time.perf_counter() - t0)
+
+        decoded = jsonpickle.decode(encoded)
+        warm_lookup, wiki_data_fetching.get_entities_by_wiki_name = wiki_data_fetching.get_entities_by_wiki_name, cold_lookup
+        try:
+            t0 = time.perf_counter()
+            decoded.cur_entity.anchortext_counts
+            cold_first_use_times.append(time.perf_counter() - t0)
+        finally:
+            wiki_data_fetching.get_entities_by_wiki_name = warm_lookup
+    return len(encoded) + len(encoded_linker), [sum(times) / len(times) for times in
+                                                (encode_times, decode_times, first_use_times, cold_first_use_times)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=60)
+    parser.add_argument('--entities', type=int, default=200, help='number of distinct entities in the conversation')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--es_latency', type=float, default=0.03, help='latency of a WikiEntity lookup that misses the caches (s)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_logger(LoggerSettings(logtoscreen_level=logging.ERROR, logtoscreen_usecolor=False, logtofile_level=None,
+                                logtofile_path=None, logtoscreen_allow_multiline=False, integ_test=False,
+                                remove_root_handlers=True))
+    entities, entity_tracker, entity_linker_results = make_states(args.turns, args.entities, args.seed)
+    cold_lookup = make_cold_lookup(entities, args.es_latency)
+    for compact in [False, True]:
+        size, (encode_time, decode_time, first_use_time, cold_first_use_time) = measure(
+            entity_tracker, entity_linker_results, compact, args.repeats, cold_lookup)
+        print(f"{'compact' if compact else 'full':>7}: entity tracker + linker state size={size} "
+              f"encode={encode_time * 1000:.2f}ms decode={decode_time * 1000:.2f}ms "
+              f"first entity use={first_use_time * 1000:.2f}ms (warm) {cold_first_use_time * 1000:.2f}ms (cold)")
+
+
+if __name__ == '__main__':
+    main()
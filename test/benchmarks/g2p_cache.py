@@ -0,0 +1,107 @@
+"""
+Measures what the shared pronunciation caches in chirpy.core.asr.g2p save:
+
+- cold start: the time and memory (max RSS) of a fresh process loading the cmudict, by unpickling cmudict.pkl against
+  opening the memory-mapped PronunciationTable;
+- remote g2p calls: the number of calls to the g2p module over a replay of seeded random spans with out-of-vocabulary
+  words, where every turn makes a new g2p_module instance (like the entity linker does). We count the calls with the
+  previous per-instance lru_cache, with the span-keyed in-memory cache, and in a second process, which starts with an
+  empty in-memory cache but shares the persistent cache.
+
+The g2p module is a stub that returns a fixed pronunciation, so no remote module is needed.
+
+Run:
+    python -m test.benchmarks.g2p_cache
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from functools import lru_cache
+
+LOAD_SCRIPT = """
+import resource, sys, time
+t0 = time.perf_counter()
+if sys.argv[1] == 'pickle':
+    from chirpy.core.asr.pronunciation_table import load_cmudict
+    cmudict = load_cmudict()
+else:
+    from chirpy.core.asr.pronunciation_table import load_pronunciation_table
+    cmudict = load_pronunciation_table()
+cmudict.get('hello')
+print(time.perf_counter() - t0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+BASELINE_SCRIPT = "import resource; import chirpy.core.asr.pronunciation_table; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+
+
+class CountingG2p:
+    """Stands in for NeuralGraphemeToPhoneme, counting the calls to the remote module"""
+    num_calls = 0
+
+    def execute(self, span):
+        CountingG2p.num_calls += 1
+        return ['?' if char == ' ' else char.upper() for char in span]
+
+
+def make_turns(num_turns: int, seed: int):
+    """Each turn is a few spans, some with made up (out-of-vocabulary) words, which recur across turns"""
+    rng = random.Random(seed)
+    oov_words = [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(5, 9))) for _ in range(100)]
+    common_words = ['the', 'i', 'like', 'watching', 'my', 'favorite', 'is', 'show', 'band', 'game']
+    return [[' '.join(rng.choices(common_words, k=2) + [rng.choice(oov_words)]) for _ in range(3)]
+            for _ in range(num_turns)]
+
+
+def count_calls(turns, g2p_fn) -> int:
+    CountingG2p.num_calls = 0
+    for spans in turns:
+        g2p_module = CountingG2p()  # a new instance every turn
+        for span in spans:
+            for word in span.split():
+                g2p_fn(word, g2p_module)
+    return CountingG2p.num_calls
+
+
+def run_in_subprocess(script: str, *args, env=None) -> str:
+    return subprocess.run([sys.executable, '-c', script, *args], check=True, capture_output=True, text=True,
+                          env=env).stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    baseline_rss = int(run_in_subprocess(BASELINE_SCRIPT))
+    run_in_subprocess(LOAD_SCRIPT, 'table')  # make sure the table is built
+    for how in ['pickle', 'table']:
+        load_time, rss = run_in_subprocess(LOAD_SCRIPT, how).split()
+        print(f'load cmudict from {how:>6}: {float(load_time) * 1000:.1f}ms, '
+              f'+{(int(rss) - baseline_rss) / 1024:.1f}MB max RSS over the imports alone')
+
+    turns = make_turns(args.turns, args.seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ['G2P_CACHE_PATH'] = os.path.join(tmp_dir, 'g2p_cache.sqlite')
+        from chirpy.core.asr import g2p
+
+        # g2p before the span-keyed cache: lru_cache keyed by (span, g2p_module)
+        @lru_cache(maxsize=32768)
+        def legacy_g2p(span, g2p_module=None):
+            simple_phonemes = g2p.simple_g2p(span)
+            if '?' not in simple_phonemes:
+                return simple_phonemes
+            return g2p_module.execute(span)
+
+        print(f'remote g2p calls over {len(turns)} turns: per-instance lru_cache={count_calls(turns, legacy_g2p)} '
+              f'span-keyed cache={count_calls(turns, g2p.g2p)}', end='')
+        g2p.g2p_cache.clear()
+        print(f' new process with the persistent cache={count_calls(turns, g2p.g2p)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Compares the per-call cost of contains_offensive (one PhraseMatcher pass per text variant) against the previous
+implementation (contains_phrase over every ngram of every variant, and an `in` / replace for every whitelisted
+phrase), and checks that both give the same label on every text.
+
+The texts are seeded random mixes of everyday words, blacklisted phrases, whitelisted phrases and punctuation.
+
+Run:
+    python -m test.benchmarks.offensive_classifier --num-texts 5000
+"""
+
+import argparse
+import logging
+import random
+import string
+import time
+
+from chirpy.core.logging_utils import LoggerSettings, setup_logger
+from chirpy.core.offensive_classifier.offensive_classifier import OFFENSIVE_CLASSIFIER, SPECIAL_CHARS, \
+    WHITELIST_PHRASES, contains_offensive
+from chirpy.core.util import contains_phrase
+from test.benchmarks.stubs import percentile
+
+COMMON_WORDS = ('i really like to watch movies with my friends on the weekend and we usually eat some pizza '
+                'what do you think about the new season of that show it was kind of boring but the ending '
+                'was great my dog loves going to the park he is a golden retriever named max').split()
+
+
+def legacy_contains_offensive(text: str, classifier=OFFENSIVE_CLASSIFIER) -> bool:
+    """OffensiveClassifier.contains_offensive before it used a PhraseMatcher (minus logging)"""
+    blacklist, max_len = classifier.blacklist, classifier.blacklist_max_len
+    text = text.lower().strip()
+    for whitelisted_phrase in WHITELIST_PHRASES:
+        if whitelisted_phrase in text:
+            text = text.replace(whitelisted_phrase, '').strip()
+    texts = set()
+    texts.add(text.translate({ord(p): '' for p in SPECIAL_CHARS}))
+    texts.add(' '.join(text.translate({ord(p): ' ' for p in string.punctuation}).split()))
+    texts.add(text)
+    for variant in texts:
+        if contains_phrase(variant, blacklist, '', lowercase_text=False, lowercase_phrases=False,
+                           remove_punc_text=False, remove_punc_phrases=False, max_phrase_len=max_len):
+            return True
+    # The previous implementation checked whichever variant happened to be last in the set here; we always use text
+    return contains_phrase(text.translate({ord(p): '' for p in string.punctuation}), blacklist - {'hell'}, '',
+                           lowercase_text=False, lowercase_phrases=False, remove_punc_text=False,
+                           remove_punc_phrases=False, max_phrase_len=max_len)
+
+
+def make_texts(num_texts: int, seed: int):
+    rng = random.Random(seed)
+    blacklist = sorted(OFFENSIVE_CLASSIFIER.blacklist)
+    whitelist = sorted(WHITELIST_PHRASES)
+    texts = []
+    for _ in range(num_texts):
+        words = rng.choices(COMMON_WORDS, k=rng.randint(3, 40))
+        if rng.random() < 0.2:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(blacklist))
+        if rng.random() < 0.2:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(whitelist))
+        text = ' '.join(words)
+        if rng.random() < 0.5:
+            text += rng.choice(['.', '!', '?', "'s", '...'])
+        texts.append(text)
+    return texts
+
+
+def time_per_call(fn, texts, repeats: int):
+    latencies = []
+    for _ in range(repeats):
+        for text in texts:
+            t0 = time.perf_counter()
+            fn(text)
+            latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--num-texts', type=int, default=5000)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_logger(LoggerSettings(logtoscreen_level=logging.ERROR, logtoscreen_usecolor=False, logtofile_level=None,
+                                logtofile_path=None, logtoscreen_allow_multiline=False, integ_test=False,
+                                remove_root_handlers=True))
+
+    texts = make_texts(args.num_texts, args.seed)
+    mismatches = [text for text in texts if contains_offensive(text, '') != legacy_contains_offensive(text)]
+    num_offensive = sum(contains_offensive(text, '') for text in texts)
+    print(f'{len(texts)} texts, {num_offensive} offensive, {len(mismatches)} labels differ from the previous implementation')
+    for text in mismatches[:10]:
+        print(f'    {text!r}: now {contains_offensive(text, "")}')
+
+    for name, fn in [('previous', legacy_contains_offensive), ('PhraseMatcher', lambda text: contains_offensive(text, ''))]:
+        latencies = time_per_call(fn, texts, args.repeats)
+        print(f'{name:>13}: mean={sum(latencies) / len(latencies) * 1e6:.1f}us p50={percentile(latencies, 50) * 1e6:.1f}us '
+              f'p99={percentile(latencies, 99) * 1e6:.1f}us')
+
+
+if __name__ == '__main__':
+    main()
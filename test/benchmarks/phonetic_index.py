@@ -0,0 +1,131 @@
+"""
+Compares retrieving anchortexts for ASR-aware entity linking from a local PhoneticIndex (see
+chirpy.core.asr.phonetic_index) against the ES path, on a fixed set of (misrecognized) spans. For each span we report
+the latency of each, the recall of the anchortexts ES retrieves, and the recall of the anchortexts that end up in
+span2entsim (i.e. that match the span closely enough, see match_anchortexts_to_spans), which is what matters for
+entity linking.
+
+With --es, the reference is the PHONE_TO_ENT_INDEX in ES (set ES_HOST etc), and --index-dir must be a PhoneticIndex
+built from the same span dumps. Without it, a PhoneticIndex is built from seeded random phrases of CMUdict words, and
+the reference is an exhaustive scan of all the documents, which checks that the index's filtering loses nothing.
+
+Run:
+    python -m test.benchmarks.phonetic_index
+    python -m test.benchmarks.phonetic_index --es --index-dir /path/to/index_dir
+"""
+
+import argparse
+import logging
+import random
+import tempfile
+import time
+
+from metaphone import doublemetaphone
+from editdistance import eval as editdist
+
+from chirpy.core.asr.g2p import CMUDICT
+from chirpy.core.asr.index_phone_to_ent import make_item
+from chirpy.core.asr.phonetic_index import MAX_DISTANCE, MAX_EXPANSIONS, PhoneticIndex, build_index
+from chirpy.core.logging_utils import LoggerSettings, setup_logger
+from test.benchmarks.stubs import percentile
+
+TOPN = 200
+
+# Spans as they come out of ASR, some of them misrecognitions of entity names
+DEFAULT_SPANS = ['their eyes of sky walker', 'the rise of skywalker', 'mary puppets', 'mary poppins', 'four v ferrari',
+                 'lamb or gini', 'harry potter', 'hairy potter', 'the beatles', 'taylor swift', 'tailor swift',
+                 'game of thrones', 'star wars', 'black pink', 'lebron james', 'the avengers', 'minecraft',
+                 'fortnight', 'pokemon', 'billie eilish', 'ariana grande', 'spongebob', 'the office', 'frozen two',
+                 'tom hanks', 'sherlock holmes', 'grays anatomy', 'marvel', 'coco chanel', 'michael jackson']
+
+
+def make_items(num_items: int, spans, seed: int):
+    """Seeded random phrases of CMUdict words, plus the spans, as the documents of a phonetic index"""
+    rng = random.Random(seed)
+    words = sorted(word for word in CMUDICT if word.isalpha())
+    phrases = [' '.join(rng.choices(words, k=rng.randint(1, 4))) for _ in range(num_items)] + list(spans)
+    items = (make_item((phrase, [f'Entity {i}']), None) for i, phrase in enumerate(phrases))
+    return [item for item in items if item is not None]
+
+
+def exhaustive_search(items, keys, size: int):
+    """Does what PhoneticIndex.search does, by computing the distance from keys to every key of every document"""
+    key2records = {}
+    for record_index, item in enumerate(items):
+        for item_key in {key.upper() for key in item['phonemes'] if key}:
+            key2records.setdefault(item_key, []).append(record_index)
+    record2distance = {}
+    for key in set(keys):
+        expansions = sorted((editdist(key, item_key), len(item_key), item_key) for item_key in key2records)
+        for distance, _, item_key in [expansion for expansion in expansions if expansion[0] <= MAX_DISTANCE][:MAX_EXPANSIONS]:
+            for record_index in key2records[item_key]:
+                record2distance[record_index] = min(distance, record2distance.get(record_index, distance))
+    num_keys = lambda record_index: len({key for key in items[record_index]['phonemes'] if key})
+    ranked = sorted(record2distance, key=lambda record_index: (record2distance[record_index], num_keys(record_index), record_index))
+    return [items[record_index] for record_index in ranked[:size]]
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--es', action='store_true', help='compare against the ES index')
+    parser.add_argument('--index-dir', type=str, help='PhoneticIndex to use with --es')
+    parser.add_argument('--num-items', type=int, default=100000, help='number of documents in the synthetic index')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_logger(LoggerSettings(logtoscreen_level=logging.ERROR, logtoscreen_usecolor=False, logtofile_level=None,
+                                logtofile_path=None, logtoscreen_allow_multiline=False, integ_test=False,
+                                remove_root_handlers=True))
+    from chirpy.core.asr import search_phone_to_ent
+    from chirpy.core.asr.search_phone_to_ent import match_anchortexts_to_spans
+
+    if args.es:
+        index = PhoneticIndex(args.index_dir)
+        search_phone_to_ent.phonetic_index = None
+        reference_name = 'ES'
+        reference_search = lambda span: search_phone_to_ent.search_anchortexts([span], TOPN)
+    else:
+        items = make_items(args.num_items, DEFAULT_SPANS, args.seed)
+        index_dir = tempfile.mkdtemp()
+        t0 = time.perf_counter()
+        num_records, num_keys = build_index(items, index_dir)
+        print(f'built a PhoneticIndex of {num_records} anchortexts, {num_keys} keys in {time.perf_counter() - t0:.1f}s')
+        index = PhoneticIndex(index_dir)
+        reference_name = 'exhaustive'
+        reference_search = lambda span: exhaustive_search(items, [doublemetaphone(span)[0]], TOPN)
+
+    latencies = {'local': [], reference_name: []}
+    retrieved_recalls, matched_recalls = [], []
+    for span in DEFAULT_SPANS:
+        reference_sources, latency = timed(reference_search, span)
+        latencies[reference_name].append(latency)
+        local_sources, latency = timed(index.search, [doublemetaphone(span)[0]], TOPN)
+        latencies['local'].append(latency)
+
+        reference_anchortexts = {source['span'] for source in reference_sources}
+        local_anchortexts = {source['span'] for source in local_sources}
+        if reference_anchortexts:
+            retrieved_recalls.append(len(reference_anchortexts & local_anchortexts) / len(reference_anchortexts))
+        reference_matched = set(match_anchortexts_to_spans([span], reference_sources, None).get(span, {}))
+        local_matched = set(match_anchortexts_to_spans([span], local_sources, None).get(span, {}))
+        if reference_matched:
+            matched_recalls.append(len(reference_matched & local_matched) / len(reference_matched))
+        print(f'{span!r}: {reference_name} retrieved {len(reference_anchortexts)}, {len(reference_matched)} matched; '
+              f'local retrieved {len(local_anchortexts)}, {len(local_matched)} matched, '
+              f'{len(reference_matched - local_matched)} missed')
+
+    print(f'recall of {reference_name} anchortexts: retrieved={sum(retrieved_recalls) / max(len(retrieved_recalls), 1):.3f} '
+          f'matched={sum(matched_recalls) / max(len(matched_recalls), 1):.3f}')
+    for name, values in latencies.items():
+        print(f'{name:>10}: mean={sum(values) / len(values) * 1000:.2f}ms p50={percentile(values, 50) * 1000:.2f}ms '
+              f'p95={percentile(values, 95) * 1000:.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
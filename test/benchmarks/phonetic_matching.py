@@ -0,0 +1,117 @@
+"""
+Compares the cost of matching the anchortexts retrieved from the phonetic index to the user's spans (the part of
+get_asr_aware_span2entsim after the ES query) in match_anchortexts_to_spans, which scores all (span, anchortext) pairs
+in a batch, against the previous per-hit loop over get_lattice_similarity, and checks they give the same span2entsim.
+
+The spans and anchortexts are seeded random phrases of CMUdict words (so no g2p module is needed). Each anchortext is
+either a random phrase or a phonetic neighbour of one of the spans (a word swapped for one that sounds alike), so
+that some pass the similarity threshold.
+
+Run:
+    python -m test.benchmarks.phonetic_matching --num-queries 200
+"""
+
+import argparse
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+
+from chirpy.core.asr.g2p import CMUDICT
+from chirpy.core.asr.index_phone_to_ent import span_to_phoneme_string
+from chirpy.core.asr.lattice import get_lattice_similarity, remove_stress, span_to_lattice
+from chirpy.core.asr.search_phone_to_ent import SIMILARITY_RATIO_THRESHOLD, get_metaphone_lattice, \
+    match_anchortexts_to_spans
+from chirpy.core.logging_utils import LoggerSettings, setup_logger
+from test.benchmarks.stubs import percentile
+
+
+def legacy_match_anchortexts_to_spans(spans, sources, g2p_module):
+    """The loop in get_asr_aware_span2entsim before match_anchortexts_to_spans"""
+    span2entsim = defaultdict(lambda: defaultdict(dict))
+    spans_latticies = [(s, span_to_lattice(s, g2p_module), get_metaphone_lattice(s)) for s in spans]
+    for source in sources:
+        anchortext = source['span']
+        candidate_entities = json.loads(source['entities'])
+        anchortext_lattice = [[source['phonemes_stressless']]]
+        anchortext_metaphone = get_metaphone_lattice(anchortext)
+        utt_span = None
+        max_ratio = -1
+        for span, lattice, metaphone_lattice in spans_latticies:
+            ratio = get_lattice_similarity(lattice, anchortext_lattice, threshold=SIMILARITY_RATIO_THRESHOLD, ignore_stress=True)
+            metaphone_ratio = get_lattice_similarity(metaphone_lattice, anchortext_metaphone, threshold=SIMILARITY_RATIO_THRESHOLD)
+            ratio = metaphone_ratio * .25 + ratio * .75
+            if ratio > max_ratio:
+                max_ratio = ratio
+                utt_span = span
+        if max_ratio < SIMILARITY_RATIO_THRESHOLD:
+            continue
+        span2entsim[utt_span][anchortext]['similarity'] = max_ratio
+        if 'entnames' not in span2entsim[utt_span][anchortext]:
+            span2entsim[utt_span][anchortext]['entnames'] = set(candidate_entities)
+        else:
+            span2entsim[utt_span][anchortext]['entnames'].update(candidate_entities)
+    return span2entsim
+
+
+def make_queries(num_queries: int, num_hits: int, seed: int):
+    """Returns num_queries (spans, sources) pairs, where sources are like the hits of the phonetic index"""
+    rng = random.Random(seed)
+    words = sorted(word for word in CMUDICT if word.isalpha() and len(word) > 2)
+    # words grouped by their stressless pronunciation with the last phoneme removed, to find ones that sound alike
+    sound2words = defaultdict(list)
+    for word in words:
+        sound2words[remove_stress(CMUDICT[word][0]).rsplit(' ', 1)[0]].append(word)
+
+    def sounds_like(word):
+        neighbours = sound2words[remove_stress(CMUDICT[word][0]).rsplit(' ', 1)[0]]
+        return rng.choice(neighbours)
+
+    queries = []
+    for _ in range(num_queries):
+        phrase = rng.choices(words, k=rng.randint(2, 4))
+        spans = [' '.join(phrase), ' '.join(phrase[1:]), ' '.join(phrase[:2])]
+        sources = []
+        for i in range(num_hits):
+            if rng.random() < 0.3:
+                anchortext = ' '.join(sounds_like(word) for word in rng.choice(spans).split())
+            else:
+                anchortext = ' '.join(rng.choices(words, k=rng.randint(1, 4)))
+            sources.append({'span': anchortext, 'entities': json.dumps([f'Entity {i % 50}']),
+                            'phonemes_stressless': remove_stress(span_to_phoneme_string(anchortext))})
+        queries.append((spans, sources))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--num-queries', type=int, default=200)
+    parser.add_argument('--num-hits', type=int, default=200, help='number of hits per query (topn)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_logger(LoggerSettings(logtoscreen_level=logging.ERROR, logtoscreen_usecolor=False, logtofile_level=None,
+                                logtofile_path=None, logtoscreen_allow_multiline=False, integ_test=False,
+                                remove_root_handlers=True))
+    queries = make_queries(args.num_queries, args.num_hits, args.seed)
+
+    results = {}
+    for name, fn in [('previous', legacy_match_anchortexts_to_spans), ('batched', match_anchortexts_to_spans)]:
+        latencies, results[name] = [], []
+        get_metaphone_lattice.cache_clear()
+        for spans, sources in queries:
+            t0 = time.perf_counter()
+            span2entsim = fn(spans, sources, None)
+            latencies.append(time.perf_counter() - t0)
+            results[name].append(json.loads(json.dumps(span2entsim, default=sorted)))
+        print(f'{name:>8}: mean={sum(latencies) / len(latencies) * 1000:.2f}ms p50={percentile(latencies, 50) * 1000:.2f}ms '
+              f'p95={percentile(latencies, 95) * 1000:.2f}ms')
+    num_matches = sum(len(ent2sim) for span2entsim in results['batched'] for ent2sim in span2entsim.values())
+    num_differ = sum(previous != batched for previous, batched in zip(results['previous'], results['batched']))
+    print(f'{len(queries)} queries of {args.num_hits} hits, {num_matches} anchortexts matched a span, '
+          f'{num_differ} queries differ from the previous implementation')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Measures the per-call cost of executing a RegexTemplate the way the response path does, over the positive_examples and
+negative_examples of every RegexTemplate subclass in chirpy: the shared compiled template (XTemplate.compiled().execute)
+against instantiating the template on every call (XTemplate().execute), as the callers used to, which constructed a
+TestCase, re-filled the slots, re-ran re.compile and built debug log messages on every call. Also checks that both give
+the same slots for every example.
+
+Run:
+    python -m test.benchmarks.regex_templates --repeats 5
+"""
+
+import argparse
+import importlib
+import inspect
+import logging
+import os
+import time
+import unittest
+
+from chirpy.core.logging_utils import LoggerSettings, setup_logger
+from chirpy.core.regex.regex_template import RegexTemplate, compile_template
+from test.benchmarks.stubs import percentile
+
+logger = logging.getLogger('chirpylogger')
+
+
+def find_template_classes():
+    """Imports the modules of chirpy that define RegexTemplates, and returns the RegexTemplate subclasses"""
+    template_classes = {}
+    for dirpath, _, filenames in os.walk('chirpy'):
+        for filename in sorted(filenames):
+            if not filename.endswith('.py'):
+                continue
+            path = os.path.join(dirpath, filename)
+            with open(path) as f:
+                if 'RegexTemplate)' not in f.read():
+                    continue
+            try:
+                module = importlib.import_module(path[:-len('.py')].replace(os.sep, '.'))
+            except Exception:
+                continue
+            for _, cls in inspect.getmembers(module, inspect.isclass):
+                if issubclass(cls, RegexTemplate) and cls is not RegexTemplate and cls.positive_examples is not None:
+                    template_classes[f'{cls.__module__}.{cls.__qualname__}'] = cls
+    return [template_classes[name] for name in sorted(template_classes)]
+
+
+def execute_per_call(template_cls, input_string: str):
+    """What XTemplate().execute(input_string) did before templates were compiled once per process"""
+    template = template_cls.__new__(template_cls)
+    unittest.TestCase.__init__(template)
+    compiled_regexes = compile_template(template_cls).compiled_regexes
+    t0 = time.perf_counter_ns()
+    logger.setLevel(logging.DEBUG)
+    logger.debug(f'RegexTemplate ({template_cls.__name__}) is executing on "{input_string}", checking against {len(compiled_regexes)} compiled regexes...')
+    for idx, r in enumerate(compiled_regexes):
+        matched = r.match(input_string)
+        if matched:
+            logger.debug(f'RegexTemplate ({template_cls.__name__}) finished executing on "{input_string}". '
+                         f'Matched with compiled regex {idx} of {len(compiled_regexes)}, '
+                         f'Took {(time.perf_counter_ns()-t0)/10**9} seconds total')
+            return {k: v for k, v in matched.groupdict().items() if v is not None}
+    logger.debug(f'RegexTemplate ({template_cls.__name__}) finished executing on "{input_string}". '
+                 f'Matched with none of {len(compiled_regexes)} compiled regexes. '
+                 f'Took {(time.perf_counter_ns() - t0)/10**9} seconds total')
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=5, help='number of passes over the corpus')
+    args = parser.parse_args()
+
+    setup_logger(LoggerSettings(logtoscreen_level=logging.ERROR, logtoscreen_usecolor=False, logtofile_level=None,
+                                logtofile_path=None, logtoscreen_allow_multiline=False, integ_test=False,
+                                remove_root_handlers=True))
+    template_classes = find_template_classes()
+    corpus = [(cls, text) for cls in template_classes
+              for text in [text for text, _ in cls.positive_examples] + list(cls.negative_examples)]
+    print(f'{len(template_classes)} templates, {len(corpus)} examples')
+
+    timings = {'per call': [], 'compiled': []}
+    num_mismatches = 0
+    for _ in range(args.repeats):
+        for cls, text in corpus:
+            t0 = time.perf_counter()
+            expected = execute_per_call(cls, text)
+            timings['per call'].append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            actual = cls.compiled().execute(text)
+            timings['compiled'].append(time.perf_counter() - t0)
+
+            if actual != expected:
+                num_mismatches += 1
+                print(f'Mismatch for {cls.__name__} on "{text}": per call {expected}, compiled {actual}')
+
+    print(f'{num_mismatches} mismatches')
+    for name, times in timings.items():
+        print(f"{name:>8}: mean={sum(times) / len(times) * 10**6:.1f}us p50={percentile(times, 50) * 10**6:.1f}us "
+              f"p95={percentile(times, 95) * 10**6:.1f}us per call")
+
+
+if __name__ == '__main__':
+    main()
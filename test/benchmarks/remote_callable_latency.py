@@ -0,0 +1,81 @@
+"""
+Compares per-turn latency of RemoteCallable calls with pooled keep-alive sessions (the current client_fn) against
+opening a new connection per call (the old module-level requests.post behavior).
+
+Each "turn" calls one stub server per annotator (corenlp, dialogact, question, blenderbot, g2p, entitylinker,
+responseranker) concurrently, like the NLP pipeline does.
+
+Run:
+    python -m test.benchmarks.remote_callable_latency --turns 200 --latency 0.005
+"""
+
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from chirpy.core.callables import RemoteCallable, close_sessions
+from chirpy.core.logging_utils import LoggerSettings, setup_logger
+from test.benchmarks.stubs import StubServer, lognormal_latency, percentile
+
+ANNOTATOR_NAMES = ['corenlp', 'dialogact', 'question', 'blenderbot', 'g2p', 'entitylinker', 'responseranker']
+
+
+class PooledCallable(RemoteCallable):
+    name = 'pooled'
+
+
+class UnpooledCallable(RemoteCallable):
+    """RemoteCallable that opens a new connection for every call, like client_fn used to"""
+    name = 'unpooled'
+
+    def client_fn(self, data):
+        return requests.post(self.url, data=data, headers={'content-type': 'application/json'}, timeout=self.timeout)
+
+
+def run_turns(callable_class, urls, num_turns: int):
+    """Runs num_turns turns, each calling every url concurrently. Returns the list of turn latencies in seconds."""
+    callables = [callable_class(url, timeout=10) for url in urls]
+    latencies = []
+    with ThreadPoolExecutor(max_workers=len(callables)) as executor:
+        for turn in range(num_turns):
+            t0 = time.perf_counter()
+            results = list(executor.map(lambda c: c({'text': 'hello there', 'turn': turn}), callables))
+            latencies.append(time.perf_counter() - t0)
+            assert all(r == {'ok': True} for r in results), results
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.005, help='median server latency in seconds')
+    args = parser.parse_args()
+
+    setup_logger(LoggerSettings(logtoscreen_level=logging.ERROR, logtoscreen_usecolor=False, logtofile_level=None,
+                                logtofile_path=None, logtoscreen_allow_multiline=False, integ_test=False,
+                                remove_root_handlers=True))
+
+    servers = [StubServer(lambda request: {'ok': True}, lognormal_latency(args.latency), seed=i).start()
+               for i in range(len(ANNOTATOR_NAMES))]
+    urls = [server.url for server in servers]
+    try:
+        print(f'{args.turns} turns x {len(urls)} annotators, median server latency {args.latency * 1000:.1f}ms')
+        for callable_class in [UnpooledCallable, PooledCallable]:
+            num_connections_before = sum(server.num_connections for server in servers)
+            run_turns(callable_class, urls, num_turns=5)  # warm up
+            latencies = run_turns(callable_class, urls, args.turns)
+            num_connections = sum(server.num_connections for server in servers) - num_connections_before
+            print(f'{callable_class.name:>10}: p50={percentile(latencies, 50) * 1000:.2f}ms '
+                  f'p99={percentile(latencies, 99) * 1000:.2f}ms '
+                  f'connections opened={num_connections}')
+            close_sessions()
+    finally:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Checks that NgramSpanFilter makes the same decisions as should_link for the ngrams of a regression corpus of user
+utterances, and compares the time taken to filter the ngrams of each utterance.
+
+The corpus is the example utterances of the entity linker and the turn latency benchmark, plus seeded random utterances
+drawn from a vocabulary that's heavy on the cases the filter has to get right: DONT_LINK_WORDS, numbers, apostrophes,
+(multi-word) offensive phrases, whitelisted phrases and manually linked spans. Half of the random utterances are
+normalized like user utterances (make_text_like_user_text) and half keep their punctuation.
+
+Run:
+    python -m test.benchmarks.span_filter --utterances 2000
+"""
+
+import argparse
+import logging
+import random
+import time
+
+from chirpy.core.entity_linker.entity_linker import MAX_NGRAM_TO_LINK, NgramSpanFilter, should_link
+from chirpy.core.entity_linker.lists import DONT_LINK_WORDS, MANUAL_SPAN2ENTINFO
+from chirpy.core.logging_utils import LoggerSettings, setup_logger
+from chirpy.core.offensive_classifier.offensive_classifier import OFFENSIVE_CLASSIFIER, WHITELIST_PHRASES
+from chirpy.core.util import get_ngrams, make_text_like_user_text
+from test.benchmarks.stubs import percentile
+
+EXAMPLE_UTTERANCES = [
+    "cast of characters in the film fiddler on the roof",
+    "what do you think about ariana grande have you heard her new album it's probably my favorite one so far",
+    "i recently watched their eyes of skywalker and it was really really good much better than i had anticipated",
+    "what is the mileage of your lincoln", "i prefer driving a lincoln", "iron man and black panther",
+    "i just drank a manhattan", "i am a fan of president ford", "i got a rock from the garden",
+    "i like to have it with other cheeses mixed in such as assaggio", "queen's gambit", "uh basketball",
+    "when we blue a freaking 31 lead in the playoffs last last fall winter when was it i don't remember",
+    "i watched a movie yesterday", "it was the avengers", "what is your favorite movie", "i play the guitar",
+    "what do you think about aliens", "my dog is sick", "i'd watch kill bill again", "hell's kitchen is my show",
+    "he'll be there at 7", "that's a shitty thing to say", "i love the beatles and the rolling stones",
+]
+
+OTHER_WORDS = ['movie', 'skywalker', 'taylor', 'swift', 'pizza', 'garden', 'lincoln', 'guitar', 'beatles', 'dog',
+               "dog's", 'new', 'york', "can't", "we'll", "he'll", 'hell', 'basketball', '1999', '42nd', 'pokemon']
+PUNCTUATION = ['', '', '', '', ',', '.', '!', '?', '-', "'s", '$$', '*']
+
+
+def make_corpus(num_utterances: int, seed: int):
+    rng = random.Random(seed)
+    dont_link_words = sorted(DONT_LINK_WORDS)
+    offensive_phrases = sorted(OFFENSIVE_CLASSIFIER.blacklist)
+    whitelist_phrases = sorted(WHITELIST_PHRASES)
+    manual_spans = sorted(MANUAL_SPAN2ENTINFO)
+    vocabularies = [(dont_link_words, 0.45), (OTHER_WORDS, 0.3), (offensive_phrases, 0.1), (whitelist_phrases, 0.05),
+                    (manual_spans, 0.1)]
+    corpus = list(EXAMPLE_UTTERANCES)
+    for i in range(num_utterances):
+        words = []
+        for _ in range(rng.randint(1, 25)):
+            vocabulary = rng.choices([v for v, _ in vocabularies], weights=[w for _, w in vocabularies])[0]
+            words.append(rng.choice(vocabulary) + rng.choice(PUNCTUATION))
+        utterance = ' '.join(words)
+        corpus.append(make_text_like_user_text(utterance) if i % 2 == 0 else utterance)
+    return corpus
+
+
+def filter_with_should_link(utterance: str, include_common_phrases: bool):
+    ngrams = set()
+    for n in range(1, min(len(utterance.strip().split()), MAX_NGRAM_TO_LINK) + 1):
+        ngrams.update(get_ngrams(utterance, n))
+    return ngrams, {span for span in ngrams if should_link(span, include_common_phrases, {})}
+
+
+def filter_with_ngram_span_filter(utterance: str, include_common_phrases: bool):
+    span_filter = NgramSpanFilter(utterance, include_common_phrases)
+    ngrams = span_filter.ngrams
+    return ngrams, {span for span in ngrams if span_filter.should_link(span, {})}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--utterances', type=int, default=2000, help='number of random utterances in the corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_logger(LoggerSettings(logtoscreen_level=logging.ERROR, logtoscreen_usecolor=False, logtofile_level=None,
+                                logtofile_path=None, logtoscreen_allow_multiline=False, integ_test=False,
+                                remove_root_handlers=True))
+    corpus = make_corpus(args.utterances, args.seed)
+    timings = {'should_link': [], 'NgramSpanFilter': []}
+    num_mismatches = 0
+    for utterance in corpus:
+        for include_common_phrases in [False, True]:
+            t0 = time.perf_counter()
+            expected = filter_with_should_link(utterance, include_common_phrases)
+            timings['should_link'].append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            actual = filter_with_ngram_span_filter(utterance, include_common_phrases)
+            timings['NgramSpanFilter'].append(time.perf_counter() - t0)
+
+            if actual != expected:
+                num_mismatches += 1
+                print(f'Mismatch for "{utterance}" (include_common_phrases={include_common_phrases}):\n'
+                      f'  only should_link: {expected[1] - actual[1]}\n  only NgramSpanFilter: {actual[1] - expected[1]}')
+
+    print(f'{len(corpus)} utterances, {num_mismatches} mismatches')
+    for name, times in timings.items():
+        print(f"{name:>15}: mean={sum(times) / len(times) * 1000:.3f}ms p50={percentile(times, 50) * 1000:.3f}ms "
+              f"p95={percentile(times, 95) * 1000:.3f}ms per utterance")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Measures the cost of serializing and storing the state of long conversations.
+
+A long conversation is replayed through a Handler (with stubbed remote modules and Elasticsearch, see turn_latency).
+We report:
+
+- serialization CPU time per turn: State.serialize, plus deserializing the last state;
+- stored bytes per turn: storing every full serialized state, against a DeltaStateStore (see chirpy.core.state_delta).
+
+Run:
+    python -m test.benchmarks.state_serialization --turns 60
+"""
+
+import argparse
+import logging
+import time
+import uuid
+
+from test.benchmarks.stubs import percentile
+from test.benchmarks.turn_latency import DEFAULT_CONVERSATIONS, create_handler, start_stub_servers
+
+CLOSING_UTTERANCES = {'stop', 'bye', 'goodbye'}
+
+
+def make_utterances(num_turns: int):
+    """A num_turns long conversation, made by chaining the default conversations (without their closings)"""
+    utterances = [utterance for conversation in DEFAULT_CONVERSATIONS for utterance in conversation[1:]
+                  if utterance not in CLOSING_UTTERANCES]
+    return ["let's chat"] + [utterances[i % len(utterances)] for i in range(num_turns - 1)]
+
+
+def replay(handler, utterances):
+    """Replays utterances as one session, and returns the serialized state after each turn"""
+    import jsonpickle
+    session_id = uuid.uuid4().hex
+    user_attributes = {k: jsonpickle.encode(v) for k, v in {'user_id': session_id, 'user_timezone': None}.items()}
+    last_state = None
+    states = []
+    for turn_num, utterance in enumerate(utterances):
+        current_state = {'session_id': session_id, 'creation_date_time': f'{turn_num:04d}', 'user_id': session_id,
+                         'text': utterance, 'pipeline': '', 'commit_id': ''}
+        current_state = {k: jsonpickle.encode(v) for k, v in current_state.items()}
+        turn_result = handler.execute(current_state, user_attributes, last_state)
+        states.append(turn_result.current_state)
+        if turn_result.should_end_session:
+            break
+        last_state = turn_result.current_state
+        user_attributes = turn_result.user_attributes
+    return states
+
+
+def run(handler, utterances):
+    """
+    Replays utterances. Returns the serialized states, and the CPU time of each turn's State.serialize call plus the
+    State.deserialize call for its last state.
+    """
+    from chirpy.core.state import State
+    serialize, deserialize = State.serialize, State.deserialize
+    deserialize_times, serialize_times = [], []
+
+    def timed_deserialize(mapping):
+        if 'history' not in mapping:  # the current state, which only has the new turn's attributes
+            return deserialize(mapping)
+        t0 = time.thread_time()
+        state = deserialize(mapping)
+        deserialize_times.append(time.thread_time() - t0)
+        return state
+
+    def timed_serialize(state):
+        t0 = time.thread_time()
+        encoded_dict = serialize(state)
+        serialize_times.append(time.thread_time() - t0)
+        return encoded_dict
+
+    State.serialize, State.deserialize = timed_serialize, timed_deserialize
+    try:
+        states = replay(handler, utterances)
+    finally:
+        State.serialize, State.deserialize = serialize, deserialize
+    # The first turn has no last state
+    times = [deserialize_time + serialize_time for deserialize_time, serialize_time in
+             zip([0.0] + deserialize_times, serialize_times)]
+    return states, times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=60, help='length of the conversation')
+    parser.add_argument('--keyframe-interval', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    servers = start_stub_servers(0, args.seed)
+    try:
+        from chirpy.core.logging_utils import LoggerSettings, setup_logger
+        from chirpy.core.state_delta import DeltaStateStore, record_size
+        setup_logger(LoggerSettings(logtoscreen_level=logging.CRITICAL, logtoscreen_usecolor=False, logtofile_level=None,
+                                    logtofile_path=None, logtoscreen_allow_multiline=False, integ_test=False,
+                                    remove_root_handlers=True))
+        handler = create_handler()
+        utterances = make_utterances(args.turns)
+        replay(handler, utterances[:5])  # warm up
+
+        states, times = run(handler, utterances)
+        print(f"{len(states)} turns, deserialize last state + serialize CPU mean={sum(times) / len(times) * 1000:.2f}ms "
+              f"p50={percentile(times, 50) * 1000:.2f}ms p95={percentile(times, 95) * 1000:.2f}ms")
+    finally:
+        for server in servers:
+            server.stop()
+
+    store = DeltaStateStore(keyframe_interval=args.keyframe_interval)
+    for turn_num, serialized in enumerate(states):
+        store.put(turn_num, 'session', serialized)
+    assert all(store[turn_num] == serialized for turn_num, serialized in enumerate(states)), 'stored state differs'
+    full_size = sum(record_size(serialized) for serialized in states)
+    print(f'stored per turn: full={full_size / len(states):.0f} delta={store.stored_size() / len(states):.0f} '
+          f'({store.stored_size() / full_size:.1%} of full, keyframe every {args.keyframe_interval} turns, '
+          f'final state size {record_size(states[-1])})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Deterministic local stand-ins for the remote modules, used by the benchmarks in this directory.
+
+StubServer serves a canned JSON response over HTTP/1.1 (so connections can be kept alive), after sleeping for a
+latency drawn from a seeded distribution. This lets us measure the Python orchestration without running the docker
+model containers.
+"""
+
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+
+def fixed_latency(seconds: float) -> Callable[[random.Random], float]:
+    return lambda rng: seconds
+
+
+def lognormal_latency(median: float, sigma: float = 0.5) -> Callable[[random.Random], float]:
+    """Latency distribution with the given median (in seconds) and a long right tail, like most model servers"""
+    mu = 0.0 if median <= 0 else math.log(median)
+    return lambda rng: 0.0 if median <= 0 else rng.lognormvariate(mu, sigma)
+
+
+class StubServer:
+    """
+    An HTTP server on localhost that answers every POST (or GET) with response_fn(request_json), after sleeping for
+    latency_fn(rng) seconds. Start it with start() (or use it as a context manager); the url is in self.url.
+    """
+
+    def __init__(self, response_fn: Callable[[dict], dict] = lambda request: {},
+                 latency_fn: Callable[[random.Random], float] = fixed_latency(0), seed: int = 0):
+        self.response_fn = response_fn
+        self.latency_fn = latency_fn
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.num_requests = 0
+        self.num_connections = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # needed for keep-alive
+            disable_nagle_algorithm = True  # otherwise keep-alive responses hit delayed-ACK stalls
+
+            def setup(self):
+                super().setup()
+                with stub.rng_lock:
+                    stub.num_connections += 1
+
+            def do_POST(self):
+                length = int(self.headers.get('content-length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+                with stub.rng_lock:
+                    stub.num_requests += 1
+                    latency = stub.latency_fn(stub.rng)
+                time.sleep(latency)
+                body = json.dumps(stub.response_fn(request)).encode()
+                self.send_response(200)
+                self.send_header('content-type', 'application/json')
+                self.send_header('content-length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST  # e.g. the Elasticsearch client's info requests
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def percentile(values, p: float) -> float:
+    """Returns the p-th percentile (0 <= p <= 100) of values, using the nearest-rank method"""
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[rank - 1]
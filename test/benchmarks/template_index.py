@@ -0,0 +1,73 @@
+"""
+Compares classifying each utterance against every RegexTemplate subclass in chirpy with a TemplateIndex (one scan of
+the utterance for the templates' required literals, then only the regexes whose literals occur) against executing
+each template in turn. The utterances are the positive_examples and negative_examples of all the templates, so most
+utterances match a few templates. Also checks that both give the same slots for every template and utterance.
+
+Run:
+    python -m test.benchmarks.template_index --repeats 5
+"""
+
+import argparse
+import logging
+import time
+
+from chirpy.core.logging_utils import LoggerSettings, setup_logger
+from chirpy.core.regex.template_index import TemplateIndex
+from test.benchmarks.regex_templates import find_template_classes
+from test.benchmarks.stubs import percentile
+
+
+def match_all_sequentially(template_classes, utterance: str):
+    return {template_cls: template_cls.compiled().execute(utterance) for template_cls in template_classes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=5, help='number of passes over the utterances')
+    args = parser.parse_args()
+
+    setup_logger(LoggerSettings(logtoscreen_level=logging.ERROR, logtoscreen_usecolor=False, logtofile_level=None,
+                                logtofile_path=None, logtoscreen_allow_multiline=False, integ_test=False,
+                                remove_root_handlers=True))
+    template_classes = find_template_classes()
+    utterances = sorted({text for cls in template_classes
+                         for text in [text for text, _ in cls.positive_examples] + list(cls.negative_examples)})
+
+    t0 = time.perf_counter()
+    index = TemplateIndex(template_classes)
+    num_regexes = sum(len(regexes) for regexes in index.template_regexes.values())
+    num_unindexed = sum(literals is None for regexes in index.template_regexes.values() for _, literals in regexes)
+    print(f'Indexed {len(template_classes)} templates ({num_regexes} regexes, {num_unindexed} without required '
+          f'literals) in {(time.perf_counter() - t0) * 1000:.1f}ms')
+
+    timings = {'sequential': [], 'TemplateIndex': []}
+    num_mismatches, num_tried = 0, 0
+    for _ in range(args.repeats):
+        for utterance in utterances:
+            t0 = time.perf_counter()
+            expected = match_all_sequentially(template_classes, utterance)
+            timings['sequential'].append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            actual = index.match_all(utterance)
+            timings['TemplateIndex'].append(time.perf_counter() - t0)
+
+            found = index.scan(utterance)
+            num_tried += sum(literals is None or not literals.isdisjoint(found)
+                             for regexes in index.template_regexes.values() for _, literals in regexes)
+            for template_cls in template_classes:
+                if actual[template_cls] != expected[template_cls]:
+                    num_mismatches += 1
+                    print(f'Mismatch for {template_cls.__name__} on "{utterance}": sequential '
+                          f'{expected[template_cls]}, TemplateIndex {actual[template_cls]}')
+
+    print(f'{len(utterances)} utterances, {num_mismatches} mismatches, '
+          f'{num_tried / (args.repeats * len(utterances)):.1f} of {num_regexes} regexes tried per utterance')
+    for name, times in timings.items():
+        print(f"{name:>13}: mean={sum(times) / len(times) * 10**6:.1f}us p50={percentile(times, 50) * 10**6:.1f}us "
+              f"p95={percentile(times, 95) * 10**6:.1f}us per utterance")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Measures turn latency and throughput of the Python orchestration (Handler.execute: NLP pipeline, RGs, ranking,
+serialization), with every remote module and Elasticsearch replaced by deterministic local StubServers. No docker
+containers or ES cluster are needed.
+
+Conversations are replayed turn by turn through a shared Handler, like LocalAgent does. With --concurrency 1 4 16,
+the conversations are replayed by 1, 4 and 16 concurrent sessions in turn. For each level we report turn latency
+percentiles, turns/sec, and the p50 / p95 of each phase, taken from the per-turn traces (see chirpy.core.latency).
+
+Run:
+    python -m test.benchmarks.turn_latency --concurrency 1 4 16 --latency 0.02
+    python -m test.benchmarks.turn_latency --conversations conversations.jsonl
+
+A conversations file has one conversation per line: a JSON list of user utterances, or a JSON object with an
+"utterances" list.
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from test.benchmarks.stubs import StubServer, lognormal_latency, percentile
+
+# Conversations used when --conversations isn't given (based on the integration test scripts)
+DEFAULT_CONVERSATIONS = [
+    ["let's chat", 'my name is chris', 'i watched a movie yesterday', 'it was the avengers', 'yes i loved it',
+     'what is your favorite movie', 'no', 'stop'],
+    ["let's chat", 'my name is sam', 'i like to cook', 'pasta', 'i make it with tomatoes', 'tell me about food',
+     'that is cool', 'bye'],
+    ["let's chat", 'jo', 'i am feeling kind of sad today', 'my dog is sick', "i don't know", 'yeah',
+     "let's talk about something else", 'stop'],
+    ["let's chat", 'my name is alex', 'i play the guitar', 'the beatles', 'what do you think about aliens',
+     'do you believe in them', 'okay', 'goodbye'],
+]
+
+DIALOG_ACTS_PROBDIST = {'statement': 0.9, 'pos_answer': 0.02, 'neg_answer': 0.02, 'opinion': 0.02, 'closing': 0.0}
+
+
+def question_response(request: dict) -> dict:
+    return {'response': [0.1]}
+
+
+def dialogact_response(request: dict) -> dict:
+    from chirpy.annotators.dialogact import DIALOG_ACTS
+    probdist = {dialog_act: DIALOG_ACTS_PROBDIST.get(dialog_act, 0.0) for dialog_act in DIALOG_ACTS}
+    return {'response': [probdist for _ in request.get('instances', [None])]}
+
+
+def blenderbot_response(request: dict) -> dict:
+    return {'responses': ["that sounds really interesting, tell me more.", "i'd love to hear more about that."],
+            'response_probabilities': [0.5, 0.4]}
+
+
+def responseranker_response(request: dict) -> dict:
+    num_responses = len(request.get('responses', []))
+    return {'score': [0.5] * num_responses, 'updown': [0.5] * num_responses}
+
+
+def corenlp_response(request: dict) -> dict:
+    return {'sentences': []}
+
+
+def elasticsearch_response(request: dict) -> dict:
+    return {'took': 1, 'timed_out': False, 'hits': {'total': {'value': 0, 'relation': 'eq'}, 'hits': []}}
+
+
+# Canned response for each remote module. Modules not listed here get {}, so they use their default response.
+RESPONSE_FNS: Dict[str, Callable[[dict], dict]] = {
+    'question': question_response,
+    'dialogact': dialogact_response,
+    'corenlp': corenlp_response,
+    'blenderbot': blenderbot_response,
+    'responseranker': responseranker_response,
+}
+REMOTE_MODULE_NAMES = ['question', 'dialogact', 'corenlp', 'stanfordnlp', 'entitylinker', 'g2p', 'blenderbot',
+                       'responseranker', 'infiller', 'colbertinfiller', 'convpara', 'gpt2ed', 'coref', 'user_emotion',
+                       'sentseg', 'dialogptranker', 'gpt2ranker', 'redquestiondetector']
+
+# Phases reported for each concurrency level (names of spans, see chirpy.core.latency)
+PHASES = ['Handler.execute_async', 'NLPPipeline', 'ResponseGenerators.get_entity', 'ResponseGenerators.get_response',
+          'ResponseGenerators.get_prompt', 'serialize']
+
+
+def start_stub_servers(latency: float, seed: int) -> List[StubServer]:
+    """
+    Start one StubServer per remote module, and one for Elasticsearch, and point chirpy at them. Needs to be called
+    before chirpy creates its Elasticsearch clients and RemoteCallables.
+    """
+    servers = []
+    for i, name in enumerate(REMOTE_MODULE_NAMES):
+        server = StubServer(RESPONSE_FNS.get(name, lambda request: {}), lognormal_latency(latency), seed=seed + i).start()
+        os.environ[f'{name}_URL'] = server.url
+        servers.append(server)
+    es_server = StubServer(elasticsearch_response, lognormal_latency(latency), seed=seed + len(servers)).start()
+    host, port = es_server.server.server_address
+    os.environ.update({'ES_HOST': host, 'ES_PORT': str(port), 'ES_SCHEME': 'http',
+                       'ES_USER': os.environ.get('ES_USER', 'benchmark'),
+                       'ES_PASSWORD': os.environ.get('ES_PASSWORD', 'benchmark')})
+    servers.append(es_server)
+    return servers
+
+
+def create_handler():
+    """A Handler with LocalAgent's annotators and RGs"""
+    from agents.local_agent import LocalAgent
+    return LocalAgent().create_handler()
+
+
+def replay_conversation(handler, utterances: List[str]) -> List[float]:
+    """Replay one conversation as a new session, like LocalAgent.process_utterance. Returns the turn latencies."""
+    import jsonpickle
+    session_id = uuid.uuid4().hex
+    user_attributes = {k: jsonpickle.encode(v) for k, v in {'user_id': session_id, 'user_timezone': None}.items()}
+    last_state = None
+    latencies = []
+    for turn_num, utterance in enumerate(utterances):
+        current_state = {'session_id': session_id, 'creation_date_time': f'{turn_num:04d}', 'user_id': session_id,
+                         'text': utterance, 'pipeline': '', 'commit_id': ''}
+        current_state = {k: jsonpickle.encode(v) for k, v in current_state.items()}
+        t0 = time.perf_counter()
+        turn_result = handler.execute(current_state, user_attributes, last_state)
+        latencies.append(time.perf_counter() - t0)
+        if turn_result.should_end_session:
+            break
+        last_state = turn_result.current_state
+        user_attributes = turn_result.user_attributes
+    return latencies
+
+
+def run_level(handler, conversations: List[List[str]], concurrency: int) -> Dict:
+    from chirpy.core.latency import latency_stats
+    latency_stats.clear()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        turn_latencies = [latency for latencies in executor.map(lambda c: replay_conversation(handler, c), conversations)
+                          for latency in latencies]
+    wall_time = time.perf_counter() - t0
+    return {'turns': len(turn_latencies), 'turns_per_sec': len(turn_latencies) / wall_time,
+            'p50': percentile(turn_latencies, 50) * 1000, 'p95': percentile(turn_latencies, 95) * 1000,
+            'p99': percentile(turn_latencies, 99) * 1000, 'phases': latency_stats.summary()}
+
+
+def load_conversations(path: str) -> List[List[str]]:
+    conversations = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                conversation = json.loads(line)
+                conversations.append(conversation['utterances'] if isinstance(conversation, dict) else conversation)
+    return conversations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conversations', help='jsonl file of conversations to replay (default: built-in scripts)')
+    parser.add_argument('--repeat', type=int, default=4, help='how many times to replay each conversation per level')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--latency', type=float, default=0.02, help='median stub server latency in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    servers = start_stub_servers(args.latency, args.seed)
+    try:
+        from chirpy.core.logging_utils import LoggerSettings, setup_logger
+        setup_logger(LoggerSettings(logtoscreen_level=logging.ERROR, logtoscreen_usecolor=False, logtofile_level=None,
+                                    logtofile_path=None, logtoscreen_allow_multiline=False, integ_test=False,
+                                    remove_root_handlers=True))
+        handler = create_handler()
+        conversations = load_conversations(args.conversations) if args.conversations else DEFAULT_CONVERSATIONS
+        conversations = conversations * args.repeat
+        replay_conversation(handler, conversations[0])  # warm up
+
+        print(f'{len(conversations)} conversations, median stub latency {args.latency * 1000:.1f}ms')
+        for concurrency in args.concurrency:
+            result = run_level(handler, conversations, concurrency)
+            print(f"concurrency={concurrency:<3} turns={result['turns']} turns/sec={result['turns_per_sec']:.1f} "
+                  f"turn p50={result['p50']:.1f}ms p95={result['p95']:.1f}ms p99={result['p99']:.1f}ms")
+            for phase in PHASES:
+                stats = result['phases'].get(phase)
+                if stats is not None:
+                    print(f"    {phase:<32} p50={stats['p50']:.1f}ms p95={stats['p95']:.1f}ms")
+    finally:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
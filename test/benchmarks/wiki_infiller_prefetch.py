@@ -0,0 +1,136 @@
+"""
+Measures how much of the WIKI infiller's latency the next turn saves when WikiResponseGenerator.prefetch runs after
+the turn that introduced an entity. Each session has two turns: WIKI asks about an entity, then the user answers with
+one of a few replies (mostly some form of yes) and get_infilling_statement calls the infiller. The infiller is a stub
+that sleeps for a seeded, lognormal latency, and the articles are synthetic (some without an intro section, so that
+their sections are chosen by TF-IDF against the user's reply), so no infiller container or Elasticsearch is needed.
+
+Reports the prefetch cache's hit rate, and the latency of _execute_infiller on the second turn, with and without
+prefetching, and how many infiller calls were on the second turn's path. Prefetching runs synchronously here; in the
+bot it runs in the background after the turn is returned.
+
+Run:
+    python -m test.benchmarks.wiki_infiller_prefetch --sessions 300
+"""
+
+import argparse
+import functools
+import logging
+import os
+import random
+import time
+
+from chirpy.core.entity_linker.entity_linker_classes import WikiEntity
+from chirpy.core.logging_utils import LoggerSettings, setup_logger
+from chirpy.response_generators.wiki2 import wiki_infiller, wiki_utils
+from chirpy.response_generators.wiki2.state import State
+from chirpy.response_generators.wiki2.wiki_response_generator import WikiResponseGenerator
+from test.benchmarks.stubs import lognormal_latency, percentile
+
+USER_REPLIES = ['yes', 'yes', 'yes', 'yeah', 'sure', 'yes please', 'yes i loved the characters and the story']
+WORDS = ['story', 'novel', 'author', 'published', 'character', 'chapter', 'readers', 'critics', 'film', 'adaptation',
+         'london', 'family', 'marriage', 'society', 'war', 'letters', 'edition', 'translated', 'sequel', 'award']
+SECTION_TITLES = ['Plot', 'Characters', 'Themes', 'Reception', 'Adaptations', 'Publication history', 'Legacy']
+
+
+class StubCurrentState:
+    """The attributes of State that WikiResponseGenerator uses in get_infilling_statement and prefetch"""
+
+    def __init__(self, session_id, text, history, response, rg_state):
+        self.session_id = session_id
+        self.text = text
+        self.history = history
+        self.response = response
+        self.active_rg = 'WIKI'
+        self.response_generator_states = {'WIKI': rg_state}
+        self.cache = {}
+
+    def set_cache(self, key, value):
+        self.cache[key] = value
+
+    def get_cache(self, key):
+        return self.cache.get(key)
+
+
+class StubStateManager:
+    def __init__(self, current_state, last_state_active_rg=None):
+        self.current_state = current_state
+        self.last_state_active_rg = last_state_active_rg
+
+
+def make_article(rng: random.Random, with_intro: bool):
+    def section_text():
+        words = rng.sample(WORDS, 8)  # so that the sections' TF-IDF scores differ
+        return '. '.join(' '.join(rng.choices(words, k=rng.randint(6, 12))).capitalize() for _ in range(14)) + '.'
+    sections = [(title, section_text()) for title in SECTION_TITLES]
+    return ([('', section_text())] if with_intro else []) + sections
+
+
+def make_stub_infiller(latency_fn, rng: random.Random, counter):
+    @functools.lru_cache(maxsize=1024)
+    def stub_infiller(tuples, sentences, max_length, contexts, prompts):
+        counter['calls'] += 1
+        time.sleep(latency_fn(rng))
+        completions = [template.replace('[', '').replace(']', '') for template, _ in tuples]
+        return {'completions': completions, 'prompts': [template for template, _ in tuples],
+                'contexts': list(sentences[:len(tuples)]), 'error': False}
+    return stub_infiller
+
+
+def run_session(session_id, entity, reply, prefetch: bool, counter):
+    """Returns the latency of the second turn's _execute_infiller, and whether it called the infiller"""
+    rg_state = State()
+    rg_state.cur_entity = entity
+    user_utterance, bot_response = f'i like {entity.talkable_name}', f'Have you read {entity.talkable_name}?'
+    first_turn = StubCurrentState(session_id, user_utterance, ['', 'hi'], bot_response, rg_state)
+    if prefetch:
+        WikiResponseGenerator(StubStateManager(first_turn)).prefetch()
+
+    second_turn = StubCurrentState(session_id, reply, ['', 'hi', user_utterance, bot_response], None, rg_state)
+    rg = WikiResponseGenerator(StubStateManager(second_turn, last_state_active_rg='WIKI'))
+    sentences = rg.get_wiki_sentences(entity)
+    input_data = rg.get_infiller_input_data(rg_state, entity, sentences)
+    num_calls = counter['calls']
+    t0 = time.perf_counter()
+    rg._execute_infiller(input_data)
+    return time.perf_counter() - t0, counter['calls'] > num_calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=300)
+    parser.add_argument('--entities', type=int, default=1000, help='number of distinct entities')
+    parser.add_argument('--latency', type=float, default=0.02, help='median latency of the stub infiller, in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_logger(LoggerSettings(logtoscreen_level=logging.CRITICAL, logtoscreen_usecolor=False, logtofile_level=None,
+                                logtofile_path=None, logtoscreen_allow_multiline=False, integ_test=False,
+                                remove_root_handlers=True))
+    os.environ['usecolbert'] = ''
+    rng = random.Random(args.seed)
+    entities = [WikiEntity(f'Novel {i}', i, 1000, 1.0, ['literary work'], {}, [], '') for i in range(args.entities)]
+    articles = {entity.name: make_article(rng, with_intro=rng.random() < 0.7) for entity in entities}
+    wiki_utils.get_text_for_entity = lambda entity_name: articles[entity_name]
+    weights = [1 / (rank + 1) for rank in range(len(entities))]
+    sessions = [(f'session{i}', rng.choices(entities, weights=weights)[0], rng.choice(USER_REPLIES))
+                for i in range(args.sessions)]
+
+    for prefetch in [False, True]:
+        counter = {'calls': 0}
+        wiki_infiller.call_infiller = make_stub_infiller(lognormal_latency(args.latency), random.Random(args.seed), counter)
+        cache = wiki_infiller.infill_prefetch_cache
+        cache.clear()
+        hits, misses = cache.hits, cache.misses
+        results = [run_session(session_id, entity, reply, prefetch, counter) for session_id, entity, reply in sessions]
+        latencies = [latency for latency, _ in results]
+        hit_rate = (cache.hits - hits) / max(cache.hits - hits + cache.misses - misses, 1)
+        name = 'prefetch' if prefetch else 'no prefetch'
+        print(f'{name:>11}: mean={sum(latencies) / len(latencies) * 1000:.1f}ms '
+              f'p50={percentile(latencies, 50) * 1000:.1f}ms p95={percentile(latencies, 95) * 1000:.1f}ms '
+              f'per second turn, {sum(called for _, called in results)} infiller calls on the second turns '
+              f'({counter["calls"]} in total), prefetch hit rate {hit_rate:.2f}')
+
+
+if __name__ == '__main__':
+    main()
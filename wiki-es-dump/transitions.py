@@ -0,0 +1,55 @@
+"""
+Precomputes the transitions of the TRANSITION RG for every article (see chirpy/response_generators/transition), from
+the same sections and articles files that upload.py uploads to ES. For each article, this does what get_transitions
+does on the response path: it takes the links and text of the article's overview and cuisine sections, looks up the
+linked articles, and chooses the most viewed linked entity of each type and the sentence that mentions it.
+
+The output is a directory of (title, transitions JSON) lines, from which the TransitionStore is built. chirpy must be
+importable (e.g. on the PYTHONPATH) by the driver and the executors.
+"""
+
+import json
+import argparse
+
+from ast import literal_eval
+from operator import add
+from pyspark import SparkContext, SparkConf
+
+from chirpy.core.entity_linker.wiki_data_fetching import make_wikientities
+from chirpy.response_generators.transition.transition_helpers import get_transition_links_and_text, \
+    group_by_transition_type, choose_transitions
+
+def get_transitions(tup):
+    title, ((links, text), linked_articles) = tup
+    ents = make_wikientities([{'_source': article} for article in linked_articles or []])
+    transitions = choose_transitions(group_by_transition_type(ents), text) if ents else {}
+    return title, json.dumps({et: [ent.name, sent] for et, (ent, sent) in transitions.items()})
+
+if __name__ == "__main__":
+    conf = SparkConf().setAppName('wiki-transitions').set('spark.driver.maxResultSize', 0)
+    sc = SparkContext(conf=conf)
+
+    parser = argparse.ArgumentParser(description='Precompute the TRANSITION RG\'s transitions for every article')
+    parser.add_argument('sections_path', type=str, help='Fully Qualified path of the processed *-sections.json.bz2 file')
+    parser.add_argument('articles_path', type=str, help='Fully Qualified path of the *-integrated.json.bz2 file')
+    parser.add_argument('output_path', type=str, help='Fully Qualified path of the *-transitions.json output directory')
+    args = parser.parse_args()
+
+    # links_and_text : [(title, (wiki_links, text))]
+    links_and_text = sc.textFile(args.sections_path)\
+        .map(lambda s: literal_eval(s))\
+        .map(lambda section: (section['doc_title'], [section]))\
+        .reduceByKey(add, 1024)\
+        .map(lambda tup: (tup[0], get_transition_links_and_text(sorted(tup[1], key=lambda section: section['order']))))
+
+    # linked_articles : [(title, [linked article, ...])]
+    articles = sc.textFile(args.articles_path).map(lambda s: literal_eval(s))
+    linked_articles = links_and_text\
+        .flatMap(lambda tup: [(link, tup[0]) for link in tup[1][0]])\
+        .join(articles, 1024)\
+        .map(lambda tup: (tup[1][0], [tup[1][1]]))\
+        .reduceByKey(add, 1024)
+
+    links_and_text.leftOuterJoin(linked_articles, 1024)\
+        .map(get_transitions)\
+        .saveAsTextFile(args.output_path, 'org.apache.hadoop.io.compress.BZip2Codec')